@@ -0,0 +1,2 @@
+class QByteArray(bytes):
+    pass
@@ -0,0 +1,162 @@
+import os
+import shutil
+import struct
+import zlib
+
+
+def qRed(rgb):
+    return (rgb >> 16) & 0xff
+
+
+def qGreen(rgb):
+    return (rgb >> 8) & 0xff
+
+
+def qBlue(rgb):
+    return rgb & 0xff
+
+
+class QColor(object):
+    def __init__(self, r=0, g=0, b=0):
+        self.setRgb(r, g, b)
+
+    def setRgb(self, r, g, b):
+        self._rgb = 0xff000000 | (r << 16) | (g << 8) | b
+
+    def rgb(self):
+        return self._rgb
+
+
+def _read_png(path):
+    '''Width, height, alpha and BGRA pixels of an 8-bit RGB(A) png without row filters.'''
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    pos = 8
+    idat = b''
+    while pos < len(data):
+        length, tag = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        if tag == b'IHDR':
+            width, height, depth, color_type = struct.unpack('>IIBB', body[:10])
+        elif tag == b'IDAT':
+            idat += body
+        pos += 12 + length
+    channels = 4 if color_type == 6 else 3
+    raw = zlib.decompress(idat)
+    stride = width * channels + 1
+    pixels = bytearray(width * height * 4)
+    for y in range(height):
+        row = raw[y * stride + 1:(y + 1) * stride]
+        for x in range(width):
+            px = row[x * channels:(x + 1) * channels]
+            alpha = px[3] if channels == 4 else 255
+            pixels[(y * width + x) * 4:(y * width + x) * 4 + 4] = bytearray((px[2], px[1], px[0], alpha))
+    return width, height, channels == 4, pixels
+
+
+def _png_bytes(image):
+    channels = 4 if image.hasAlphaChannel() else 3
+    pixels = image.bits()
+    rows = []
+    for y in range(image.height()):
+        row = bytearray(b'\x00')
+        for x in range(image.width()):
+            b, g, r, a = pixels[(y * image.width() + x) * 4:(y * image.width() + x) * 4 + 4]
+            row.extend((r, g, b, a)[:channels])
+        rows.append(bytes(row))
+    def chunk(tag, body):
+        return (struct.pack('>I', len(body)) + tag + body
+                + struct.pack('>I', zlib.crc32(tag + body) & 0xffffffff))
+    color_type = 6 if channels == 4 else 2
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', image.width(), image.height(), 8, color_type, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''.join(rows)))
+            + chunk(b'IEND', b''))
+
+
+class QImage(object):
+    '''Loads 8-bit pngs written by the benchmark scenes, other files become
+    a 1x1 image.  Pixels are 32-bit like Format_ARGB32.'''
+    Format_RGB32 = 4
+    Format_ARGB32 = 5
+
+    def __init__(self, *args):
+        self.path = None
+        self._width = self._height = 1
+        self._alpha = False
+        self._format = self.Format_RGB32
+        self._bits = bytearray(4)
+        self._decoded = False
+        if len(args) == 1:
+            self.path = args[0]
+            decoded = None
+            if self.path and os.path.exists(self.path):
+                decoded = _read_png(self.path)
+            if decoded:
+                self._width, self._height, self._alpha, self._bits = decoded
+                self._decoded = True
+                if self._alpha:
+                    self._format = self.Format_ARGB32
+        elif len(args) == 5:
+            data, width, height, bytes_per_line, format_ = args
+            self._width, self._height = width, height
+            self._format = format_
+            self._alpha = format_ == self.Format_ARGB32
+            self._bits = bytearray(bytes(data)[:bytes_per_line * height])
+            self._decoded = True
+
+    def hasAlphaChannel(self):
+        return self._alpha
+
+    def format(self):
+        return self._format
+
+    def convertToFormat(self, format_):
+        image = self.copy()
+        image._format = format_
+        image._alpha = format_ == self.Format_ARGB32
+        if format_ == self.Format_RGB32:
+            image._bits[3::4] = b'\xff' * (len(image._bits) // 4)
+        return image
+
+    def copy(self):
+        image = QImage()
+        image.path = self.path
+        image._width, image._height = self._width, self._height
+        image._alpha, image._format = self._alpha, self._format
+        image._bits = bytearray(self._bits)
+        image._decoded = self._decoded
+        return image
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def bytesPerLine(self):
+        return self._width * 4
+
+    def bits(self):
+        return self._bits
+
+    def constBits(self):
+        return bytes(self._bits)
+
+
+class QImageWriter(object):
+    def __init__(self, path, format_=None):
+        self.path = path
+
+    def write(self, image):
+        if image.path and os.path.exists(image.path) and image.path != self.path:
+            shutil.copy(image.path, self.path)
+        elif image._decoded:
+            with open(self.path, 'wb') as outfile:
+                outfile.write(_png_bytes(image))
+        else:
+            with open(self.path, 'wb') as outfile:
+                outfile.write(bytes(image.bits()))
+        return True
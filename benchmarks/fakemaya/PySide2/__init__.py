@@ -0,0 +1 @@
+"""Minimal stand-in for the PySide2 classes glTFExport touches."""
@@ -0,0 +1,367 @@
+"""Fake maya.OpenMaya (API 1.0) backed by maya._scene."""
+import math
+
+from maya import _scene
+
+
+class _Array(object):
+    '''Common behaviour of the M*Array classes.'''
+    def __init__(self, *args):
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def length(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def append(self, item):
+        self._items.append(item)
+
+    def clear(self):
+        self._items = []
+
+    def set(self, value, index):
+        self._items[index] = value
+
+
+class MIntArray(_Array):
+    pass
+
+
+class MDoubleArray(_Array):
+    pass
+
+
+class MFloatArray(_Array):
+    pass
+
+
+class MPointArray(_Array):
+    pass
+
+
+class MColorArray(_Array):
+    pass
+
+
+class MFloatVectorArray(_Array):
+    pass
+
+
+class MPoint(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x, self.y, self.z, self.w = x, y, z, w
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z, self.w)[index]
+
+
+class MVector(MPoint):
+    pass
+
+
+class MFloatVector(MPoint):
+    pass
+
+
+class MColor(object):
+    def __init__(self, r=0.0, g=0.0, b=0.0, a=1.0):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+
+class MQuaternion(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self._values = [x, y, z, w]
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def normalizeIt(self):
+        length = math.sqrt(sum(v * v for v in self._values))
+        self._values = [v / length for v in self._values]
+        return self
+
+
+class MMatrix(object):
+    def __init__(self):
+        self._values = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                        0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+class MTransformationMatrix(object):
+    def __init__(self, matrix=None):
+        self._values = list(matrix._values) if matrix is not None else MMatrix()._values
+
+    def rotation(self):
+        values = self._values
+        rows = []
+        for row in range(3):
+            axis = values[row * 4:row * 4 + 3]
+            length = math.sqrt(sum(v * v for v in axis)) or 1.0
+            rows.append([v / length for v in axis])
+        # rows of a row vector matrix are the columns of the rotation
+        m = [[rows[column][row] for column in range(3)] for row in range(3)]
+        trace = m[0][0] + m[1][1] + m[2][2]
+        if trace > 0:
+            s = 0.5 / math.sqrt(trace + 1.0)
+            quat = ((m[2][1] - m[1][2]) * s, (m[0][2] - m[2][0]) * s,
+                    (m[1][0] - m[0][1]) * s, 0.25 / s)
+        elif m[0][0] > m[1][1] and m[0][0] > m[2][2]:
+            s = 2.0 * math.sqrt(1.0 + m[0][0] - m[1][1] - m[2][2])
+            quat = (0.25 * s, (m[0][1] + m[1][0]) / s, (m[0][2] + m[2][0]) / s,
+                    (m[2][1] - m[1][2]) / s)
+        elif m[1][1] > m[2][2]:
+            s = 2.0 * math.sqrt(1.0 + m[1][1] - m[0][0] - m[2][2])
+            quat = ((m[0][1] + m[1][0]) / s, 0.25 * s, (m[1][2] + m[2][1]) / s,
+                    (m[0][2] - m[2][0]) / s)
+        else:
+            s = 2.0 * math.sqrt(1.0 + m[2][2] - m[0][0] - m[1][1])
+            quat = ((m[0][2] + m[2][0]) / s, (m[1][2] + m[2][1]) / s, 0.25 * s,
+                    (m[1][0] - m[0][1]) / s)
+        return MQuaternion(*quat)
+
+
+class MFn(object):
+    kTransform = 'kTransform'
+    kJoint = 'kJoint'
+    kMesh = 'kMesh'
+
+
+class MObject(object):
+    def __init__(self):
+        self._node = None
+
+    def hasFn(self, fn):
+        if fn == MFn.kTransform:
+            return self._node.type in ('transform', 'joint')
+        if fn == MFn.kJoint:
+            return self._node.type == 'joint'
+        if fn == MFn.kMesh:
+            return self._node.type == 'mesh'
+        return False
+
+
+class MDagPath(object):
+    def __init__(self):
+        self._node = None
+
+    def fullPathName(self):
+        return self._node.path
+
+    def node(self):
+        obj = MObject()
+        obj._node = self._node
+        return obj
+
+
+class MSelectionList(object):
+    def __init__(self):
+        self._nodes = []
+        self._attrs = []
+
+    def add(self, name):
+        name, _, attr = name.partition('.')
+        self._nodes.append(_scene.get_node(name))
+        self._attrs.append(attr)
+
+    def length(self):
+        return len(self._nodes)
+
+    def getDependNode(self, index, obj):
+        obj._node = self._nodes[index]
+
+    def getDagPath(self, index, path):
+        path._node = self._nodes[index]
+
+    def getPlug(self, index, plug):
+        plug._node = self._nodes[index]
+        plug._attr = self._attrs[index]
+
+
+class MPlug(object):
+    '''Output mesh plugs, their data is the mesh of the node.'''
+    def __init__(self):
+        self._node = None
+        self._attr = None
+
+    def isArray(self):
+        return self._attr == 'worldMesh'
+
+    def elementByLogicalIndex(self, index):
+        plug = MPlug()
+        plug._node = self._node
+        plug._attr = '{}[{}]'.format(self._attr, index)
+        return plug
+
+    def asMObject(self):
+        obj = MObject()
+        obj._node = self._node
+        return obj
+
+
+class MGlobal(object):
+    @staticmethod
+    def getActiveSelectionList(sel_list):
+        for path in _scene.selection:
+            sel_list.add(path)
+
+
+class MScriptUtil(object):
+    def createFromList(self, values, count):
+        self._values = list(values)
+
+    @staticmethod
+    def createMatrixFromList(values, matrix):
+        matrix._values = [float(value) for value in values]
+
+    def asFloat2Ptr(self):
+        return [self._values[:2]]
+
+    @staticmethod
+    def getFloat2ArrayItem(ptr, row, column):
+        return ptr[row][column]
+
+
+class MBoundingBox(object):
+    def __init__(self, min_point, max_point):
+        self._min = min_point
+        self._max = max_point
+
+    def min(self):
+        return self._min
+
+    def max(self):
+        return self._max
+
+
+class MFnDagNode(object):
+    def __init__(self, path):
+        self._node = path._node
+
+    def boundingBox(self):
+        points = _scene.deformed_points(self._node)
+        mins = [min(p[i] for p in points) for i in range(3)]
+        maxs = [max(p[i] for p in points) for i in range(3)]
+        return MBoundingBox(MPoint(*mins), MPoint(*maxs))
+
+
+class MFnTransform(object):
+    def __init__(self, obj):
+        self._node = obj._node
+
+    def getRotation(self, quat):
+        rotate = _scene.evaluate(self._node, 'rotate')
+        quat._values = list(_scene.euler_to_quaternion(rotate, self._node.attrs.get('rotateOrder', 0)))
+
+
+class MFnMesh(object):
+    def __init__(self, path):
+        self._mesh = path._node.mesh
+        self._points = _scene.deformed_points(path._node)
+
+    def numVertices(self):
+        return len(self._mesh.points)
+
+    def numPolygons(self):
+        return len(self._mesh.face_counts)
+
+    def numColorSets(self):
+        return 1 if self._mesh.colors else 0
+
+    def currentUVSetName(self):
+        return 'map1'
+
+    def getNormals(self, normals):
+        normals.clear()
+        for normal in self._mesh.normals:
+            normals.append(MFloatVector(*normal))
+
+    def getPoints(self, points, space=None):
+        points.clear()
+        for point in self._points:
+            points.append(MPoint(*point))
+
+    def getVertices(self, counts, connects):
+        counts.clear()
+        connects.clear()
+        for count in self._mesh.face_counts:
+            counts.append(count)
+        for vertex in self._mesh.face_connects:
+            connects.append(vertex)
+
+    def getNormalIds(self, counts, ids):
+        counts.clear()
+        ids.clear()
+        for count in self._mesh.face_counts:
+            counts.append(count)
+        for normal_id in self._mesh.normal_ids:
+            ids.append(normal_id)
+
+    def getUVs(self, u_values, v_values, uv_set=None):
+        u_values.clear()
+        v_values.clear()
+        for u, v in self._mesh.uvs:
+            u_values.append(u)
+            v_values.append(v)
+
+    def getAssignedUVs(self, counts, ids, uv_set=None):
+        counts.clear()
+        ids.clear()
+        for count in self._mesh.face_counts:
+            counts.append(count)
+        for uv_id in self._mesh.uv_ids:
+            ids.append(uv_id)
+
+    def getFaceVertexColors(self, colors):
+        colors.clear()
+        mesh = self._mesh
+        for vertex in mesh.face_connects:
+            colors.append(MColor(*mesh.colors[vertex]))
+
+
+class MItMeshPolygon(object):
+    def __init__(self, path):
+        self._mesh = path._node.mesh
+        self._points = _scene.deformed_points(path._node)
+        self._face = 0
+
+    def isDone(self):
+        return self._face >= len(self._mesh.face_counts)
+
+    def next(self):
+        self._face += 1
+
+    __next__ = next
+
+    def _face_vertices(self):
+        mesh = self._mesh
+        offset = mesh.face_offsets[self._face]
+        return mesh.face_connects[offset:offset + mesh.face_counts[self._face]]
+
+    def getVertices(self, vertices):
+        vertices.clear()
+        for vertex in self._face_vertices():
+            vertices.append(vertex)
+
+    def getTriangles(self, points, ids):
+        points.clear()
+        ids.clear()
+        face = self._face_vertices()
+        for i in range(1, len(face) - 1):
+            for vertex in (face[0], face[i], face[i + 1]):
+                ids.append(vertex)
+                points.append(MPoint(*self._points[vertex]))
+
+    def normalIndex(self, local_index):
+        return self._mesh.normal_ids[self._mesh.face_offsets[self._face] + local_index]
+
+    def getUV(self, local_index, uv_ptr, uv_set=None):
+        uv = self._mesh.uvs[self._mesh.uv_ids[self._mesh.face_offsets[self._face] + local_index]]
+        uv_ptr[0][0], uv_ptr[0][1] = uv
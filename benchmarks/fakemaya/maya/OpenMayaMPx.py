@@ -0,0 +1,33 @@
+"""Just enough of the plug-in API to load and register plug-ins/glTFTranslator.py."""
+
+
+class MPxFileTranslator(object):
+    kImportAccessMode = 0
+    kReferenceAccessMode = 1
+    kExportAccessMode = 2
+    kSaveAccessMode = 3
+    kExportActiveAccessMode = 4
+
+    kIsMyFileType = 0
+    kCouldBeMyFileType = 1
+    kNotMyFileType = 2
+
+    def __init__(self):
+        pass
+
+
+class MFnPlugin(object):
+    translators = {}
+
+    def __init__(self, mobject, vendor=None, version=None, api_version=None):
+        self.mobject = mobject
+
+    def registerFileTranslator(self, name, pixmap, creator, options_script=None, default_options=None):
+        MFnPlugin.translators[name] = creator
+
+    def deregisterFileTranslator(self, name):
+        MFnPlugin.translators.pop(name, None)
+
+
+def asMPxPtr(instance):
+    return instance
@@ -0,0 +1,6 @@
+"""Lightweight stand-in for the parts of Maya used by glTFExport.
+
+The scene lives in maya._scene and is populated by benchmarks/scenes.py.
+Only what the exporter calls is implemented, with roughly the same
+per-call granularity as the real API so relative timings stay meaningful.
+"""
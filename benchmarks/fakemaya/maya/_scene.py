@@ -0,0 +1,346 @@
+"""In-memory scene graph backing the fake maya.cmds and maya.OpenMaya."""
+import math
+
+
+class FakeNode(object):
+    def __init__(self, path, type_, parent=None):
+        self.path = path
+        self.type = type_
+        self.parent = parent
+        self.children = []
+        self.attrs = {}
+        # attr -> list of connected source node names
+        self.connections = {}
+        # attr -> sorted list of (time, value, tangent_type)
+        self.keys = {}
+        self.mesh = None
+        # animCurve nodes: the node and attr whose keys they hold
+        self.curve = None
+        # skinCluster influence paths and per-vertex weight rows
+        self.influences = None
+        self.weights = None
+        # blendShape per-point target deltas by weight index, and alias -> attr
+        self.targets = {}
+        self.aliases = {}
+        # values set on keyed attrs at the current time
+        self.overrides = {}
+
+    @property
+    def short_name(self):
+        return self.path.split('|')[-1]
+
+
+class FakeMeshData(object):
+    '''Polygon mesh in the same layout Maya stores it.'''
+    def __init__(self, points, face_counts, face_connects, normals, normal_ids,
+                    uvs, uv_ids, colors=None):
+        self.points = points
+        self.face_counts = face_counts
+        self.face_connects = face_connects
+        self.normals = normals
+        # per face-vertex
+        self.normal_ids = normal_ids
+        self.uvs = uvs
+        self.uv_ids = uv_ids
+        self.colors = colors
+        self.face_offsets = []
+        offset = 0
+        for count in face_counts:
+            self.face_offsets.append(offset)
+            offset += count
+
+
+nodes = {}
+short_names = {}
+roots = []
+selection = []
+# saved scene file and its unsaved changes, for cmds.file
+scene_name = ''
+modified = False
+references = []
+time = 1.0
+time_unit = 'film'
+# project folder for cmds.workspace, empty without a project
+workspace_root = ''
+DEFAULT_CAMERAS = ['|top', '|front', '|side', '|persp']
+MATERIAL_TYPES = ['lambert', 'phong', 'blinn', 'aiStandardSurface', 'StingrayPBS']
+
+
+def reset():
+    global time, selection, scene_name, modified
+    nodes.clear()
+    short_names.clear()
+    del roots[:]
+    del references[:]
+    selection = []
+    scene_name = ''
+    modified = False
+    time = 1.0
+    for cam in DEFAULT_CAMERAS:
+        xform = create_node('transform', cam[1:])
+        shape = create_node('camera', cam[1:] + 'Shape', parent=xform)
+        shape.attrs.update({'orthographic': cam != '|persp', 'nearClipPlane': 0.1,
+                            'farClipPlane': 10000.0, 'aspectRatio': 1.5,
+                            'verticalFieldOfView': 40.0, 'orthographicWidth': 30.0})
+
+
+def create_node(type_, name, parent=None):
+    if type_ in ('transform', 'joint', 'mesh', 'camera'):
+        path = (parent.path if parent else '') + '|' + name
+    else:
+        path = name
+    node = FakeNode(path, type_, parent)
+    if type_ in ('transform', 'joint'):
+        node.attrs.update({'translate': (0.0, 0.0, 0.0), 'rotate': (0.0, 0.0, 0.0),
+                            'scale': (1.0, 1.0, 1.0), 'visibility': True,
+                            'rotateOrder': 0, 'rotateAxis': (0.0, 0.0, 0.0)})
+        if type_ == 'joint':
+            node.attrs['jointOrient'] = (0.0, 0.0, 0.0)
+    elif type_ == 'mesh':
+        node.attrs.update({'intermediateObject': False, 'visibility': True})
+    elif type_ == 'camera':
+        node.attrs['visibility'] = True
+    elif type_ == 'displayLayer':
+        node.attrs.update({'visibility': True, 'enabled': True})
+    if type_ in ('transform', 'joint', 'mesh', 'camera'):
+        node.attrs.update({'overrideEnabled': False, 'overrideVisibility': True})
+    nodes[path] = node
+    short_names.setdefault(name, path)
+    if parent:
+        parent.children.append(node)
+    elif type_ in ('transform', 'joint'):
+        roots.append(node)
+    return node
+
+
+def connect(src, dst, attr=None):
+    '''Connects src node to dst node, optionally on a named dst attribute.'''
+    dst.connections.setdefault(attr, []).append(src.path)
+    src.connections.setdefault(None, []).append(dst.path)
+
+
+def get_node(name):
+    if name in nodes:
+        return nodes[name]
+    # resolve short names the way Maya does for unique names
+    if name in short_names:
+        return nodes[short_names[name]]
+    raise ValueError('No object matches name: {}'.format(name))
+
+
+FPS = {'game': 15.0, 'film': 24.0, 'pal': 25.0, 'ntsc': 30.0, 'show': 48.0, 'palf': 50.0, 'ntscf': 60.0}
+
+
+def set_keys(node, attr, keys, tangent='linear'):
+    '''keys is a list of (time, value) for a scalar attr like translateX.
+    tangent is 'linear', 'spline' or 'step' for all of them.  The keys are
+    also exposed through an animCurve node connected to the attr.'''
+    node.keys[attr] = [(t, v, tangent) for t, v in sorted(keys)]
+    if attr.startswith('translate'):
+        curve_type = 'animCurveTL'
+    elif attr.startswith('rotate'):
+        curve_type = 'animCurveTA'
+    else:
+        curve_type = 'animCurveTU'
+    curve = create_node(curve_type, '{}_{}'.format(node.short_name, attr.replace('[', '_').replace(']', '')))
+    curve.curve = (node, attr)
+    curve.attrs.update({'weightedTangents': False, 'preInfinity': 0, 'postInfinity': 0})
+    node.connections[attr] = [curve.path]
+
+
+def key_slopes(keys):
+    '''(in, out) slope per frame of every key, the way Maya sets them for the tangent type.'''
+    slopes = []
+    for i, (t, v, tangent) in enumerate(keys):
+        before = (v - keys[i - 1][1]) / (t - keys[i - 1][0]) if i else None
+        after = (keys[i + 1][1] - v) / (keys[i + 1][0] - t) if i + 1 < len(keys) else None
+        if before is None:
+            before = after or 0.0
+        if after is None:
+            after = before
+        if tangent == 'step':
+            slopes.append((0.0, 0.0))
+        elif tangent == 'spline' and 0 < i < len(keys) - 1:
+            slope = (keys[i + 1][1] - keys[i - 1][1]) / (keys[i + 1][0] - keys[i - 1][0])
+            slopes.append((slope, slope))
+        else:
+            slopes.append((before, after))
+    return slopes
+
+
+def evaluate(node, attr, at_time=None):
+    '''Returns the value of a compound attr (translate, rotate, scale) at a time.'''
+    if at_time is None:
+        at_time = time
+    value = list(node.attrs[attr])
+    for i, axis in enumerate('XYZ'):
+        keys = node.keys.get(attr + axis)
+        if keys:
+            value[i] = keyed_value(node, attr + axis, at_time)
+    return tuple(value)
+
+
+def evaluate_scalar(node, attr, at_time=None):
+    if at_time is None and attr in node.overrides:
+        return node.overrides[attr]
+    if node.keys.get(attr):
+        return keyed_value(node, attr, time if at_time is None else at_time)
+    return node.attrs[attr]
+
+
+def keyed_value(node, attr, at_time):
+    '''Value of a keyed scalar attr with the pre and post infinity of its animCurve:
+    0 constant, 1 linear, 3 cycle, 4 cycle with offset, 5 oscillate.'''
+    keys = node.keys[attr]
+    first, last = keys[0][0], keys[-1][0]
+    curve = get_node(node.connections[attr][0])
+    if at_time < first:
+        mode = curve.attrs['preInfinity']
+    elif at_time > last:
+        mode = curve.attrs['postInfinity']
+    else:
+        mode = 0
+    period = last - first
+    if mode == 1:
+        slopes = key_slopes(keys)
+        if at_time < first:
+            return keys[0][1] + slopes[0][0] * (at_time - first)
+        return keys[-1][1] + slopes[-1][1] * (at_time - last)
+    if mode in (3, 4, 5) and period > 0:
+        cycles = math.floor((at_time - first) / period)
+        local = at_time - first - cycles * period
+        if mode == 5 and cycles % 2:
+            local = period - local
+        offset = cycles * (keys[-1][1] - keys[0][1]) if mode == 4 else 0.0
+        return _interpolate(keys, first + local) + offset
+    return _interpolate(keys, at_time)
+
+
+def multi_indices(node, attr):
+    prefix = attr + '['
+    return sorted(set(int(key[len(prefix):].split(']', 1)[0]) for key in node.attrs if key.startswith(prefix)))
+
+
+def blend_shape_target(node, attr, indices=False):
+    '''Target data of a blendShape built from its targets: the full weight item of
+    inputTarget[0].inputTargetGroup[i] with its points and components.  Nothing is
+    painted.'''
+    parts = attr.replace(']', '').split('.')
+    if len(parts) < 3 or parts[0] != 'inputTarget[0':
+        return None
+    deltas = node.targets.get(int(parts[1].split('[')[1]), {})
+    if parts[2] == 'inputTargetItem' and indices:
+        return [6000]
+    if len(parts) < 4:
+        return None
+    vertices = sorted(deltas)
+    if parts[3] == 'inputPointsTarget':
+        return [tuple(deltas[vertex]) + (1.0,) for vertex in vertices]
+    if parts[3] == 'inputComponentsTarget':
+        components = []
+        for vertex in vertices:
+            if components and components[-1][1] == vertex - 1:
+                components[-1][1] = vertex
+            else:
+                components.append([vertex, vertex])
+        return ['vtx[{}]'.format(first) if first == last else 'vtx[{}:{}]'.format(first, last)
+                for first, last in components]
+    return None
+
+
+def deformed_points(shape):
+    '''Mesh points after the blendShapes connected to its inMesh.'''
+    points = shape.mesh.points
+    for src in shape.connections.get('inMesh', []):
+        deformer = get_node(src)
+        if deformer.type != 'blendShape' or not deformer.attrs['envelope']:
+            continue
+        points = [list(point) for point in points]
+        for index, deltas in deformer.targets.items():
+            weight = deformer.attrs['envelope'] * evaluate_scalar(deformer, 'weight[{}]'.format(index))
+            if not weight:
+                continue
+            for vertex, delta in deltas.items():
+                point = points[vertex]
+                for axis in range(3):
+                    point[axis] += weight * delta[axis]
+    return points
+
+
+def _interpolate(keys, at_time):
+    if at_time <= keys[0][0]:
+        return keys[0][1]
+    if at_time >= keys[-1][0]:
+        return keys[-1][1]
+    for i, ((t0, v0, tangent0), (t1, v1, tangent1)) in enumerate(zip(keys, keys[1:])):
+        if t0 <= at_time <= t1:
+            if tangent0 == 'step':
+                return v1 if at_time == t1 else v0
+            if tangent0 == 'linear' and tangent1 == 'linear':
+                return v0 + (v1 - v0) * (at_time - t0) / (t1 - t0)
+            slopes = key_slopes(keys)
+            length = t1 - t0
+            s = (at_time - t0) / length
+            return ((2 * s ** 3 - 3 * s ** 2 + 1) * v0 + (s ** 3 - 2 * s ** 2 + s) * length * slopes[i][1]
+                    + (-2 * s ** 3 + 3 * s ** 2) * v1 + (s ** 3 - s ** 2) * length * slopes[i + 1][0])
+
+
+# rotate order enum -> axes in the order they're applied
+ROTATE_ORDERS = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0))
+
+
+def euler_to_quaternion(rotate, order=0):
+    '''Maya euler angles in degrees and a rotate order to (x, y, z, w).'''
+    quat = (0.0, 0.0, 0.0, 1.0)
+    for axis in ROTATE_ORDERS[order]:
+        half = math.radians(rotate[axis]) / 2
+        axis_quat = [0.0, 0.0, 0.0, math.cos(half)]
+        axis_quat[axis] = math.sin(half)
+        quat = multiply_quaternions(axis_quat, quat)
+    return quat
+
+
+def multiply_quaternions(a, b):
+    '''Hamilton product a * b of (x, y, z, w) quaternions.'''
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+            aw * bw - ax * bx - ay * by - az * bz)
+
+
+def local_matrix(node, at_time=None):
+    '''Row-major local matrix in Maya's row vector convention, rotate order,
+    rotate axis and joint orient included.'''
+    quat = euler_to_quaternion(evaluate(node, 'rotate', at_time), node.attrs.get('rotateOrder', 0))
+    if 'rotateAxis' in node.attrs:
+        quat = multiply_quaternions(quat, euler_to_quaternion(node.attrs['rotateAxis']))
+    if 'jointOrient' in node.attrs:
+        quat = multiply_quaternions(euler_to_quaternion(node.attrs['jointOrient']), quat)
+    x, y, z, w = quat
+    # column vector rotation matrix
+    rot = [[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+           [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+           [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]]
+    scale = evaluate(node, 'scale', at_time)
+    matrix = []
+    for row in range(3):
+        matrix.extend([rot[column][row] * scale[row] for column in range(3)] + [0.0])
+    matrix.extend(list(evaluate(node, 'translate', at_time)) + [1.0])
+    return matrix
+
+
+def world_matrix(node, at_time=None):
+    '''Local matrix times those of all parents, row vector convention.'''
+    matrix = local_matrix(node, at_time)
+    parent = node.parent
+    while parent is not None:
+        parent_matrix = local_matrix(parent, at_time)
+        matrix = [sum(matrix[row * 4 + k] * parent_matrix[k * 4 + column] for k in range(4))
+                  for row in range(4) for column in range(4)]
+        parent = parent.parent
+    return matrix
+
+
+reset()
@@ -0,0 +1,204 @@
+"""Fake maya.api.OpenMaya (API 2.0) covering the bulk calls used by glTFImport."""
+import math
+
+from maya import _scene
+
+
+class _Array(list):
+    pass
+
+
+class MIntArray(_Array):
+    pass
+
+
+class MFloatArray(_Array):
+    pass
+
+
+class MFloatPointArray(_Array):
+    pass
+
+
+class MPointArray(_Array):
+    pass
+
+
+class MVectorArray(_Array):
+    pass
+
+
+class MFloatVectorArray(_Array):
+    pass
+
+
+class MColorArray(_Array):
+    pass
+
+
+class MDoubleArray(_Array):
+    pass
+
+
+class MFn(object):
+    kMeshVertComponent = 'kMeshVertComponent'
+
+
+class MObject(object):
+    def __init__(self, node=None):
+        self._node = node
+
+
+class MSelectionList(object):
+    def __init__(self):
+        self._nodes = []
+
+    def add(self, name):
+        self._nodes.append(_scene.get_node(name))
+        return self
+
+    def getDependNode(self, index):
+        return MObject(self._nodes[index])
+
+    def getDagPath(self, index):
+        return MDagPath(self._nodes[index])
+
+
+class MDagPath(object):
+    def __init__(self, node=None):
+        self._node = node
+
+    def fullPathName(self):
+        return self._node.path
+
+
+class MFnSingleIndexedComponent(object):
+    def __init__(self):
+        self._obj = None
+
+    def create(self, component_type):
+        self._obj = MObject()
+        self._obj.complete = 0
+        return self._obj
+
+    def setCompleteData(self, count):
+        self._obj.complete = count
+
+
+class MEulerRotation(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+class MQuaternion(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0, w=1.0):
+        self.x, self.y, self.z, self.w = x, y, z, w
+
+    def asEulerRotation(self):
+        x, y, z, w = self.x, self.y, self.z, self.w
+        # xyz rotate order
+        sin_y = 2 * (w * y - x * z)
+        sin_y = max(-1.0, min(1.0, sin_y))
+        return MEulerRotation(math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y)),
+                                math.asin(sin_y),
+                                math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z)))
+
+
+class MFnDagNode(object):
+    def __init__(self, obj):
+        self._node = obj._node
+
+    def fullPathName(self):
+        return self._node.path
+
+
+class MFnMesh(object):
+    def __init__(self, obj=None):
+        self._node = obj._node if obj is not None else None
+
+    def create(self, vertices, polygonCounts, polygonConnects, uValues=None, vValues=None,
+                parent=None):
+        xform = parent._node
+        shape = _scene.create_node('mesh', xform.short_name + 'Shape{}'.format(len(xform.children) or ''),
+                                    parent=xform)
+        points = [tuple(point[:3]) for point in vertices]
+        connects = list(polygonConnects)
+        uvs = list(zip(uValues, vValues)) if uValues is not None else []
+        shape.mesh = _scene.FakeMeshData(points, list(polygonCounts), connects,
+                                            [(0.0, 1.0, 0.0)] * len(points), list(connects),
+                                            uvs, [])
+        self._node = shape
+        return MObject(shape)
+
+    def assignUVs(self, uvCounts, uvIds, uvSet=None):
+        self._node.mesh.uv_ids = list(uvIds)
+
+    def setVertexNormals(self, normals, vertexIds):
+        mesh_normals = self._node.mesh.normals = list(self._node.mesh.normals)
+        for normal, vertex in zip(normals, vertexIds):
+            mesh_normals[vertex] = tuple(normal)
+        mesh = self._node.mesh
+        mesh.normal_ids = list(mesh.face_connects)
+
+    def getPoints(self, space=None):
+        return MPointArray(tuple(point) + (1.0,) for point in _scene.deformed_points(self._node))
+
+    def getNormals(self, space=None):
+        return MFloatVectorArray(tuple(normal) for normal in self._node.mesh.normals)
+
+    def setVertexColors(self, colors, vertexIds):
+        mesh = self._node.mesh
+        mesh.colors = [None] * len(mesh.points)
+        for color, vertex in zip(colors, vertexIds):
+            mesh.colors[vertex] = tuple(color)
+
+
+class MTime(object):
+    kSeconds = 'seconds'
+
+    def __init__(self, value=0.0, unit=None):
+        self.value = value
+        self.unit = unit or MTime.uiUnit()
+
+    @staticmethod
+    def uiUnit():
+        return _scene.time_unit
+
+    def asUnits(self, unit):
+        seconds = self.value if self.unit == MTime.kSeconds else self.value / _scene.FPS[self.unit]
+        return seconds if unit == MTime.kSeconds else seconds * _scene.FPS[unit]
+
+
+class MDistance(object):
+    kCentimeters = 'cm'
+
+    def __init__(self, value=0.0, unit=kCentimeters):
+        self.value = value
+        self.unit = unit
+
+    @staticmethod
+    def uiUnit():
+        return MDistance.kCentimeters
+
+    @staticmethod
+    def internalUnit():
+        return MDistance.kCentimeters
+
+    def asUnits(self, unit):
+        return self.value
+
+
+class MAngle(object):
+    kRadians = 'rad'
+    kDegrees = 'deg'
+
+    def __init__(self, value=0.0, unit=kRadians):
+        self.value = value
+        self.unit = unit
+
+    @staticmethod
+    def uiUnit():
+        return MAngle.kDegrees
+
+    def asRadians(self):
+        return math.radians(self.value) if self.unit == MAngle.kDegrees else self.value
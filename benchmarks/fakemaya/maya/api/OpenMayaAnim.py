@@ -0,0 +1,89 @@
+"""Fake maya.api.OpenMayaAnim (API 2.0) covering the skinCluster and animCurve calls used by glTFExport."""
+import math
+
+from maya import _scene
+from maya.api.OpenMaya import MDagPath, MDoubleArray, MTime
+
+
+class MFnSkinCluster(object):
+    def __init__(self, obj):
+        self._node = obj._node
+
+    def influenceObjects(self):
+        return [MDagPath(_scene.get_node(path)) for path in self._node.influences]
+
+    def indexForInfluenceObject(self, path):
+        return self._node.influences.index(path.fullPathName())
+
+    def getWeights(self, shape_path, components):
+        weights = MDoubleArray()
+        for row in self._node.weights[:components.complete]:
+            weights.extend(row)
+        return weights, len(self._node.influences)
+
+
+class MFnAnimCurve(object):
+    kTangentGlobal = 0
+    kTangentFixed = 1
+    kTangentLinear = 2
+    kTangentFlat = 3
+    kTangentSmooth = 4
+    kTangentStep = 5
+    kTangentSlow = 6
+    kTangentFast = 7
+    kTangentClamped = 8
+    kTangentPlateau = 9
+    kTangentStepNext = 10
+    kTangentAuto = 11
+    _tangent_types = {'linear': kTangentLinear, 'spline': kTangentSmooth, 'step': kTangentStep}
+    kConstant = 0
+    kLinear = 1
+    kCycle = 3
+    kCycleRelative = 4
+    kOscillate = 5
+
+    def __init__(self, obj):
+        self._curve = obj._node
+        owner, attr = self._curve.curve
+        self._keys = owner.keys[attr]
+        self._slopes = _scene.key_slopes(self._keys)
+        # values are in internal units, radians for angles
+        self._scale = math.radians(1.0) if self._curve.type == 'animCurveTA' else 1.0
+
+    @property
+    def numKeys(self):
+        return len(self._keys)
+
+    @property
+    def isWeighted(self):
+        return self._curve.attrs['weightedTangents']
+
+    @property
+    def preInfinityType(self):
+        return self._curve.attrs['preInfinity']
+
+    @property
+    def postInfinityType(self):
+        return self._curve.attrs['postInfinity']
+
+    def evaluate(self, time):
+        """Weighted tangents are evaluated like unweighted ones."""
+        owner, attr = self._curve.curve
+        return _scene.keyed_value(owner, attr, time.asUnits(MTime.uiUnit())) * self._scale
+
+    def input(self, index):
+        return MTime(self._keys[index][0])
+
+    def value(self, index):
+        return self._keys[index][1] * self._scale
+
+    def inTangentType(self, index):
+        return self._tangent_types[self._keys[index][2]]
+
+    def outTangentType(self, index):
+        return self._tangent_types[self._keys[index][2]]
+
+    def getTangentXY(self, index, isInTangent):
+        """x in seconds, y in internal units."""
+        slope = self._slopes[index][0 if isInTangent else 1]
+        return 1.0, slope * _scene.FPS[_scene.time_unit] * self._scale
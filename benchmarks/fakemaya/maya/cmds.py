@@ -0,0 +1,289 @@
+"""Fake maya.cmds backed by maya._scene."""
+from maya import _scene
+
+
+def _flatten(args):
+    items = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            items.extend(arg)
+        elif arg is not None:
+            items.append(arg)
+    return items
+
+
+def ls(*args, **kwargs):
+    if kwargs.get('assemblies'):
+        return [node.path for node in _scene.roots]
+    names = _flatten(args)
+    if kwargs.get('type') and not args:
+        return [node.path for node in _scene.nodes.values() if node.type == kwargs['type']]
+    if kwargs.get('type'):
+        return [_scene.get_node(name).path for name in names
+                if _scene.get_node(name).type == kwargs['type']]
+    if kwargs.get('materials'):
+        return [name for name in names
+                if _scene.get_node(name).type in _scene.MATERIAL_TYPES]
+    if kwargs.get('shortNames'):
+        return [_scene.get_node(name).short_name for name in names]
+    return [_scene.get_node(name).path for name in names]
+
+
+def objectType(name):
+    return _scene.get_node(name).type
+
+
+def listRelatives(name, children=False, fullPath=False, **kwargs):
+    node = _scene.get_node(name)
+    if not node.children:
+        return None
+    return [child.path for child in node.children]
+
+
+def getAttr(plug, time=None, **kwargs):
+    name, attr = plug.split('.', 1)
+    node = _scene.get_node(name)
+    attr = node.aliases.get(attr, attr)
+    if node.type == 'blendShape' and attr.startswith('inputTarget['):
+        return _scene.blend_shape_target(node, attr, kwargs.get('multiIndices'))
+    if kwargs.get('multiIndices'):
+        return _scene.multi_indices(node, attr) or None
+    if attr in ('translate', 'rotate', 'scale'):
+        return [_scene.evaluate(node, attr, time)]
+    if attr not in node.attrs and _scene.multi_indices(node, attr):
+        return [tuple(_scene.evaluate_scalar(node, '{}[{}]'.format(attr, index), time)
+                      for index in _scene.multi_indices(node, attr))]
+    if attr in node.keys:
+        return _scene.evaluate_scalar(node, attr, time)
+    value = node.attrs[attr]
+    if isinstance(value, tuple):
+        return [value]
+    return value
+
+
+def setAttr(plug, *values, **kwargs):
+    name, attr = plug.split('.', 1)
+    node = _scene.get_node(name)
+    attr = node.aliases.get(attr, attr)
+    if attr in node.keys:
+        # holds until the next time change, like on a keyed attr
+        node.overrides[attr] = values[0]
+    node.attrs[attr] = values[0] if len(values) == 1 else tuple(float(value) for value in values)
+
+
+def attributeQuery(attr, node=None, exists=False, **kwargs):
+    return attr in _scene.get_node(node).attrs
+
+
+def select(*args, **kwargs):
+    _scene.selection = [_scene.get_node(name).path for name in _flatten(args)]
+
+
+def listConnections(*args, **kwargs):
+    type_ = kwargs.get('type')
+    result = []
+    for item in _flatten(args):
+        if '.' in item:
+            name, attr = item.split('.', 1)
+        else:
+            name, attr = item, None
+        node = _scene.get_node(name)
+        if attr is None:
+            sources = [(plug, src) for plug, conns in node.connections.items() for src in conns]
+        else:
+            sources = [(attr, src) for src in node.connections.get(attr, [])]
+        for plug, src in sources:
+            if type_ is None or _scene.get_node(src).type == type_:
+                if kwargs.get('connections'):
+                    result.append('{}.{}'.format(node.short_name, plug))
+                result.append(_scene.get_node(src).short_name)
+    return result or None
+
+
+def listHistory(name, **kwargs):
+    '''Upstream deformer chain through inMesh connections.'''
+    history = []
+    pending = [_scene.get_node(name)]
+    while pending:
+        node = pending.pop()
+        for src in node.connections.get('inMesh', []):
+            history.append(src)
+            pending.append(_scene.get_node(src))
+    return history or None
+
+
+def _plug_keys(plugs):
+    keys = []
+    for plug in _flatten([plugs]):
+        if '.' not in plug:
+            keys.extend(key for attr_keys in _scene.get_node(plug).keys.values() for key in attr_keys)
+            continue
+        name, attr = plug.split('.', 1)
+        node = _scene.get_node(name)
+        keys.extend(node.keys.get(node.aliases.get(attr, attr), []))
+    return keys
+
+
+def listAttr(plug, multi=False, **kwargs):
+    name, attr = plug.split('.', 1)
+    node = _scene.get_node(name)
+    by_attr = dict((value, alias) for alias, value in node.aliases.items())
+    return [by_attr.get('{}[{}]'.format(attr, index), '{}[{}]'.format(attr, index))
+            for index in _scene.multi_indices(node, attr)] or None
+
+
+def keyframe(name, attribute=None, query=False, keyframeCount=False, timeChange=False, **kwargs):
+    if attribute is None:
+        keys = _plug_keys(name)
+    else:
+        node = _scene.get_node(name)
+        keys = []
+        for attr, attr_keys in node.keys.items():
+            if attr == attribute or attr[:-1] == attribute:
+                keys.extend(attr_keys)
+    if keyframeCount:
+        return len(keys)
+    if timeChange:
+        return [key[0] for key in keys] or None
+    return None
+
+
+def keyTangent(name, attribute=None, time=None, query=False, outTangentType=False, **kwargs):
+    if attribute is None:
+        keys = _plug_keys(name)
+    else:
+        keys = _scene.get_node(name).keys.get(attribute, [])
+    for key_time, value, tangent in keys:
+        if time[0] <= key_time <= time[1]:
+            return [tangent]
+    return None
+
+
+def currentTime(*args, **kwargs):
+    if kwargs.get('query'):
+        return _scene.time
+    _scene.time = float(args[0])
+    for node in _scene.nodes.values():
+        node.overrides.clear()
+    return _scene.time
+
+
+def currentUnit(query=False, time=False, **kwargs):
+    return _scene.time_unit
+
+
+def camera(name, query=False, **kwargs):
+    node = _scene.get_node(name)
+    for flag in kwargs:
+        return node.attrs[flag]
+
+
+def createNode(type_, name=None, parent=None, **kwargs):
+    parent_node = _scene.get_node(parent) if parent else None
+    name = name or type_ + '1'
+    return _scene.create_node(type_, name, parent=parent_node).path
+
+
+def shadingNode(type_, name=None, **kwargs):
+    name = name or type_ + str(len(_scene.nodes))
+    node = _scene.create_node(type_, name)
+    node.attrs.update({'color': (0.5, 0.5, 0.5), 'transparency': (0.0, 0.0, 0.0)})
+    return node.path
+
+
+def connectAttr(src_plug, dst_plug, **kwargs):
+    dst_name, dst_attr = dst_plug.split('.', 1)
+    _scene.connect(_scene.get_node(src_plug.split('.', 1)[0]), _scene.get_node(dst_name), dst_attr)
+
+
+def sets(*args, **kwargs):
+    if kwargs.get('empty'):
+        return _scene.create_node('shadingEngine', kwargs.get('name', 'set')).path
+    if kwargs.get('forceElement'):
+        group = kwargs['forceElement']
+        if group not in _scene.nodes:
+            _scene.create_node('shadingEngine', group)
+        for name in _flatten(args):
+            _scene.connect(_scene.get_node(name), _scene.get_node(group))
+    return None
+
+
+def parent(*args, **kwargs):
+    names = _flatten(args)
+    new_parent = _scene.get_node(names[-1])
+    for name in names[:-1]:
+        new_parent.children.append(_scene.get_node(name))
+
+
+def xform(name, matrix=None, query=False, **kwargs):
+    node = _scene.get_node(name)
+    if query and matrix:
+        if kwargs.get('worldSpace'):
+            return _scene.world_matrix(node)
+        return _scene.local_matrix(node)
+    if matrix:
+        node.attrs['translate'] = tuple(matrix[12:15])
+
+
+def editDisplayLayerMembers(layer, query=False, **kwargs):
+    '''Members are connected to the layer on their drawOverride attr, like layer.drawInfo in Maya.'''
+    path = _scene.get_node(layer).path
+    return [node.path for node in _scene.nodes.values()
+            if path in node.connections.get('drawOverride', [])] or None
+
+
+def aliasAttr(name, query=False, **kwargs):
+    node = _scene.get_node(name)
+    return [value for alias, attr in sorted(node.aliases.items()) for value in (alias, attr)] or None
+
+
+def blendShape(name, query=False, geometry=False, geometryIndices=False, **kwargs):
+    node = _scene.get_node(name)
+    shapes = [_scene.get_node(path).short_name for path in node.connections.get(None, [])
+              if _scene.get_node(path).type == 'mesh']
+    if geometryIndices:
+        return list(range(len(shapes))) or None
+    return shapes or None
+
+
+def deformableShape(name, originalGeometry=False, **kwargs):
+    '''The output plug of the mesh going into the deformer chain of a shape.'''
+    node = _scene.get_node(name)
+    pending = list(node.connections.get('inMesh', []))
+    while pending:
+        source = _scene.get_node(pending.pop())
+        if source.type == 'mesh':
+            return [source.short_name + '.worldMesh']
+        pending.extend(source.connections.get('inMesh', []))
+    return ['']
+
+
+def skinCluster(name, query=False, influence=False, geometry=False, **kwargs):
+    node = _scene.get_node(name)
+    if geometry:
+        return [_scene.get_node(path).short_name for path in node.connections.get(None, [])
+                if _scene.get_node(path).type == 'mesh'] or None
+    return [_scene.get_node(path).short_name for path in node.influences]
+
+
+def file(*args, **kwargs):
+    if kwargs.get('query'):
+        if kwargs.get('sceneName'):
+            return _scene.scene_name
+        if kwargs.get('modified'):
+            return _scene.modified
+        if kwargs.get('reference'):
+            return list(_scene.references)
+    raise RuntimeError('Only file queries are available in the fake maya module')
+
+
+def workspace(*args, **kwargs):
+    if kwargs.get('rootDirectory'):
+        return _scene.workspace_root
+    if kwargs.get('fileRuleEntry') == 'sourceImages':
+        return 'sourceimages'
+    return None
+
+
+def fileDialog2(**kwargs):
+    raise RuntimeError('fileDialog2 is not available in the fake maya module')
@@ -0,0 +1,109 @@
+"""Import time benchmark: what loading the plug-in and the first export cost.
+
+Each measurement runs in a fresh interpreter so nothing is cached between
+them.  Loading the plug-in must not import the exporter, Qt or numpy, they
+are only imported by the first writer() call.  Runs against the stand-in
+modules in fakemaya, pass --real-maya to run it with mayapy instead, where
+the Qt and numpy costs are real.
+
+    python benchmarks/import_time.py            # compare with baselines/import.json
+    python benchmarks/import_time.py --update   # record a new baseline
+    mayapy benchmarks/import_time.py --real-maya
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+# modules only the first export may load
+HEAVY_MODULES = ('glTFExport', 'glTFImport', 'numpy', 'PySide.QtGui', 'PySide2.QtGui')
+
+CHILD = '''
+import json, sys, time
+sys.path[:0] = {paths!r}
+timer = getattr(time, 'perf_counter', time.time)
+result = {{}}
+def step(name, func):
+    before = set(sys.modules)
+    start = timer()
+    func()
+    result[name] = {{'seconds': timer() - start,
+                    'modules': sorted(set(sys.modules) - before)}}
+def load_plugin():
+    import glTFTranslator
+    if {register!r}:
+        glTFTranslator.initializePlugin(None)
+def first_writer():
+    # what GLTFTranslator.writer imports before exporting
+    import glTFExport
+    glTFExport._import_qt()
+def exporter():
+    import glTFExport
+for name in {steps!r}:
+    step(name, {{'plugin_load': load_plugin, 'first_writer': first_writer,
+                'exporter_import': exporter}}[name])
+print(json.dumps(result))
+'''
+
+# each case runs its steps in one interpreter
+CASES = [
+    ('plugin_load', ['plugin_load']),
+    ('first_writer', ['plugin_load', 'first_writer']),
+    ('exporter_import', ['exporter_import']),
+]
+
+
+def measure(steps, real_maya):
+    paths = [os.path.join(ROOT, 'plug-ins'), os.path.join(ROOT, 'scripts')]
+    if not real_maya:
+        paths.insert(0, os.path.join(HERE, 'fakemaya'))
+    code = CHILD.format(paths=paths, register=not real_maya, steps=steps)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])[steps[-1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case, the fastest is kept')
+    parser.add_argument('--real-maya', action='store_true', help='use the maya and Qt modules of this interpreter')
+    parser.add_argument('--update', action='store_true', help='write results as the new baseline')
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for name, steps in CASES:
+        runs = [measure(steps, args.real_maya) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        heavy = [module for module in best['modules'] if module in HEAVY_MODULES]
+        results[name] = {'seconds': best['seconds'], 'modules': len(best['modules']), 'heavy': heavy}
+        print('{:<18} {:>9.1f} ms  {:>4} modules  heavy: {}'.format(
+                name, best['seconds'] * 1000.0, len(best['modules']), ', '.join(heavy) or 'none'))
+    if results['plugin_load']['heavy']:
+        print('\nLoading the plug-in imports {}'.format(', '.join(results['plugin_load']['heavy'])))
+        failed = True
+
+    baseline_path = os.path.join(HERE, 'baselines', 'import.json')
+    if os.path.exists(baseline_path) and not args.update:
+        with open(baseline_path) as infile:
+            baseline = json.load(infile)['results']
+        print('\nCompared with {}'.format(os.path.relpath(baseline_path)))
+        for name, metrics in sorted(results.items()):
+            if name not in baseline:
+                continue
+            print('{:<18} time x{:.2f}  modules {:+d}'.format(
+                    name, metrics['seconds'] / max(baseline[name]['seconds'], 1e-9),
+                    metrics['modules'] - baseline[name]['modules']))
+    if args.update:
+        with open(baseline_path, 'w') as outfile:
+            json.dump({'results': results}, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+        print('Baseline written to {}'.format(os.path.relpath(baseline_path)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""JSON emission benchmark: document size and encode time on a 100k-node scene.
+
+Runs with mayapy or plain python, falling back to the fake maya module:
+    python benchmarks/json_emission.py [node_count]
+"""
+from __future__ import print_function
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'scripts'))
+try:
+    import maya
+except ImportError:
+    sys.path.insert(0, os.path.join(HERE, 'fakemaya'))
+import glTFExport
+
+
+def build_nodes(count, seed=0):
+    rand = random.Random(seed)
+    exporter = glTFExport.GLTFExporter('bench.glb')
+    ctx = exporter.ctx
+    scene = glTFExport.Scene.__new__(glTFExport.Scene)
+    scene.ctx = ctx
+    scene.name = 'defaultScene'
+    scene.nodes = []
+    ctx.scenes.append(scene)
+    for i in range(count):
+        node = glTFExport.Node.__new__(glTFExport.Node)
+        node.ctx = ctx
+        node.name = 'node{}'.format(i)
+        node.index = i
+        node.children = []
+        node.matrix = node.mesh = node.camera = None
+        # Values as they come back from getAttr, e.g. 0.1 * 3 = 0.30000000000000004
+        node.translation = tuple(rand.randint(-1000, 1000) * 0.1 * 3 for _ in range(3))
+        node.rotation = [rand.uniform(-1, 1) for _ in range(4)]
+        node.scale = (1.0, 1.0, 1.0)
+        ctx.nodes.append(node)
+        if i % 10 == 0:
+            scene.nodes.append(node)
+        else:
+            ctx.nodes[i - i % 10].children.append(node)
+    return exporter
+
+
+def run_case(exporter, label, **settings):
+    for key, value in settings.items():
+        setattr(exporter.ctx.settings, key, value)
+    exporter.output = {}
+    start = time.time()
+    exporter._build_document()
+    json_str = json.dumps(exporter.output, sort_keys=exporter.ctx.settings.sort_keys,
+                            separators=(',', ':'))
+    elapsed = time.time() - start
+    print('{:<32} {:>10} bytes {:>8.3f} sec'.format(label, len(json_str), elapsed))
+
+
+def run_legacy(exporter):
+    # Lazy per-item to_json() callbacks, sorted keys, full precision
+    output = {'scene': 0, 'scenes': exporter.ctx.scenes, 'nodes': exporter.ctx.nodes}
+    start = time.time()
+    json_str = json.dumps(output, sort_keys=True, separators=(',', ':'), cls=glTFExport.GLTFEncoder)
+    elapsed = time.time() - start
+    print('{:<32} {:>10} bytes {:>8.3f} sec'.format('legacy encoder callbacks', len(json_str), elapsed))
+
+
+def main(node_count=100000):
+    exporter = build_nodes(node_count)
+    print('{} nodes'.format(node_count))
+    run_legacy(exporter)
+    run_case(exporter, 'one pass, sorted, full', sort_keys=True)
+    run_case(exporter, 'one pass, unsorted, full', sort_keys=False)
+    run_case(exporter, 'one pass, unsorted, 6 digits', sort_keys=False, transform_precision=6)
+    run_case(exporter, 'one pass, unsorted, 4 digits', sort_keys=False, transform_precision=4)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,81 @@
+"""Memory benchmark: peak and retained Python allocations of an export.
+
+Retained bytes are what is still referenced once export() has returned.  The
+registries belong to the export's ExportContext, so this should stay near zero.  Uses tracemalloc, so timings are not meaningful.
+
+    python benchmarks/memory.py            # compare with baselines/memory.json
+    python benchmarks/memory.py --update   # record a new baseline
+"""
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, 'fakemaya'), os.path.join(HERE, '..', 'scripts'), HERE]
+
+import glTFExport
+import scenes
+
+CASES = [
+    ('grid/10000', lambda: scenes.grid_scene(10000)),
+    ('grid/100000', lambda: scenes.grid_scene(100000)),
+    ('grid/1000000', lambda: scenes.grid_scene(1000000)),
+    ('wide/2000', lambda: scenes.wide_hierarchy(2000)),
+    ('animation/50x240', lambda: scenes.animated_scene(50, 240)),
+]
+
+
+def measure(setup, out_file):
+    setup()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    glTFExport.export(out_file)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'peak_bytes': peak - before, 'retained_bytes': current - before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--update', action='store_true', help='write results as the new baseline')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='glTFMem')
+    results = {}
+    try:
+        for name, setup in CASES:
+            results[name] = measure(setup, os.path.join(work_dir, 'out.glb'))
+            print('{:<24} peak {:>14,} bytes  retained {:>14,} bytes'.format(
+                    name, results[name]['peak_bytes'], results[name]['retained_bytes']))
+    finally:
+        shutil.rmtree(work_dir)
+
+    baseline_path = os.path.join(HERE, 'baselines', 'memory.json')
+    if os.path.exists(baseline_path) and not args.update:
+        with open(baseline_path) as infile:
+            baseline = json.load(infile)['results']
+        print('\nCompared with {}'.format(os.path.relpath(baseline_path)))
+        for name, metrics in sorted(results.items()):
+            if name not in baseline:
+                continue
+            print('{:<24} peak x{:.2f}  retained x{:.2f}'.format(
+                    name,
+                    metrics['peak_bytes'] / float(max(baseline[name]['peak_bytes'], 1)),
+                    metrics['retained_bytes'] / float(max(baseline[name]['retained_bytes'], 1))))
+    if args.update:
+        with open(baseline_path, 'w') as outfile:
+            json.dump({'results': results}, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+        print('Baseline written to {}'.format(os.path.relpath(baseline_path)))
+
+
+if __name__ == '__main__':
+    main()
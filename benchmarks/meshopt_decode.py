@@ -0,0 +1,241 @@
+"""EXT_meshopt_compression decoder used to check the exporter's streams.
+
+Written from the extension specification rather than from the exporter's
+encoders, so a codec change that produces streams other decoders can't read
+fails the benchmarks instead of shipping:
+    python benchmarks/meshopt_decode.py file.gltf
+
+The file has to be exported with meshopt_fallback, every compressed bufferView
+is decoded and compared with its fallback data.
+"""
+from __future__ import print_function
+import os
+import sys
+
+import numpy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'scripts'))
+try:
+    import maya
+except ImportError:
+    sys.path.insert(0, os.path.join(HERE, 'fakemaya'))
+import glTFImport
+
+VERTEX_HEADER = 0xa0
+INDEX_HEADER = 0xe1
+TAIL_MIN_SIZE = 32
+
+
+def decode_vertex_buffer(data, count, stride):
+    '''ATTRIBUTES mode.  Returns count elements of stride bytes as a bytearray.'''
+    data = bytearray(data)
+    if data[0] != VERTEX_HEADER:
+        raise ValueError("Unknown vertex stream header 0x{:02x}".format(data[0]))
+    tail_size = max(stride, TAIL_MIN_SIZE)
+    block_size = min(256, (8192 // stride) & ~15)
+    # the first element is stored at the end of the stream
+    last = data[len(data) - stride:]
+    out = bytearray(count * stride)
+    pos = 1
+    for start in range(0, count, block_size):
+        size = min(block_size, count - start)
+        group_count = (size + 15) // 16
+        for byte in range(stride):
+            header = data[pos:pos + (group_count + 3) // 4]
+            pos += len(header)
+            deltas = []
+            for group in range(group_count):
+                mode = (header[group >> 2] >> ((group & 3) * 2)) & 3
+                if mode == 0:
+                    deltas.extend([0] * 16)
+                elif mode == 3:
+                    deltas.extend(data[pos:pos + 16])
+                    pos += 16
+                else:
+                    bits = 2 if mode == 1 else 4
+                    sentinel = (1 << bits) - 1
+                    per_byte = 8 // bits
+                    extra = pos + 16 // per_byte
+                    for i in range(16):
+                        value = (data[pos + i // per_byte] >> (8 - bits * (i % per_byte + 1))) & sentinel
+                        if value == sentinel:
+                            value = data[extra]
+                            extra += 1
+                        deltas.append(value)
+                    pos = extra
+            value = last[byte]
+            for i in range(size):
+                delta = deltas[i]
+                value = (value + ((delta >> 1) ^ -(delta & 1))) & 0xff
+                out[(start + i) * stride + byte] = value
+            last[byte] = value
+    if pos + tail_size != len(data):
+        raise ValueError("Vertex stream has {} bytes, {} decoded".format(len(data), pos + tail_size))
+    return out
+
+
+def decode_index_buffer(data, count, stride):
+    '''TRIANGLES mode.  Returns count indices of stride bytes as little endian bytes.'''
+    data = bytearray(data)
+    if data[0] != INDEX_HEADER:
+        raise ValueError("Unknown index stream header 0x{:02x}".format(data[0]))
+    if count % 3:
+        raise ValueError("Index count {} isn't a multiple of 3".format(count))
+    codeaux_table = data[len(data) - 16:]
+    codes = data[1:1 + count // 3]
+    pos = 1 + count // 3
+    edge_fifo = [(0, 0)] * 16
+    vertex_fifo = [0] * 16
+    state = {'edge': 0, 'vertex': 0, 'pos': pos}
+    indices = []
+
+    def push_edge(a, b):
+        edge_fifo[state['edge']] = (a, b)
+        state['edge'] = (state['edge'] + 1) & 15
+
+    def push_vertex(vertex, cond=True):
+        vertex_fifo[state['vertex']] = vertex
+        state['vertex'] = (state['vertex'] + cond) & 15
+
+    def read_index(last):
+        value = shift = 0
+        while True:
+            byte = data[state['pos']]
+            state['pos'] += 1
+            value |= (byte & 127) << shift
+            shift += 7
+            if byte < 128:
+                break
+        return (last + ((value >> 1) ^ -(value & 1))) & 0xffffffff
+
+    next_index = last = 0
+    for code in codes:
+        if code < 0xf0:
+            a, b = edge_fifo[(state['edge'] - 1 - (code >> 4)) & 15]
+            fec = code & 15
+            if fec == 0:
+                c = next_index
+                next_index += 1
+                push_vertex(c)
+            elif fec < 13:
+                c = vertex_fifo[(state['vertex'] - 1 - fec) & 15]
+            else:
+                if fec == 13:
+                    c = (last - 1) & 0xffffffff
+                elif fec == 14:
+                    c = (last + 1) & 0xffffffff
+                else:
+                    c = read_index(last)
+                last = c
+                push_vertex(c)
+            push_edge(c, b)
+            push_edge(a, c)
+        else:
+            if code < 0xfe:
+                codeaux = codeaux_table[code & 15]
+                fea = 0
+            else:
+                codeaux = data[state['pos']]
+                state['pos'] += 1
+                fea = 0 if code == 0xfe else 15
+                if codeaux == 0:
+                    next_index = 0
+            feb, fec = codeaux >> 4, codeaux & 15
+            vertices = []
+            for fe in (fea, feb, fec):
+                if fe == 0:
+                    vertices.append(next_index)
+                    next_index += 1
+                elif fe < 15:
+                    vertices.append(vertex_fifo[(state['vertex'] - fe) & 15])
+                else:
+                    vertices.append(None)
+            for i, fe in enumerate((fea, feb, fec)):
+                if fe == 15:
+                    last = vertices[i] = read_index(last)
+            a, b, c = vertices
+            push_vertex(a)
+            push_vertex(b, feb == 0 or feb == 15)
+            push_vertex(c, fec == 0 or fec == 15)
+            push_edge(b, a)
+            push_edge(c, b)
+            push_edge(a, c)
+        indices.extend((a, b, c))
+    if state['pos'] + 16 != len(data):
+        raise ValueError("Index stream has {} bytes, {} decoded".format(len(data), state['pos'] + 16))
+    return numpy.array(indices, dtype='<u{}'.format(stride)).tobytes()
+
+
+def _round(values):
+    return numpy.where(values >= 0, values + 0.5, values - 0.5).astype(numpy.int32)
+
+
+def decode_filter(data, filter_, stride):
+    '''Applies an OCTAHEDRAL or QUATERNION filter.  Returns (n, 4) integers.'''
+    if filter_ == 'OCTAHEDRAL':
+        values = numpy.frombuffer(data, dtype='<i1' if stride == 4 else '<i2').reshape(-1, 4)
+        one = float(numpy.iinfo(values.dtype).max)
+        x = values[:, 0].astype(numpy.float64)
+        y = values[:, 1].astype(numpy.float64)
+        z = values[:, 2] - numpy.abs(x) - numpy.abs(y)
+        t = numpy.minimum(z, 0)
+        x = x + numpy.where(x >= 0, t, -t)
+        y = y + numpy.where(y >= 0, t, -t)
+        scale = one / numpy.sqrt(x * x + y * y + z * z)
+        decoded = values.astype(numpy.int32)
+        decoded[:, 0] = _round(x * scale)
+        decoded[:, 1] = _round(y * scale)
+        decoded[:, 2] = _round(z * scale)
+        return decoded
+    if filter_ == 'QUATERNION':
+        values = numpy.frombuffer(data, dtype='<i2').reshape(-1, 4)
+        scale = (1 / numpy.sqrt(2.0)) / (values[:, 3] | 3)
+        xyz = values[:, :3] * scale[:, None]
+        w = numpy.sqrt(numpy.maximum(1 - (xyz * xyz).sum(axis=1), 0))
+        largest = values[:, 3] & 3
+        rows = numpy.arange(len(values))
+        decoded = numpy.empty(values.shape, dtype=numpy.int32)
+        for i in range(3):
+            decoded[rows, (largest + i + 1) & 3] = _round(xyz[:, i] * 32767)
+        decoded[rows, largest] = (w * 32767 + 0.5).astype(numpy.int32)
+        return decoded
+    raise ValueError("Unknown filter {}".format(filter_))
+
+
+def check(file_path):
+    '''Decodes the compressed bufferViews of a .gltf and compares them with the
+    fallback data.  Filtered values may be off by one, the codecs must match
+    exactly.  Returns the number of bufferViews checked.'''
+    checked = 0
+    with glTFImport.GLTFReader(file_path) as reader:
+        for index, view_def in enumerate(reader.document.get('bufferViews', [])):
+            meshopt = view_def.get('extensions', {}).get('EXT_meshopt_compression')
+            if not meshopt:
+                continue
+            start = meshopt.get('byteOffset', 0)
+            stream = reader.buffers[meshopt['buffer']][start:start + meshopt['byteLength']]
+            count, stride = meshopt['count'], meshopt['byteStride']
+            if meshopt['mode'] == 'ATTRIBUTES':
+                decoded = decode_vertex_buffer(stream, count, stride)
+            elif meshopt['mode'] == 'TRIANGLES':
+                decoded = decode_index_buffer(stream, count, stride)
+            else:
+                raise ValueError("Unsupported mode {}".format(meshopt['mode']))
+            fallback = bytes(reader.buffer_view(index))
+            filter_ = meshopt.get('filter', 'NONE')
+            if filter_ == 'NONE':
+                matches = bytes(decoded) == fallback
+            else:
+                filtered = decode_filter(bytes(decoded), filter_, stride)
+                expected = numpy.frombuffer(fallback, dtype='<i1' if stride == 4 else '<i2').reshape(-1, 4)
+                matches = numpy.abs(filtered - expected).max() <= 1
+            if not matches:
+                raise ValueError("BufferView {} ({} {}) doesn't decode to its fallback data".format(
+                                    index, meshopt['mode'], filter_))
+            checked += 1
+    return checked
+
+
+if __name__ == '__main__':
+    print('{} bufferViews decode to their fallback data'.format(check(sys.argv[1])))
@@ -0,0 +1,430 @@
+"""Reproducible exporter benchmarks against the fake maya module in benchmarks/fakemaya.
+
+Runs GLTFExporter end to end on synthetic scenes (including skinned and
+blendShape meshes), imports exported files with GLTFImporter and times
+individual stages (Buffer.append_data, Accessor, GLB writing, JSON,
+validation, accessor reads, tangent generation) in isolation.  Results are
+compared with the stored baseline so regressions show up in review.
+EXT_meshopt_compression exports are decoded with benchmarks/meshopt_decode.py
+and the run fails if they don't decode to their fallback data.
+
+    python benchmarks/run.py                 # quick tier, compare with baselines/quick.json
+    python benchmarks/run.py --tier full     # 1k to 10M triangle grids, much slower
+    python benchmarks/run.py --update        # rewrite the baseline for the tier
+    python benchmarks/run.py --case grid     # only cases whose name contains 'grid'
+
+Timings depend on the machine, so compare against a baseline recorded on the
+same hardware.  Output sizes and counters are deterministic.
+"""
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, 'fakemaya'), os.path.join(HERE, '..', 'scripts'), HERE]
+
+import glTFExport
+import glTFImport
+import scenes
+import json_emission
+import meshopt_decode
+
+TIERS = {
+    'quick': {
+        'repeat': 3,
+        'grid': [1000, 10000, 100000],
+        'deep': 200,
+        'wide': 2000,
+        'materials': (500, 100, 20),
+        'props': 100,
+        'animation': (50, 240),
+        'skinned': (10000, 40),
+        'blendshapes': (10000, 50),
+        'cluttered': 500,
+        'stage_items': 100000,
+        'json_nodes': 10000,
+    },
+    'full': {
+        'repeat': 1,
+        'grid': [1000, 10000, 100000, 1000000, 10000000],
+        'deep': 500,
+        'wide': 50000,
+        'materials': (5000, 1000, 100),
+        'props': 1000,
+        'animation': (500, 2400),
+        'skinned': (1000000, 200),
+        'blendshapes': (100000, 200),
+        'cluttered': 20000,
+        'stage_items': 5000000,
+        'json_nodes': 100000,
+    },
+}
+# Only flag timing changes above this ratio and this many seconds
+REGRESSION_RATIO = 1.3
+REGRESSION_MIN_SECONDS = 0.05
+
+
+def export_case(out_file, **options):
+    '''Exports the current fake scene and returns its metrics.'''
+    start = time.time()
+    report = glTFExport.export(out_file, profile=True, **options)
+    elapsed = time.time() - start
+    output_bytes = sum(os.path.getsize(os.path.join(os.path.dirname(out_file), name))
+                        for name in os.listdir(os.path.dirname(out_file)))
+    return {'seconds': elapsed,
+            'output_bytes': output_bytes,
+            'phases': dict((phase['name'], phase['seconds'])
+                            for phase in report['phases']['children']),
+            'counters': report['counters']}
+
+
+def find_phase(phase, name):
+    '''Depth first search of a profiler report phase tree.'''
+    if phase['name'] == name:
+        return phase
+    for child in phase.get('children', []):
+        found = find_phase(child, name)
+        if found:
+            return found
+    return None
+
+
+def stage_tangents(out_file, triangles, texture_dir):
+    '''Times only tangent generation on a normal mapped grid with mirrored UVs.'''
+    scenes.normal_mapped_scene(triangles, texture_dir, mirrored=True)
+    report = glTFExport.export(out_file, profile=True)
+    return {'seconds': find_phase(report['phases'], 'tangents')['seconds'],
+            'output_bytes': os.path.getsize(out_file),
+            'counters': {'tangent_splits': report['counters']['tangent_splits'],
+                         'vertices': report['counters']['vertices']}}
+
+
+def cache_case(case_dir, triangles, modified=False):
+    '''Times an export of a grid that is already in the export cache.  With
+    modified the scene has unsaved changes, so only the mesh blobs are reused.'''
+    scenes.grid_scene(triangles)
+    scenes.save_scene(os.path.join(case_dir, 'grid.mb'))
+    out_file = os.path.join(case_dir, 'out', 'grid.glb')
+    cache_dir = os.path.join(case_dir, 'cache')
+    glTFExport.export(out_file, cache_dir=cache_dir)
+    scenes.save_scene(os.path.join(case_dir, 'grid.mb'), modified=modified)
+    return export_case(out_file, cache_dir=cache_dir)
+
+
+def meshopt_case(out_file):
+    '''Exports the current fake scene with EXT_meshopt_compression and its fallback
+    buffer, then decodes the streams and compares them with the fallback data.'''
+    metrics = export_case(out_file, resource_format='bin', meshopt=True,
+                            meshopt_fallback=True, meshopt_filters=True)
+    metrics['counters']['meshopt_decoded_views'] = meshopt_decode.check(out_file)
+    return metrics
+
+
+def snapshot_case(case_dir, triangles, encode=False):
+    '''Times writing a snapshot of a grid, or with encode turning one into a glb
+    the way a machine without Maya would.'''
+    scenes.grid_scene(triangles)
+    snapshot = os.path.join(case_dir, 'snapshot', 'grid.npz')
+    if encode:
+        glTFExport.export_snapshot(snapshot)
+        out_file = os.path.join(case_dir, 'out', 'grid.glb')
+        start = time.time()
+        report = glTFExport.encode_snapshot(snapshot, out_file, profile=True)
+    else:
+        out_file = snapshot
+        start = time.time()
+        report = glTFExport.export_snapshot(snapshot, profile=True)
+    return {'seconds': time.time() - start,
+            'output_bytes': os.path.getsize(out_file),
+            'phases': dict((phase['name'], phase['seconds'])
+                            for phase in report['phases']['children']),
+            'counters': report['counters']}
+
+
+def stage_append_data(count):
+    ctx = glTFExport.ExportContext()
+    buffer = glTFExport.Buffer(ctx, 'bench')
+    data = [(float(i), float(i) + 0.5, -float(i)) for i in range(count)]
+    start = time.time()
+    buffer.append_data(data, 'fff')
+    return {'seconds': time.time() - start, 'output_bytes': len(buffer)}
+
+
+def stage_accessor(count):
+    ctx = glTFExport.ExportContext()
+    buffer = glTFExport.Buffer(ctx, 'bench')
+    data = [(float(i), float(i) + 0.5, -float(i)) for i in range(count)]
+    start = time.time()
+    glTFExport.Accessor(ctx, data, 'VEC3', glTFExport.ComponentTypes.FLOAT, 34962, buffer)
+    return {'seconds': time.time() - start, 'output_bytes': len(buffer)}
+
+
+def stage_glb_write(out_file, triangles):
+    scenes.grid_scene(triangles)
+    exporter = glTFExport.GLTFExporter(out_file)
+    glTFExport.Scene(exporter.ctx)
+    exporter._build_document()
+    json_str = json.dumps(exporter.output, separators=(',', ':'))
+    start = time.time()
+    exporter._write_glb(json_str)
+    return {'seconds': time.time() - start, 'output_bytes': os.path.getsize(out_file)}
+
+
+def stage_validate(triangles):
+    scenes.grid_scene(triangles)
+    ctx = glTFExport.ExportContext()
+    glTFExport.Scene(ctx)
+    start = time.time()
+    issues = glTFExport.Validator(ctx).run()
+    return {'seconds': time.time() - start, 'output_bytes': len(ctx.buffers[0]),
+            'counters': {'issues': len(issues)}}
+
+
+def import_case(in_file, triangles, **options):
+    '''Exports a grid with the exporter, then times importing it into an empty scene.'''
+    scenes.grid_scene(triangles)
+    glTFExport.export(in_file, **options)
+    scenes.empty_scene()
+    importer = glTFImport.GLTFImporter(in_file)
+    start = time.time()
+    importer.run()
+    elapsed = time.time() - start
+    input_bytes = sum(os.path.getsize(os.path.join(os.path.dirname(in_file), name))
+                        for name in os.listdir(os.path.dirname(in_file)))
+    return {'seconds': elapsed, 'output_bytes': input_bytes,
+            'phases': {'parse': importer.timings['parse'], 'build': importer.timings['build']}}
+
+
+def stage_read_accessors(in_file, triangles):
+    '''Times parsing a GLB and getting views on all of its accessors.'''
+    scenes.grid_scene(triangles)
+    glTFExport.export(in_file)
+    start = time.time()
+    with glTFImport.GLTFReader(in_file) as reader:
+        for index in range(len(reader.document['accessors'])):
+            reader.accessor(index)
+    return {'seconds': time.time() - start, 'output_bytes': os.path.getsize(in_file)}
+
+
+def stage_json(node_count):
+    exporter = json_emission.build_nodes(node_count)
+    exporter.output = {}
+    start = time.time()
+    exporter._build_document()
+    json_str = json.dumps(exporter.output, sort_keys=True, separators=(',', ':'))
+    return {'seconds': time.time() - start, 'output_bytes': len(json_str)}
+
+
+def build_cases(tier, work_dir):
+    settings = TIERS[tier]
+    texture_dir = os.path.join(work_dir, 'textures')
+    cases = []
+
+    def out(name):
+        case_dir = os.path.join(work_dir, name)
+        if os.path.isdir(case_dir):
+            shutil.rmtree(case_dir)
+        os.makedirs(case_dir)
+        return case_dir
+
+    def add(name, func):
+        cases.append((name, func))
+
+    for triangles in settings['grid']:
+        add('export/grid/{}'.format(triangles),
+            lambda t=triangles: (scenes.grid_scene(t),
+                                    export_case(os.path.join(out('grid'), 'grid.glb')))[1])
+    add('export/grid_colors_ubyte/{}'.format(settings['grid'][-1]),
+        lambda: (scenes.grid_scene(settings['grid'][-1], colors=True),
+                    export_case(os.path.join(out('grid_colors'), 'grid.glb'), color_format='ubyte'))[1])
+    add('export/grid_meshopt/{}'.format(settings['grid'][-1]),
+        lambda: (scenes.grid_scene(settings['grid'][-1]),
+                    export_case(os.path.join(out('grid_meshopt'), 'grid.glb'), meshopt=True,
+                                meshopt_fallback=False, meshopt_filters=True))[1])
+    add('export/grid_meshopt_decode/{}'.format(settings['grid'][-1]),
+        lambda: (scenes.grid_scene(settings['grid'][-1]),
+                    meshopt_case(os.path.join(out('grid_meshopt_decode'), 'grid.gltf')))[1])
+    add('export/grid_tiles/{}'.format(settings['grid'][-1]),
+        lambda: (scenes.grid_scene(settings['grid'][-1]),
+                    export_case(os.path.join(out('grid_tiles'), 'grid.glb'), buffer_layout='tiles',
+                                tile_triangles=max(settings['grid'][-1] // 16, 1)))[1])
+    # enough vertices to need 32-bit indices
+    short_triangles = max(settings['grid'][-1], 200000)
+    add('export/grid_short_indices/{}'.format(short_triangles),
+        lambda: (scenes.grid_scene(short_triangles),
+                    export_case(os.path.join(out('grid_short_indices'), 'grid.glb'), short_indices=True))[1])
+    add('export/props/{}'.format(settings['props']),
+        lambda: (scenes.props_scene(settings['props'], os.path.join(texture_dir, 'props')),
+                    export_case(os.path.join(out('props'), 'props.glb')))[1])
+    add('export/props_atlas/{}'.format(settings['props']),
+        lambda: (scenes.props_scene(settings['props'], os.path.join(texture_dir, 'props')),
+                    export_case(os.path.join(out('props_atlas'), 'props.glb'), atlas=True))[1])
+    add('export/deep/{}'.format(settings['deep']),
+        lambda: (scenes.deep_hierarchy(settings['deep']),
+                    export_case(os.path.join(out('deep'), 'deep.glb')))[1])
+    add('export/wide/{}'.format(settings['wide']),
+        lambda: (scenes.wide_hierarchy(settings['wide']),
+                    export_case(os.path.join(out('wide'), 'wide.glb')))[1])
+    meshes, materials, textures = settings['materials']
+    add('export/materials/{}x{}x{}'.format(meshes, materials, textures),
+        lambda: (scenes.material_scene(meshes, materials, textures, texture_dir),
+                    export_case(os.path.join(out('materials'), 'materials.glb')))[1])
+    add('export/materials_gltf_bin/{}x{}x{}'.format(meshes, materials, textures),
+        lambda: (scenes.material_scene(meshes, materials, textures, texture_dir),
+                    export_case(os.path.join(out('materials_bin'), 'materials.gltf'),
+                                resource_format='bin'))[1])
+    add('export/materials_split_buffers/{}x{}x{}'.format(meshes, materials, textures),
+        lambda: (scenes.material_scene(meshes, materials, textures, texture_dir),
+                    export_case(os.path.join(out('materials_split'), 'materials.gltf'),
+                                resource_format='bin', buffer_layout='split'))[1])
+    nodes, frames = settings['animation']
+    add('export/animation/{}x{}'.format(nodes, frames),
+        lambda: (scenes.animated_scene(nodes, frames),
+                    export_case(os.path.join(out('animation'), 'animation.glb')))[1])
+    add('export/animation_spline/{}x{}'.format(nodes, frames),
+        lambda: (scenes.animated_scene(nodes, frames, 'spline'),
+                    export_case(os.path.join(out('animation'), 'animation_spline.glb')))[1])
+    add('export/animation_meshopt_decode/{}x{}'.format(nodes, frames),
+        lambda: (scenes.animated_scene(nodes, frames),
+                    meshopt_case(os.path.join(out('animation_meshopt'), 'animation.gltf')))[1])
+    skinned, joints = settings['skinned']
+    add('export/skinned/{}x{}'.format(skinned, joints),
+        lambda: (scenes.skinned_scene(skinned, joints),
+                    export_case(os.path.join(out('skinned'), 'skinned.glb')))[1])
+    shaped, targets = settings['blendshapes']
+    add('export/blendshapes/{}x{}'.format(shaped, targets),
+        lambda: (scenes.blendshape_scene(shaped, targets, frames=48),
+                    export_case(os.path.join(out('blendshapes'), 'blendshapes.glb')))[1])
+    assets = settings['cluttered']
+    add('export/cluttered/{}'.format(assets),
+        lambda: (scenes.cluttered_scene(assets),
+                    export_case(os.path.join(out('cluttered'), 'cluttered.glb')))[1])
+    add('export/cluttered_optimized/{}'.format(assets),
+        lambda: (scenes.cluttered_scene(assets),
+                    export_case(os.path.join(out('cluttered'), 'cluttered.glb'), optimize_scene=True))[1])
+    add('export/cache_hit/{}'.format(settings['grid'][-1]),
+        lambda: cache_case(out('cache_hit'), settings['grid'][-1]))
+    add('export/mesh_cache_hit/{}'.format(settings['grid'][-1]),
+        lambda: cache_case(out('mesh_cache_hit'), settings['grid'][-1], modified=True))
+    add('export/embedded_gltf/{}'.format(settings['grid'][-1]),
+        lambda: (scenes.grid_scene(settings['grid'][-1]),
+                    export_case(os.path.join(out('embedded'), 'grid.gltf'),
+                                resource_format='embedded'))[1])
+    add('export/snapshot/{}'.format(settings['grid'][-1]),
+        lambda: snapshot_case(out('snapshot'), settings['grid'][-1]))
+    add('export/snapshot_encode/{}'.format(settings['grid'][-1]),
+        lambda: snapshot_case(out('snapshot_encode'), settings['grid'][-1], encode=True))
+    for triangles in settings['grid']:
+        add('import/grid_glb/{}'.format(triangles),
+            lambda t=triangles: import_case(os.path.join(out('import'), 'grid.glb'), t))
+    add('import/grid_gltf_bin/{}'.format(settings['grid'][-1]),
+        lambda: import_case(os.path.join(out('import_bin'), 'grid.gltf'), settings['grid'][-1],
+                            resource_format='bin'))
+
+    items = settings['stage_items']
+    add('stage/buffer_append_data/{}'.format(items), lambda: stage_append_data(items))
+    add('stage/accessor/{}'.format(items), lambda: stage_accessor(items))
+    add('stage/glb_write/{}'.format(settings['grid'][-1]),
+        lambda: stage_glb_write(os.path.join(out('glb_write'), 'grid.glb'), settings['grid'][-1]))
+    for triangles in settings['grid']:
+        add('stage/tangents/{}'.format(triangles),
+            lambda t=triangles: stage_tangents(os.path.join(out('tangents'), 'grid.glb'), t, texture_dir))
+    add('stage/json/{}'.format(settings['json_nodes']), lambda: stage_json(settings['json_nodes']))
+    add('stage/validate/{}'.format(settings['grid'][-1]), lambda: stage_validate(settings['grid'][-1]))
+    add('stage/read_accessors/{}'.format(settings['grid'][-1]),
+        lambda: stage_read_accessors(os.path.join(out('read'), 'grid.glb'), settings['grid'][-1]))
+    return cases
+
+
+def run_cases(cases, repeat, pattern=None):
+    results = {}
+    for name, func in cases:
+        if pattern and pattern not in name:
+            continue
+        best = None
+        for _ in range(repeat):
+            gc.collect()
+            metrics = func()
+            if best is None or metrics['seconds'] < best['seconds']:
+                best = metrics
+        results[name] = best
+        print('{:<48} {:>9.3f} s {:>12} bytes'.format(name, best['seconds'], best['output_bytes']))
+        sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline):
+    '''Prints differences against the baseline and returns the number of regressions.'''
+    regressions = 0
+    for name, metrics in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            print('{:<48} new case'.format(name))
+            continue
+        notes = []
+        ratio = metrics['seconds'] / max(base['seconds'], 1e-9)
+        if ratio > REGRESSION_RATIO and metrics['seconds'] > REGRESSION_MIN_SECONDS:
+            notes.append('SLOWER x{:.2f}'.format(ratio))
+            regressions += 1
+        elif ratio < 1.0 / REGRESSION_RATIO and base['seconds'] > REGRESSION_MIN_SECONDS:
+            notes.append('faster x{:.2f}'.format(1.0 / ratio))
+        if metrics['output_bytes'] != base['output_bytes']:
+            notes.append('size {} -> {}'.format(base['output_bytes'], metrics['output_bytes']))
+        if notes:
+            print('{:<48} {}'.format(name, ', '.join(notes)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tier', choices=sorted(TIERS), default='quick')
+    parser.add_argument('--case', help='only run cases whose name contains this string')
+    parser.add_argument('--update', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--output', help='also write results to this json file')
+    args = parser.parse_args()
+
+    baseline_path = os.path.join(HERE, 'baselines', '{}.json'.format(args.tier))
+    work_dir = tempfile.mkdtemp(prefix='glTFBench')
+    try:
+        cases = build_cases(args.tier, work_dir)
+        results = run_cases(cases, TIERS[args.tier]['repeat'], args.case)
+    finally:
+        shutil.rmtree(work_dir)
+
+    document = {'environment': {'python': platform.python_version(),
+                                'platform': platform.platform(),
+                                'machine': platform.machine()},
+                'tier': args.tier,
+                'results': results}
+    regressions = 0
+    if os.path.exists(baseline_path) and not args.update:
+        with open(baseline_path) as infile:
+            baseline = json.load(infile)['results']
+        print('\nCompared with {}'.format(os.path.relpath(baseline_path)))
+        regressions = compare(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(document, outfile, indent=2, sort_keys=True)
+    if args.update:
+        if args.case and os.path.exists(baseline_path):
+            with open(baseline_path) as infile:
+                merged = json.load(infile)
+            merged['results'].update(results)
+            merged['environment'] = document['environment']
+            document = merged
+        with open(baseline_path, 'w') as outfile:
+            json.dump(document, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+        print('Baseline written to {}'.format(os.path.relpath(baseline_path)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
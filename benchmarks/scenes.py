@@ -0,0 +1,299 @@
+"""Synthetic scene generators for the fake maya module.
+
+Every generator starts from an empty scene (default cameras only) and is
+deterministic, so results are comparable between runs.
+"""
+import math
+import os
+import random
+import struct
+import zlib
+
+from maya import _scene
+
+
+def grid_mesh(name, triangles, parent=None, material=None, colors=False):
+    '''Creates a transform with a square grid mesh of roughly the given triangle count.'''
+    quads = max(1, int(math.sqrt(triangles / 2.0)))
+    xform = _scene.create_node('transform', name, parent=parent)
+    shape = _scene.create_node('mesh', name + 'Shape', parent=xform)
+    side = quads + 1
+    points = []
+    uvs = []
+    for j in range(side):
+        for i in range(side):
+            x, z = i / float(quads), j / float(quads)
+            points.append((x - 0.5, 0.1 * math.sin(x * 6.0) * math.cos(z * 6.0), z - 0.5))
+            uvs.append((x, z))
+    face_counts = []
+    face_connects = []
+    for j in range(quads):
+        for i in range(quads):
+            first = j * side + i
+            face_counts.append(4)
+            face_connects.extend([first, first + side, first + side + 1, first + 1])
+    normals = [(0.0, 1.0, 0.0)] * len(points)
+    vertex_colors = None
+    if colors:
+        vertex_colors = [(p[0] + 0.5, 0.5, p[2] + 0.5, 1.0) for p in points]
+    shape.mesh = _scene.FakeMeshData(points, face_counts, face_connects,
+                                        normals, list(face_connects),
+                                        uvs, list(face_connects), vertex_colors)
+    if material is None:
+        material = default_material()
+    _scene.connect(shape, material_shading_group(material))
+    return xform
+
+
+def default_material():
+    if 'lambert1' not in _scene.nodes:
+        lambert = _scene.create_node('lambert', 'lambert1')
+        lambert.attrs.update({'color': (0.5, 0.5, 0.5), 'transparency': (0.0, 0.0, 0.0)})
+    return _scene.nodes['lambert1']
+
+
+def material_shading_group(material):
+    name = material.path + 'SG'
+    if name not in _scene.nodes:
+        shading_group = _scene.create_node('shadingEngine', name)
+        _scene.connect(material, shading_group, 'surfaceShader')
+    return _scene.nodes[name]
+
+
+def stingray_material(name, color_map=None, normal_map=None):
+    material = _scene.create_node('StingrayPBS', name)
+    material.attrs.update({'base_color': (0.8, 0.8, 0.8), 'metallic': 0.0, 'roughness': 0.5,
+                            'emissive': (0.0, 0.0, 0.0), 'emissive_intensity': 1.0,
+                            'use_color_map': color_map is not None,
+                            'use_normal_map': normal_map is not None,
+                            'use_metallic_map': False, 'use_roughness_map': False,
+                            'use_emissive_map': False})
+    for attr, file_node in (('TEX_color_map', color_map), ('TEX_normal_map', normal_map)):
+        if file_node is not None:
+            _scene.connect(file_node, material, attr)
+    return material
+
+
+def file_texture(name, path):
+    file_node = _scene.create_node('file', name)
+    file_node.attrs['fileTextureName'] = path
+    return file_node
+
+
+def write_png(path, size=16, seed=0):
+    '''Writes a small valid RGB png.'''
+    rand = random.Random(seed)
+    rows = b''.join(b'\x00' + bytes(bytearray(rand.randint(0, 255) for _ in range(size * 3)))
+                    for _ in range(size))
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+    with open(path, 'wb') as outfile:
+        outfile.write(b'\x89PNG\r\n\x1a\n')
+        outfile.write(chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)))
+        outfile.write(chunk(b'IDAT', zlib.compress(rows)))
+        outfile.write(chunk(b'IEND', b''))
+
+
+def save_scene(path, modified=False):
+    '''Gives the current scene a file on disk, optionally with unsaved changes on top.'''
+    with open(path, 'w') as outfile:
+        outfile.write('fake scene {}\n'.format(len(_scene.nodes)))
+    _scene.scene_name = path
+    _scene.modified = modified
+
+
+def empty_scene():
+    _scene.reset()
+
+
+def grid_scene(triangles, colors=False):
+    _scene.reset()
+    grid_mesh('grid', triangles, colors=colors)
+
+
+def deep_hierarchy(depth, triangles_per_leaf=2):
+    _scene.reset()
+    parent = None
+    for level in range(depth):
+        parent = _scene.create_node('transform', 'level{}'.format(level), parent=parent)
+        parent.attrs['translate'] = (0.0, 1.0, 0.0)
+    grid_mesh('leaf', triangles_per_leaf, parent=parent)
+
+
+def wide_hierarchy(width, triangles_per_leaf=2):
+    _scene.reset()
+    root = _scene.create_node('transform', 'root')
+    for index in range(width):
+        child = grid_mesh('child{}'.format(index), triangles_per_leaf, parent=root)
+        child.attrs['translate'] = (float(index % 100), 0.0, float(index // 100))
+
+
+def material_scene(meshes, materials, textures, texture_dir):
+    '''meshes spread over materials which share a smaller set of textures.'''
+    _scene.reset()
+    if not os.path.isdir(texture_dir):
+        os.makedirs(texture_dir)
+    file_nodes = []
+    for index in range(textures):
+        path = os.path.join(texture_dir, 'tex{}.png'.format(index))
+        write_png(path, seed=index)
+        file_nodes.append(file_texture('file{}'.format(index), path))
+    mats = [stingray_material('mat{}'.format(index), color_map=file_nodes[index % textures])
+            for index in range(materials)]
+    for index in range(meshes):
+        grid_mesh('prop{}'.format(index), 8, material=mats[index % materials])
+
+
+def props_scene(props, texture_dir, normal_maps=True):
+    '''Small props with a material and textures of their own, in a few sizes.'''
+    _scene.reset()
+    if not os.path.isdir(texture_dir):
+        os.makedirs(texture_dir)
+    for index in range(props):
+        size = (16, 32, 64)[index % 3]
+        color_path = os.path.join(texture_dir, 'prop{}_color.png'.format(index))
+        write_png(color_path, size=size, seed=index)
+        normal_map = None
+        if normal_maps:
+            normal_path = os.path.join(texture_dir, 'prop{}_normal.png'.format(index))
+            write_png(normal_path, size=size, seed=props + index)
+            normal_map = file_texture('prop{}NormalFile'.format(index), normal_path)
+        material = stingray_material('prop{}Material'.format(index),
+                                        color_map=file_texture('prop{}ColorFile'.format(index), color_path),
+                                        normal_map=normal_map)
+        grid_mesh('prop{}'.format(index), 8, material=material)
+
+
+def animated_scene(nodes, frames, tangent='linear'):
+    '''Keys every other frame on all axes.  Non linear tangents also stagger
+    the keys per axis so the curves have to be merged.'''
+    _scene.reset()
+    rand = random.Random(0)
+    for index in range(nodes):
+        xform = grid_mesh('anim{}'.format(index), 2)
+        for attr in ('translate', 'rotate', 'scale'):
+            for offset, axis in enumerate('XYZ'):
+                base = 1.0 if attr == 'scale' else 0.0
+                start = 1 if tangent == 'linear' else 1 + offset
+                keys = [(float(frame), base + rand.uniform(-1, 1))
+                        for frame in range(start, frames + 1, 2 if tangent == 'linear' else 3)]
+                _scene.set_keys(xform, attr + axis, keys, tangent)
+
+
+def original_shape(shape, deformer):
+    '''The intermediate shape Maya keeps the undeformed mesh in, going into deformer.'''
+    orig = _scene.create_node('mesh', shape.short_name + 'Orig', parent=shape.parent)
+    orig.attrs['intermediateObject'] = True
+    orig.mesh = shape.mesh
+    _scene.connect(orig, deformer, 'inMesh')
+    return orig
+
+
+def skinned_scene(triangles, joints, influences=6, frames=0):
+    '''A grid bound to a joint chain along x, each vertex weighted to its nearest joints.'''
+    _scene.reset()
+    xform = grid_mesh('body', triangles)
+    shape = xform.children[0]
+    step = 1.0 / max(1, joints - 1)
+    chain = []
+    parent = None
+    for index in range(joints):
+        joint = _scene.create_node('joint', 'joint{}'.format(index), parent=parent)
+        joint.attrs['translate'] = (-0.5 if parent is None else step, 0.0, 0.0)
+        chain.append(joint)
+        parent = joint
+    skin = _scene.create_node('skinCluster', 'skinCluster1')
+    skin.attrs['envelope'] = 1.0
+    skin.attrs['geomMatrix'] = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                                0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+    for index in range(joints):
+        # inverse of the joint's world matrix at bind time
+        skin.attrs['bindPreMatrix[{}]'.format(index)] = [
+            1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0, 0.5 - index * step, 0.0, 0.0, 1.0]
+    skin.influences = [joint.path for joint in chain]
+    weights = []
+    for point in shape.mesh.points:
+        position = (point[0] + 0.5) / step
+        row = [0.0] * joints
+        nearest = sorted(range(joints), key=lambda j: abs(j - position))[:influences]
+        for joint in nearest:
+            row[joint] = 1.0 / (1.0 + abs(joint - position))
+        weights.append(row)
+    skin.weights = weights
+    original_shape(shape, skin)
+    _scene.connect(skin, shape, 'inMesh')
+    rand = random.Random(0)
+    for joint in chain[1:]:
+        if frames:
+            keys = [(float(frame), rand.uniform(-30, 30)) for frame in range(1, frames + 1, 2)]
+            _scene.set_keys(joint, 'rotateZ', keys)
+
+
+def blendshape_scene(triangles, targets, region=0.05, frames=0):
+    '''A grid with a blendShape whose targets each move a small patch of vertices,
+    plus one target that moves the whole grid.'''
+    _scene.reset()
+    xform = grid_mesh('face', triangles)
+    shape = xform.children[0]
+    blend = _scene.create_node('blendShape', 'blendShape1')
+    blend.attrs['envelope'] = 1.0
+    rand = random.Random(0)
+    points = shape.mesh.points
+    for index in range(targets):
+        name = 'target{}'.format(index)
+        blend.attrs['weight[{}]'.format(index)] = 0.0
+        blend.aliases[name] = 'weight[{}]'.format(index)
+        if index == 0:
+            blend.targets[index] = dict((vertex, (0.0, 0.2, 0.0)) for vertex in range(len(points)))
+            continue
+        center = rand.choice(points)
+        blend.targets[index] = dict(
+            (vertex, (0.0, 0.1 * rand.random(), 0.0)) for vertex, point in enumerate(points)
+            if abs(point[0] - center[0]) < region and abs(point[2] - center[2]) < region)
+        if frames:
+            keys = [(float(frame), rand.random()) for frame in range(1, frames + 1, 4)]
+            _scene.set_keys(blend, 'weight[{}]'.format(index), keys)
+    original_shape(shape, blend)
+    _scene.connect(blend, shape, 'inMesh')
+
+
+def normal_mapped_scene(triangles, texture_dir, mirrored=False):
+    '''A grid with a normal mapped StingrayPBS material, optionally with the
+    UVs mirrored across the middle so tangent handedness flips there.'''
+    _scene.reset()
+    if not os.path.isdir(texture_dir):
+        os.makedirs(texture_dir)
+    path = os.path.join(texture_dir, 'normal.png')
+    write_png(path)
+    material = stingray_material('normalMapped', normal_map=file_texture('normalFile', path))
+    xform = grid_mesh('grid', triangles, material=material)
+    if mirrored:
+        mesh = xform.children[0].mesh
+        mesh.uvs = [(abs(u - 0.5) * 2.0, v) for u, v in mesh.uvs]
+
+
+def cluttered_scene(assets, triangles_per_mesh=8):
+    '''Assets laid out like a production layout: each has an offset group over
+    its geometry, a hidden helper, an empty locator group, a proxy on a hidden
+    display layer and an animated part.  Half of the transforms can be optimized away.'''
+    _scene.reset()
+    layer = _scene.create_node('displayLayer', 'proxyLayer')
+    layer.attrs['visibility'] = False
+    for index in range(assets):
+        asset = _scene.create_node('transform', 'asset{}'.format(index))
+        asset.attrs['translate'] = (float(index % 50) * 2.0, 0.0, float(index // 50) * 2.0)
+        offset = _scene.create_node('transform', 'offset{}'.format(index), parent=asset)
+        # non uniform scale over a rotated child shears on every other asset
+        offset.attrs['scale'] = (2.0, 1.0, 1.0) if index % 2 else (1.0, 2.0, 1.0)
+        offset.attrs['translate'] = (0.0, 0.5, 0.0)
+        geo = grid_mesh('geo{}'.format(index), triangles_per_mesh, parent=offset)
+        geo.attrs['rotate'] = (0.0, 30.0, 0.0)
+        helper = grid_mesh('helper{}'.format(index), 2, parent=asset)
+        helper.attrs['visibility'] = False
+        _scene.create_node('transform', 'locator{}'.format(index), parent=asset)
+        proxy = grid_mesh('proxy{}'.format(index), 2, parent=asset)
+        _scene.connect(layer, proxy, 'drawOverride')
+        spin = grid_mesh('spin{}'.format(index), 2, parent=asset)
+        _scene.set_keys(spin, 'rotateY', [(1.0, 0.0), (24.0, 360.0)])
@@ -1,7 +1,6 @@
 import os
 import sys
 import maya.OpenMayaMPx as OpenMayaMPx
-import glTFExport
 
 
 PLUGIN_NAME = "glTF Export"
@@ -16,12 +15,14 @@ class GLTFTranslator(OpenMayaMPx.MPxFileTranslator):
     def haveWriteMethod(self):
         return True
     def haveReadMethod(self):
-        return False
+        return True
     def filter(self):
         return "*.{}".format(FILE_EXT)
     def defaultExtension(self):
         return FILE_EXT
     def writer( self, file_obj, opt_string, access_mode ): 
+        # imported on the first export so loading the plug-in stays cheap
+        import glTFExport
         fullName = file_obj.fullName()
         try:
             if access_mode == OpenMayaMPx.MPxFileTranslator.kExportAccessMode:
@@ -61,9 +62,16 @@ class GLTFTranslator(OpenMayaMPx.MPxFileTranslator):
                 
     
     def reader( self, fileObject, optionString, accessMode ):
-        raise NotImplementedError()
+        # imported here so the exporter keeps working without numpy
+        import glTFImport
+        try:
+            self._parse_args(optionString)
+            glTFImport.import_file(fileObject.fullName(), vflip=self.kwargs.get('vflip', True))
+        except:
+            sys.stderr.write( "Failed to read file information\n")
+            raise
 
-    def identifyFile (file_obj, buffer, size):
+    def identifyFile (self, file_obj, buffer, size):
         basename, ext = os.path.splitext(file_obj.fullName())
         if ext not in ['.glb', '.gltf']:
             return OpenMayaMPx.MPxFileTranslator.kNotMyFileType
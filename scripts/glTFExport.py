@@ -1,38 +1,173 @@
 from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import division
+import array
 import json
 import struct
+import tempfile
 import os
 import sys
 import base64
+import contextlib
+import hashlib
 import math
+import re
 import shutil
+import threading
 import time
 
-import maya.cmds
-import maya.OpenMaya as OpenMaya
 try:
-    from PySide.QtGui import QImage, QColor, qRed, qGreen, qBlue, QImageWriter
-    from PySide.QtCore import QByteArray
+    import maya.cmds
+    import maya.OpenMaya as OpenMaya
 except ImportError:
-    from PySide2.QtGui import QImage, QColor, qRed, qGreen, qBlue, QImageWriter
-    from PySide2.QtCore import QByteArray
+    # only snapshots can be encoded without Maya, see encode_snapshot
+    maya = OpenMaya = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# Qt is only needed for textures and is slow to load, see _import_qt
+QImage = QColor = qRed = qGreen = qBlue = QImageWriter = QByteArray = None
+_qt_lock = threading.Lock()
+
+class Profiler(object):
+    '''Collects nested phase timings, counters and peak memory for an export.
+    
+    Phases with the same name under the same parent are aggregated, so a phase
+    entered once per mesh shows up as a single entry with a call count.
+    '''
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.cmds_calls = {}
+        self._root = self._new_phase('export')
+        self._stack = [self._root]
+    
+    @staticmethod
+    def _new_phase(name):
+        return {'name': name, 'seconds': 0.0, 'calls': 0, 'children': []}
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        parent = self._stack[-1]
+        matches = [child for child in parent['children'] if child['name'] == name]
+        if matches:
+            entry = matches[0]
+        else:
+            entry = self._new_phase(name)
+            parent['children'].append(entry)
+        self._stack.append(entry)
+        start = time.time()
+        try:
+            yield
+        finally:
+            entry['seconds'] += time.time() - start
+            entry['calls'] += 1
+            self._stack.pop()
+    
+    def count(self, key, amount=1):
+        if self.enabled:
+            self.counters[key] = self.counters.get(key, 0) + amount
+    
+    @contextlib.contextmanager
+    def count_cmds(self):
+        '''Counts the exporter's maya.cmds calls on this thread by command.'''
+        if not self.enabled or cmds is None:
+            yield
+            return
+        with cmds.counting(self.cmds_calls):
+            yield
+    
+    def report(self):
+        self._root['seconds'] = sum(child['seconds'] for child in self._root['children'])
+        self._root['calls'] = 1
+        report = {'phases': self._root,
+                    'counters': dict(self.counters),
+                    'cmds_calls': dict(self.cmds_calls),
+                    'peak_memory_bytes': _peak_memory_bytes()}
+        try:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                report['python_peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        except ImportError:
+            pass
+        return report
+
 
-# TODO don't export hidden nodes?
+class _CountingCmds(object):
+    '''Wraps maya.cmds for the exporter, which calls it through the module's cmds.
+    While an export is profiled its calls are counted into the counts registered
+    by the calling thread, so concurrent exports keep separate counts and tools
+    calling maya.cmds themselves aren't counted.'''
+    
+    def __init__(self, cmds):
+        self._cmds = cmds
+        self._local = threading.local()
+    
+    @contextlib.contextmanager
+    def counting(self, counts):
+        previous = getattr(self._local, 'counts', None)
+        self._local.counts = counts
+        try:
+            yield
+        finally:
+            self._local.counts = previous
+    
+    def __getattr__(self, name):
+        func = getattr(self._cmds, name)
+        if not callable(func):
+            return func
+        local = self._local
+        def counted(*args, **kwargs):
+            counts = getattr(local, 'counts', None)
+            if counts is not None:
+                counts[name] = counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        # cache so later lookups skip __getattr__
+        setattr(self, name, counted)
+        return counted
 
-def timeit(method):
 
-    def timed(*args, **kw):
-        ts = time.time()
-        result = method(*args, **kw)
-        te = time.time()
+# maya.cmds as the exporter calls it
+cmds = _CountingCmds(maya.cmds) if maya is not None else None
 
-        print('%r (%r, %r) %2.2f sec' % \
-              (method.__name__, args, kw, te-ts))
-        return result
 
-    return timed
+def _peak_memory_bytes():
+    '''Returns the peak resident set size of the process or None if unavailable.'''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        if sys.platform == 'darwin':
+            return peak
+        return peak * 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        import ctypes.wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', ctypes.wintypes.DWORD),
+                        ('PageFaultCount', ctypes.wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        pass
+    return None
 
 class ResourceFormats(object):
     EMBEDDED = 'embedded'
@@ -44,266 +179,1179 @@ class AnimOptions(object):
     KEYED = 'keyed'
     BAKED = 'baked'
 
-class ClassPropertyDescriptor(object):
-
-    def __init__(self, fget):
-        self.fget = fget
-
-    def __get__(self, obj, klass=None):
-        if klass is None:
-            klass = type(obj)
-        return self.fget.__get__(obj, klass)()
-
-    def __set__(self, obj, value):
-        raise AttributeError("can't set attribute")
-
-def classproperty(func):
-    if not isinstance(func, (classmethod, staticmethod)):
-        func = classmethod(func)
-    return ClassPropertyDescriptor(func)
-        
 class ExportSettings(object):
-    file_format = 'gltf'
+    '''Options of one export.  The class attributes are the defaults, options
+    passed in are set on the instance.'''
+    file_format = 'glb'
     resource_format = 'bin'
     anim = 'keyed'
     vflip=True
     out_file = ''
-    _out_dir = ''
-    _out_basename = ''
+    # Top level maya nodes to export, None exports all assemblies
+    nodes = None
+    # Significant digits kept for node TRS and material factors.  None keeps full precision.
+    transform_precision = None
+    material_precision = None
+    sort_keys = True
+    # True to collect an export report, 'cprofile' to also capture cProfile stats
+    profile = False
+    profile_file = False
+    # True to check the output and print issues, 'strict' to fail the export on issues
+    validate = False
+    # Generate TANGENT for meshes with a normal mapped material, needs numpy
+    tangents = True
+    # COLOR_0 storage: 'float', or normalized 'ushort' or 'ubyte'
+    color_format = 'float'
+    # Export skinClusters as glTF skins and blendShapes as morph targets, need numpy
+    skin = True
+    morph_targets = True
+    # Prune and collapse the node hierarchy: True for all SceneOptimizer rules or a list of rule names
+    optimize_scene = False
+    # Directory of the ExportCache shared by exports, and its size limit in bytes
+    cache_dir = None
+    cache_size = 4 * 1024 ** 3
+    # 'single' packs everything into one buffer, 'split' into one per top level node's
+    # geometry, one for animation and one per image, each its own .bin file.  'tiles' is
+    # 'split' with a buffer of its own for every mesh tile, see tile_triangles.
+    buffer_layout = 'single'
+    # Buffers over this many bytes continue in a new chunk.  None only splits at the 4GB glTF limit.
+    max_buffer_size = None
+    # Meshes with more triangles are split into spatially compact tiles of at most this
+    # many, each its own mesh under its own node, needs numpy.  Skinned and morphed
+    # meshes are kept whole.  None keeps every mesh whole.
+    tile_triangles = None
+    # Split meshes with more than 65535 vertices into primitives that fit 16-bit indices,
+    # needs numpy.  Primitives of up to 255 vertices get 8-bit indices unless meshopt is
+    # on, whose index codec takes 16 and 32-bit ones.  Skinned and morphed meshes are kept whole.
+    short_indices = False
+    # Compress bufferViews with EXT_meshopt_compression, needs numpy.  The fallback keeps
+    # the uncompressed data for viewers without the extension.  Filters are True for all
+    # MeshoptCompressor.filters or a list of filter names.
+    meshopt = False
+    meshopt_fallback = True
+    meshopt_filters = False
+    # Pack the textures of materials into shared atlases and merge the materials, needs numpy.
+    # True for every material or a list of material names.  Atlases are at most atlas_size
+    # pixels wide and high, with atlas_padding edge pixels around each texture.
+    atlas = False
+    atlas_size = 4096
+    atlas_padding = 4
+    atlas_workers = 4
+    # True to print where the output bytes go and write them to <name>.size.json,
+    # listing the size_report_top largest items of each kind.  'strict' also fails
+    # the export before anything is written if one of the size_budgets is exceeded.
+    # Budgets are bytes per name: 'total', 'json', 'meshes', 'skins', 'animations'
+    # and 'images' limit totals, 'mesh', 'skin', 'channel' and 'image' every item.
+    size_report = False
+    size_report_top = 10
+    size_budgets = None
     
-    @classmethod
-    def set_defaults(cls):
-        cls.file_format = 'glb'
-        cls.resource_format = 'bin'
-        cls.anim = 'keyed'
-        cls.vflip=True
-        cls.out_file = ''
+    def __init__(self, **options):
+        for key, value in options.items():
+            if key.startswith('_') or not hasattr(ExportSettings, key):
+                raise TypeError("Unknown export option: {}".format(key))
+            setattr(self, key, value)
+    
+    def options(self):
+        '''All option values, defaults included.'''
+        return dict((key, getattr(self, key)) for key, value in vars(ExportSettings).items()
+                    if not key.startswith('_') and not (callable(value) or isinstance(value, property)))
     
-    @classproperty
-    def out_bin(cls):
-        return cls.out_basename + '.bin'
+    @property
+    def out_bin(self):
+        return self.out_basename + '.bin'
     
-    @classproperty    
-    def out_basename(cls):
-        base, ext = os.path.splitext(cls.out_file)
-        cls._out_basename = os.path.basename(base)
-        return cls._out_basename
+    @property
+    def out_basename(self):
+        base, ext = os.path.splitext(self.out_file)
+        return os.path.basename(base)
         
-    @classproperty
-    def out_dir(cls):
-        cls._out_dir = os.path.dirname(cls.out_file)
-        return cls._out_dir
+    @property
+    def out_dir(self):
+        return os.path.dirname(self.out_file)
+
+
+class ExportContext(object):
+    '''Owns everything one export builds: its settings, profiler, the glTF item
+    registries and the buffers.
     
+    Every ExportItem is created in a context and keeps a reference to it, so
+    several exports can be built in one process and written out in parallel.
+    '''
+    def __init__(self, settings=None):
+        self.settings = settings or ExportSettings()
+        self.profiler = Profiler(enabled=bool(self.settings.profile))
+        self.scenes = []
+        self.nodes = []
+        # maya node path -> Node, for resolving skin joints
+        self.nodes_by_maya_node = {}
+        # SceneOptimizer that chose the exported nodes, if optimize_scene is on
+        self.scene_graph = None
+        # MeshoptCompressor that compressed the bufferViews, if meshopt is on
+        self.meshopt = None
+        # TextureAtlas that merged the materials, if atlas is on
+        self.atlas = None
+        # SizeReport of the output, if size_report is on
+        self.size_report = None
+        # the atlas decides which images are written, so they're stored after it ran
+        self.defer_images = bool(self.settings.atlas)
+        self.extensions_used = []
+        self.extensions_required = []
+        self.cache = None
+        if self.settings.cache_dir:
+            self.cache = ExportCache(self.settings.cache_dir, self.settings.cache_size)
+        self.meshes = []
+        self.skins = []
+        self.materials = []
+        self.default_material = None
+        self.cameras = []
+        self.animations = []
+        self.images = []
+        self.textures = []
+        self.buffers = []
+        # buffer group -> its chunks in order
+        self.buffer_groups = {}
+        self.buffer_views = []
+        self.accessors = []
+    
+    def buffer_for(self, group, tile=None):
+        '''The buffer to append the data of a group, or of one tile of a group's
+        mesh, to.  Every group shares the primary buffer unless buffer_layout is
+        'split', with 'tiles' every tile also gets a buffer of its own.'''
+        layout = self.settings.buffer_layout
+        if layout == 'tiles' and tile is not None:
+            key = '{}_tile{}'.format(group, tile)
+        elif layout in ('split', 'tiles'):
+            key = group
+        else:
+            key = 'primary_buffer'
+        chunks = self.buffer_groups.get(key)
+        if not chunks:
+            buffer = Buffer(self, key)
+            buffer.origin = (group, tile)
+            return buffer
+        return chunks[-1]
+    
+    def fit(self, buffer, nbytes):
+        '''The chunk of buffer's group that can take nbytes more, starting a new
+        one when the last would grow past max_buffer_size or the glTF limit.'''
+        limit = Buffer.max_length
+        if self.settings.max_buffer_size:
+            limit = min(limit, self.settings.max_buffer_size)
+        if nbytes > Buffer.max_length:
+            raise ValueError("{} bytes don't fit in a glTF buffer".format(nbytes))
+        buffer = self.buffer_groups[buffer.group][-1]
+        if len(buffer) and len(buffer) + nbytes > limit:
+            origin = buffer.origin
+            buffer = Buffer(self, buffer.group)
+            buffer.origin = origin
+        return buffer
+    
+    
+class ExportCache(object):
+    '''On-disk cache of finished exports and welded mesh data, shared between
+    sessions and machines.
+    
+    exports/<fingerprint>/ holds the files of a finished export.  A later export
+    with the same fingerprint hard-links them, or copies them across devices,
+    instead of exporting.  meshes/<key>.bin holds the welded vertex arrays of
+    one mesh keyed by its Maya data, so scenes where only some meshes changed
+    still skip welding the others.  Least recently used entries are evicted
+    once the cache is larger than max_bytes.
+    '''
+    blob_magic = b'glTFMeshBlob1\n'
+    # options that don't change the written files
+    ignored_options = ('out_file', 'profile', 'profile_file', 'cache_dir', 'cache_size')
+    _version = None
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.exports_dir = os.path.join(cache_dir, 'exports')
+        self.meshes_dir = os.path.join(cache_dir, 'meshes')
+        for path in (self.exports_dir, self.meshes_dir):
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    # created by another export in the meantime
+                    if not os.path.isdir(path):
+                        raise
+    
+    @classmethod
+    def exporter_version(cls):
+        '''Hash of this module, so any change to the exporter invalidates the cache.'''
+        if cls._version is None:
+            source = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+            with open(source if os.path.exists(source) else __file__, 'rb') as infile:
+                cls._version = hashlib.sha1(infile.read()).hexdigest()
+        return cls._version
+    
+    @staticmethod
+    def _file_state(path):
+        path = re.sub(r'\{\d+\}$', '', path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [path, None, None]
+        return [path, stat.st_mtime, stat.st_size]
+    
+    def fingerprint(self, settings):
+        '''Hash of everything the export reads: the scene file, its references and
+        textures, the current time, the options and the exporter.  None if the scene
+        has unsaved changes.'''
+        scene_file = cmds.file(query=True, sceneName=True)
+        if not scene_file or cmds.file(query=True, modified=True):
+            return None
+        digest = hashlib.sha1(self.exporter_version().encode('latin-1'))
+        options = settings.options()
+        for key in self.ignored_options:
+            del options[key]
+        # the .gltf refers to its .bin by name
+        options['out_name'] = os.path.basename(settings.out_file)
+        # changing the time doesn't mark the scene modified, yet the node
+        # transforms, static poses and morph weights are read at it
+        options['current_time'] = [cmds.currentTime(query=True),
+                                   cmds.currentUnit(query=True, time=True)]
+        digest.update(json.dumps(options, sort_keys=True).encode('latin-1'))
+        with open(scene_file, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+                digest.update(chunk)
+        paths = set(cmds.file(query=True, reference=True) or [])
+        for file_node in cmds.ls(type='file') or []:
+            paths.add(cmds.getAttr(file_node + '.fileTextureName'))
+        states = [self._file_state(path) for path in sorted(paths)]
+        digest.update(json.dumps(states).encode('utf-8'))
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _link(src, dst):
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except (OSError, AttributeError):
+            shutil.copy2(src, dst)
+    
+    def restore(self, fingerprint, out_dir):
+        '''Links the cached files of an export into out_dir.  Returns False on a miss.'''
+        entry = os.path.join(self.exports_dir, fingerprint)
+        manifest = os.path.join(entry, 'manifest.json')
+        try:
+            with open(manifest) as infile:
+                names = json.load(infile)
+            for name in names:
+                self._link(os.path.join(entry, name), os.path.join(out_dir, name))
+            os.utime(manifest, None)
+        except (OSError, IOError, ValueError):
+            return False
+        return True
+    
+    def store(self, fingerprint, out_dir, names):
+        entry = os.path.join(self.exports_dir, fingerprint)
+        if os.path.exists(entry):
+            return
+        staging = tempfile.mkdtemp(prefix=fingerprint, dir=self.exports_dir)
+        try:
+            for name in names:
+                self._link(os.path.join(out_dir, name), os.path.join(staging, name))
+            with open(os.path.join(staging, 'manifest.json'), 'w') as outfile:
+                json.dump(names, outfile)
+            os.rename(staging, entry)
+        except OSError:
+            # another export stored it first
+            shutil.rmtree(staging, ignore_errors=True)
+    
+    def load_mesh(self, key):
+        '''Returns the {name: array.array} stored for key, or None.'''
+        path = os.path.join(self.meshes_dir, key + '.bin')
+        try:
+            with open(path, 'rb') as infile:
+                if infile.readline() != self.blob_magic:
+                    return None
+                header = json.loads(infile.readline().decode('latin-1'))
+                arrays = {}
+                for name, code, length in header:
+                    data = array.array(code)
+                    _array_extend(data, infile.read(length))
+                    if sys.byteorder == 'big':
+                        data.byteswap()
+                    arrays[name] = data
+            os.utime(path, None)
+        except (OSError, IOError, ValueError):
+            return None
+        return arrays
+    
+    def store_mesh(self, key, arrays):
+        '''arrays is a list of (name, type code, flat array.array or numpy array).'''
+        header = []
+        chunks = []
+        for name, code, data in arrays:
+            chunk = _packed_bytes(data, code)
+            header.append([name, code, len(chunk)])
+            chunks.append(chunk)
+        handle, staging = tempfile.mkstemp(prefix=key, dir=self.meshes_dir)
+        with os.fdopen(handle, 'wb') as outfile:
+            outfile.write(self.blob_magic)
+            outfile.write(json.dumps(header).encode('latin-1') + b'\n')
+            for chunk in chunks:
+                outfile.write(chunk)
+        try:
+            os.rename(staging, os.path.join(self.meshes_dir, key + '.bin'))
+        except OSError:
+            os.remove(staging)
+    
+    def evict(self):
+        '''Removes the least recently used entries until the cache fits in max_bytes.'''
+        entries = []
+        for name in os.listdir(self.exports_dir):
+            entry = os.path.join(self.exports_dir, name)
+            manifest = os.path.join(entry, 'manifest.json')
+            if not os.path.exists(manifest):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, item)) for item in os.listdir(entry))
+            entries.append((os.path.getmtime(manifest), size, entry))
+        for name in os.listdir(self.meshes_dir):
+            if name.endswith('.bin'):
+                path = os.path.join(self.meshes_dir, name)
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            total -= size
+
     
 class GLTFExporter(object):
-    # TODO: Add VFlip option
-    def __init__(self, file_path, resource_format='bin', anim='keyed', vflip=True):
+    '''Exports one file.  collect() reads the scene from Maya and must run on
+    the main thread, write() only touches the export context and can run on
+    any thread.  run() does both.'''
+    def __init__(self, file_path, resource_format='bin', anim='keyed', vflip=True, **kwargs):
         self.output = {
             "asset": { 
                 "version": "2.0", 
                 "generator": "maya-glTFExport", 
             }
         }
-        ExportSettings.set_defaults()
-        Scene.set_defaults()
-        Node.set_defaults()
-        Mesh.set_defaults()
-        Material.set_defaults()
-        Camera.set_defaults()
-        Animation.set_defaults()
-        Image.set_defaults()
-        Texture.set_defaults()
-        Buffer.set_defaults()
-        BufferView.set_defaults()
-        Accessor.set_defaults()
-        
-        ExportSettings.out_file = file_path
-        ExportSettings.resource_format = resource_format
-        ExportSettings.anim = anim
-        ExportSettings.vflip = vflip
-        
+        settings = ExportSettings(out_file=file_path, resource_format=resource_format,
+                                    anim=anim, vflip=vflip, **kwargs)
+        self.ctx = ExportContext(settings)
+        self._cprofile = None
+        self._fingerprint = None
+        # outputs were linked from the export cache
+        self._restored = False
+        # collecting for a snapshot, which the encoder post-processes
+        self._snapshot = False
+    
     def run(self):
-        if not ExportSettings.out_file:
-            ExportSettings.out_file = maya.cmds.fileDialog2(caption="Specify a name for the file to export.",
+        self.collect()
+        return self.write()
+    
+    def collect(self):
+        settings = self.ctx.settings
+        if not settings.out_file:
+            settings.out_file = cmds.fileDialog2(caption="Specify a name for the file to export.",
                                                         fileMode=0)[0]
-        basename, ext = os.path.splitext(ExportSettings.out_file)
+        self._prepare()
+        with self._cprofiling():
+            with self.ctx.profiler.count_cmds():
+                if self.ctx.cache and not self._snapshot:
+                    with self.ctx.profiler.phase('cache lookup'):
+                        self._fingerprint = self.ctx.cache.fingerprint(settings)
+                        self._restored = bool(self._fingerprint
+                                                and self.ctx.cache.restore(self._fingerprint, settings.out_dir))
+                    if self._restored:
+                        self.ctx.profiler.count('export_cache_hits')
+                        return
+                # TODO: validate file_path and type
+                with self.ctx.profiler.phase('traversal'):
+                    Scene(self.ctx)
+                
+                if not self.ctx.scenes[0].nodes:
+                    raise RuntimeError('Scene is empty.  No file will be exported.')
+                if settings.atlas:
+                    self._atlas()
+                if self.ctx.defer_images and not self._snapshot:
+                    for image in self.ctx.images:
+                        image.store()
+                if settings.validate and not self._snapshot:
+                    with self.ctx.profiler.phase('validation'):
+                        self._validate()
+    
+    def snapshot(self, snapshot_path, embed_images=False):
+        '''Collects the scene and writes it to a Snapshot instead of a glTF file,
+        for encode() to finish without Maya.  Returns the report if profiling.'''
+        self._snapshot = True
+        # images go into the snapshot as files, not into its buffers
+        self.ctx.defer_images = True
+        # keeps the buffer group of every accessor for the layout chosen when encoding
+        self.ctx.settings.buffer_layout = 'tiles'
+        self.ctx.settings.max_buffer_size = None
+        self.collect()
+        with self._cprofiling():
+            with self.ctx.profiler.phase('snapshot'):
+                Snapshot.write(self.ctx, snapshot_path, embed_images)
+        return self._report()
+    
+    def encode(self, snapshot_path):
+        '''Writes the glTF file of a snapshot.  Only the export settings that apply
+        after collection are used: file and resource format, buffers, meshopt,
+        validation and the size report.  Returns the report if profiling.'''
+        self._prepare()
+        with self._cprofiling():
+            with self.ctx.profiler.phase('snapshot'):
+                Snapshot.read(self.ctx, snapshot_path)
+            if self.ctx.settings.validate:
+                with self.ctx.profiler.phase('validation'):
+                    self._validate()
+        return self.write()
+    
+    def _prepare(self):
+        '''Checks the output file, creates its directory and sets up cProfile.'''
+        settings = self.ctx.settings
+        basename, ext = os.path.splitext(settings.out_file)
         if not ext in ['.glb', '.gltf']:
             raise Exception("Output file must have gltf or glb extension.")
-        ExportSettings.file_format = ext[1:]  
+        settings.file_format = ext[1:]  
         
-        if not os.path.exists(ExportSettings.out_dir):
-            os.makedirs(ExportSettings.out_dir)
+        if not os.path.exists(settings.out_dir):
+            os.makedirs(settings.out_dir)
         
-        # TODO: validate file_path and type
-        scene = Scene()
+        if settings.profile == 'cprofile':
+            import cProfile
+            self._cprofile = cProfile.Profile()
+    
+    def write(self):
+        '''Serializes and writes the collected export, returns the report if profiling.'''
+        settings = self.ctx.settings
+        profiler = self.ctx.profiler
+        with self._cprofiling():
+            if not self._restored:
+                if settings.meshopt:
+                    self._compress()
+                with profiler.phase('serialization'):
+                    self._build_document()
+                json_str = None
+                if settings.file_format == 'glb':
+                    with profiler.phase('serialization'):
+                        json_str = json.dumps(self.output, sort_keys=settings.sort_keys, separators=(',', ':'))
+                if settings.size_report:
+                    with profiler.phase('size report'):
+                        self._size_report(json_str)
+                if settings.file_format == 'glb':
+                    with profiler.phase('write'):
+                        self._write_glb(json_str)
+                else:
+                    with profiler.phase('write'):
+                        self._write_gltf()
+                if self._fingerprint:
+                    with profiler.phase('cache store'):
+                        self.ctx.cache.store(self._fingerprint, settings.out_dir, self._output_files())
+            if self.ctx.cache:
+                with profiler.phase('cache eviction'):
+                    self.ctx.cache.evict()
+        return self._report()
+    
+    def _report(self):
+        settings = self.ctx.settings
+        profiler = self.ctx.profiler
+        if not profiler.enabled:
+            return None
+        report = profiler.report()
+        report['counters']['accessors'] = len(self.ctx.accessors)
+        report['counters']['buffer_bytes'] = dict((buffer.name, len(buffer)) for buffer in self.ctx.buffers)
+        if self.ctx.scene_graph:
+            report['removed_nodes'] = dict(self.ctx.scene_graph.removed)
+        if self.ctx.meshopt:
+            report['meshopt'] = list(self.ctx.meshopt.stats)
+        if self.ctx.atlas:
+            report['atlas'] = dict(self.ctx.atlas.stats)
+        if self.ctx.size_report:
+            report['size'] = dict(self.ctx.size_report.stats)
+        out_base = os.path.join(settings.out_dir, settings.out_basename)
+        if self._cprofile:
+            report['cprofile_file'] = out_base + '.prof'
+            self._cprofile.dump_stats(report['cprofile_file'])
+        if settings.profile_file:
+            with open(out_base + '.profile.json', 'w') as outfile:
+                json.dump(report, outfile, indent=2, sort_keys=True)
+        return report
+    
+    def _output_files(self):
+        '''Names of the written files in the output directory.'''
+        settings = self.ctx.settings
+        names = [os.path.basename(settings.out_file)]
+        names.extend(buffer.uri for buffer in self.ctx.buffers if buffer.uri)
+        names.extend(image.uri for image in self.ctx.images
+                        if image.uri and not isinstance(image.uri, DataURI))
+        return names
+    
+    @contextlib.contextmanager
+    def _cprofiling(self):
+        # cProfile only sees the thread it is enabled on, so each stage enables it
+        if not self._cprofile:
+            yield
+            return
+        self._cprofile.enable()
+        try:
+            yield
+        finally:
+            self._cprofile.disable()
+    
+    def _compress(self):
+        if numpy is None:
+            print("EXT_meshopt_compression skipped, numpy is not available.")
+            return
+        with self.ctx.profiler.phase('meshopt compression'):
+            self.ctx.meshopt = MeshoptCompressor(self.ctx, self.ctx.settings.meshopt_filters)
+            self.ctx.meshopt.run()
+        print(self.ctx.meshopt.summary())
+    
+    def _atlas(self):
+        if numpy is None:
+            print("Texture atlas skipped, numpy is not available.")
+            return
+        with self.ctx.profiler.phase('texture atlas'):
+            self.ctx.atlas = TextureAtlas(self.ctx, self.ctx.settings.atlas)
+            self.ctx.atlas.run()
+        print(self.ctx.atlas.summary())
+    
+    def _size_report(self, json_str):
+        '''Prints and writes the SizeReport, raises SizeBudgetError in strict mode
+        if a budget is exceeded.  Runs before any output file is written.'''
+        settings = self.ctx.settings
+        if json_str is None:
+            encoder = GLTFEncoder(sort_keys=settings.sort_keys, separators=(',', ':'))
+            report = SizeReport(self.ctx, self.output, encoder.encoded_length(self.output), encoder.data_uris)
+        else:
+            report = SizeReport(self.ctx, self.output, len(json_str))
+        self.ctx.size_report = report
+        report.run()
+        print(report.summary(settings.size_report_top))
+        out_base = os.path.join(settings.out_dir, settings.out_basename)
+        with open(out_base + '.size.json', 'w') as outfile:
+            json.dump(report.stats, outfile, indent=2, sort_keys=True)
+        if report.exceeded and settings.size_report == 'strict':
+            first = report.exceeded[0]
+            raise SizeBudgetError("{} size budget(s) exceeded, first: {} {} bytes over the {} budget of {}".format(
+                                    len(report.exceeded), first['name'], first['bytes'], first['budget'],
+                                    first['limit']))
+    
+    def _validate(self):
+        if numpy is None:
+            if self.ctx.settings.validate == 'strict':
+                raise RuntimeError("Strict validation requires numpy.")
+            print("glTF validation skipped, numpy is not available.")
+            return
+        issues = Validator(self.ctx).run()
+        self.ctx.profiler.count('validation_issues', len(issues))
+        for issue in issues:
+            print("glTF validation: {}".format(issue))
+        if issues and self.ctx.settings.validate == 'strict':
+            raise ValidationError("{} validation issue(s), first: {}".format(len(issues), issues[0]))
+    
+    def _write_glb(self, json_str):
+        json_bin = bytearray(json_str.encode(encoding='latin-1'))
+        # 4-byte-aligned
+        aligned_len = (len(json_bin) + 3) & ~3
+        for i in range(aligned_len - len(json_bin)):
+            json_bin.extend(b' ')
+
+        bin_out = bytearray()
+        file_length = 12 + 8 + len(json_bin)
+        buffers = self.ctx.buffers
+        if buffers:
+            buffer = buffers[0]
+            file_length += 8 + len(buffer)
+        # Magic number
+        bin_out.extend(struct.pack('<I', 0x46546C67)) # glTF in binary
+        bin_out.extend(struct.pack('<I', 2)) # version number
+        bin_out.extend(struct.pack('<I', file_length))
+        bin_out.extend(struct.pack('<I', len(json_bin)))
+        bin_out.extend(struct.pack('<I', 0x4E4F534A)) # JSON in binary
+        bin_out += json_bin
+        
+        if buffers:
+            bin_out.extend(struct.pack('<I', len(buffer))) 
+            bin_out.extend(struct.pack('<I', 0x004E4942)) # BIN in binary
+        
+        _release_output(self.ctx.settings.out_file)
+        with open(self.ctx.settings.out_file, 'wb') as outfile:
+            outfile.write(bin_out)
+            if buffers:
+                # written separately to avoid copying the whole buffer
+                outfile.write(buffer.byte_str)
+        self._write_bins()
+    
+    def _write_gltf(self):
+        settings = self.ctx.settings
+        _release_output(settings.out_file)
+        with open(settings.out_file, 'w') as outfile:
+            encoder = GLTFEncoder(sort_keys=settings.sort_keys, separators=(',', ':'))
+            encoder.dump(self.output, outfile)
+        self._write_bins()
+    
+    def _write_bins(self):
+        '''Writes every buffer with a uri to its own .bin file.'''
+        for buffer in self.ctx.buffers:
+            if not buffer.uri:
+                continue
+            bin_path = self.ctx.settings.out_dir + "/" + buffer.uri
+            _release_output(bin_path)
+            with open(bin_path, 'wb') as outfile:
+                outfile.write(buffer.byte_str)
+    
+    def _build_document(self):
+        '''Fills self.output with plain JSON types in a single pass over the registries,
+        so the JSON encoder never has to call back into the ExportItem classes.'''
+        ctx = self.ctx
         # we only support exporting single scenes, 
         # so the first scene is the active scene
         self.output['scene'] = 0
-        if Scene.instances:
-            self.output['scenes'] = Scene.instances
-        if Node.instances:
-            self.output['nodes'] = Node.instances
-        if Mesh.instances:
-            self.output['meshes'] = Mesh.instances
-        if Camera.instances:
-            self.output['cameras'] = Camera.instances
-        if Material.instances:
-            self.output['materials'] = Material.instances
-        if Image.instances:
-            self.output['images'] = Image.instances
-        if Texture.instances:
-            self.output['textures'] = Texture.instances
-        if Animation.instances and Animation.instances[0].channels:
-            self.output['animations'] = Animation.instances
-        if Buffer.instances:
-            self.output['buffers'] = Buffer.instances
-        if BufferView.instances:
-            self.output['bufferViews'] = BufferView.instances
-        if Accessor.instances:
-            self.output['accessors'] = Accessor.instances
-        
-        if not Scene.instances[0].nodes:
-            raise RuntimeError('Scene is empty.  No file will be exported.')
-        if ExportSettings.file_format == 'glb':
-            
-            json_str = json.dumps(self.output, sort_keys=True, separators=(',', ':'), cls=GLTFEncoder)
-            json_bin = bytearray(json_str.encode(encoding='latin-1'))
-            # 4-byte-aligned
-            aligned_len = (len(json_bin) + 3) & ~3
-            for i in range(aligned_len - len(json_bin)):
-                json_bin.extend(b' ')
-
-            bin_out = bytearray()
-            file_length = 12 + 8 + len(json_bin)
-            if Buffer.instances:
-                buffer = Buffer.instances[0]
-                file_length += 8 + len(buffer)
-            # Magic number
-            bin_out.extend(struct.pack('<I', 0x46546C67)) # glTF in binary
-            bin_out.extend(struct.pack('<I', 2)) # version number
-            bin_out.extend(struct.pack('<I', file_length))
-            bin_out.extend(struct.pack('<I', len(json_bin)))
-            bin_out.extend(struct.pack('<I', 0x4E4F534A)) # JSON in binary
-            bin_out += json_bin
-            
-            if Buffer.instances:
-                bin_out.extend(struct.pack('<I', len(buffer))) 
-                bin_out.extend(struct.pack('<I', 0x004E4942)) # BIN in binary
-                bin_out += buffer.byte_str
-            
-            with open(ExportSettings.out_file, 'wb') as outfile:
-                outfile.write(bin_out)
-        else:
-            with open(ExportSettings.out_file, 'w') as outfile:
-                json.dump(self.output, outfile, cls=GLTFEncoder)
-            
-            if (ExportSettings.resource_format == ResourceFormats.BIN
-                    and Buffer.instances):
-                buffer = Buffer.instances[0]
-                with open(ExportSettings.out_dir + "/" + buffer.uri, 'wb') as outfile:
-                    outfile.write(buffer.byte_str)
+        registries = [('scenes', ctx.scenes),
+                        ('nodes', ctx.nodes),
+                        ('meshes', ctx.meshes),
+                        ('skins', ctx.skins),
+                        ('cameras', ctx.cameras),
+                        ('materials', ctx.materials),
+                        ('images', ctx.images),
+                        ('textures', ctx.textures),
+                        ('buffers', ctx.buffers),
+                        ('bufferViews', ctx.buffer_views),
+                        ('accessors', ctx.accessors)]
+        if ctx.animations and ctx.animations[0].channels:
+            registries.append(('animations', ctx.animations))
+        for key, instances in registries:
+            if instances:
+                self.output[key] = [item.to_json() for item in instances]
+        if ctx.extensions_used:
+            self.output['extensionsUsed'] = sorted(ctx.extensions_used)
+        if ctx.extensions_required:
+            self.output['extensionsRequired'] = sorted(ctx.extensions_required)
         
-def export(file_path=None, resource_format='bin', anim='keyed', vflip=True, selection=False):
-    GLTFExporter(file_path, resource_format, anim, vflip).run()
+def export(file_path=None, resource_format='bin', anim='keyed', vflip=True, selection=False, **kwargs):
+    if selection and 'nodes' not in kwargs:
+        kwargs['nodes'] = cmds.ls(selection=True, long=True)
+    return GLTFExporter(file_path, resource_format, anim, vflip, **kwargs).run()
+
+def export_all(exports, workers=4):
+    '''Exports several files, for example one per assembly or LOD.
+    
+    exports is a list of dicts of export() arguments.  Scenes are read from Maya
+    one at a time on the calling thread while the finished ones are serialized
+    and written on up to workers threads.  Returns the reports in order.
+    '''
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        ThreadPoolExecutor = None
+    exporters = []
+    for options in exports:
+        options = dict(options)
+        if options.pop('selection', False) and 'nodes' not in options:
+            options['nodes'] = cmds.ls(selection=True, long=True)
+        exporters.append(GLTFExporter(options.pop('file_path'), **options))
+    if ThreadPoolExecutor is None or workers < 2:
+        return [exporter.run() for exporter in exporters]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for exporter in exporters:
+            exporter.collect()
+            futures.append(pool.submit(exporter.write))
+        return [future.result() for future in futures]
+
+def export_snapshot(snapshot_path, selection=False, embed_images=False, **kwargs):
+    '''Reads the scene like export() and writes it to a snapshot, which
+    encode_snapshot() turns into glTF on any machine with numpy.  Textures are
+    referenced by path unless embed_images, generated ones are always embedded.'''
+    if selection and 'nodes' not in kwargs:
+        kwargs['nodes'] = cmds.ls(selection=True, long=True)
+    # generated textures are written next to the snapshot while collecting
+    file_path = os.path.splitext(snapshot_path)[0] + '.glb'
+    return GLTFExporter(file_path, **kwargs).snapshot(snapshot_path, embed_images)
+
+def encode_snapshot(snapshot_path, file_path, **kwargs):
+    '''Writes the glTF or glb file of a snapshot from export_snapshot(), without
+    Maya.  kwargs are the export() options that apply after collection.'''
+    return GLTFExporter(file_path, **kwargs).encode(snapshot_path)
+
+def _import_qt():
+    '''Imports the Qt image classes into this module the first time textures are exported.'''
+    global QImage, QColor, qRed, qGreen, qBlue, QImageWriter, QByteArray
+    with _qt_lock:
+        if QImage is not None:
+            return
+        try:
+            from PySide.QtGui import QImage, QColor, qRed, qGreen, qBlue, QImageWriter
+            from PySide.QtCore import QByteArray
+        except ImportError:
+            from PySide2.QtGui import QImage, QColor, qRed, qGreen, qBlue, QImageWriter
+            from PySide2.QtCore import QByteArray
+
+def _array_bytes(data):
+    # array.tostring was renamed tobytes in Python 3
+    if hasattr(data, 'tobytes'):
+        return data.tobytes()
+    return data.tostring()
+
+def _array_extend(data, raw):
+    # array.fromstring was renamed frombytes in Python 3
+    if hasattr(data, 'frombytes'):
+        data.frombytes(raw)
+    else:
+        data.fromstring(raw)
+
+def _release_output(path):
+    '''Removes an output file that is hard-linked elsewhere, such as one restored
+    from the export cache, so writing it doesn't change the other links.'''
+    if os.path.exists(path) and os.stat(path).st_nlink > 1:
+        os.remove(path)
+
+def _packed_bytes(data, code):
+    '''Little-endian bytes of a flat array.array or numpy array as the given type code.'''
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return numpy.ascontiguousarray(data, dtype=numpy.dtype(code).newbyteorder('<')).tobytes()
+    if data.typecode != code or sys.byteorder == 'big':
+        data = array.array(code, data)
+        if sys.byteorder == 'big':
+            data.byteswap()
+    return _array_bytes(data)
+
+def round_floats(values, digits):
+    '''Rounds each value to the given number of significant digits.
+    Returns values unchanged if digits is None.'''
+    if digits is None:
+        return values
+    fmt = '%.{}g'.format(digits)
+    return [float(fmt % value) for value in values]
+
+def round_quaternion(quat, digits, tolerance=1e-5):
+    '''Normalizes a rotation quaternion and rounds it like round_floats, keeping
+    more digits while the rounded quaternion isn't unit length within tolerance.'''
+    if digits is None:
+        return quat
+    length = math.sqrt(sum(value * value for value in quat))
+    quat = [value / length for value in quat]
+    for digits in range(digits, 17):
+        rounded = round_floats(quat, digits)
+        if abs(math.sqrt(sum(value * value for value in rounded)) - 1.0) <= tolerance:
+            return rounded
+    return quat
+
+def multiply_matrices(a, b):
+    '''Product of two flat row-major 4x4 matrices, a applied first in Maya's row vector convention.'''
+    return [sum(a[row * 4 + k] * b[k * 4 + column] for k in range(4))
+            for row in range(4) for column in range(4)]
+
+def decompose_matrix(matrix, tolerance=1e-6):
+    '''Splits a flat Maya matrix into glTF translation, rotation quaternion and scale.
+    Returns None if the matrix has shear and can't be expressed as TRS.'''
+    rows = [matrix[0:3], matrix[4:7], matrix[8:11]]
+    scale = [math.sqrt(sum(value * value for value in row)) for row in rows]
+    if min(scale) < tolerance:
+        return None
+    rows = [[value / length for value in row] for row, length in zip(rows, scale)]
+    for i, j in ((0, 1), (0, 2), (1, 2)):
+        if abs(sum(a * b for a, b in zip(rows[i], rows[j]))) > tolerance:
+            return None
+    determinant = (rows[0][0] * (rows[1][1] * rows[2][2] - rows[1][2] * rows[2][1])
+                    - rows[0][1] * (rows[1][0] * rows[2][2] - rows[1][2] * rows[2][0])
+                    + rows[0][2] * (rows[1][0] * rows[2][1] - rows[1][1] * rows[2][0]))
+    if determinant < 0:
+        scale[0] = -scale[0]
+        rows[0] = [-value for value in rows[0]]
+    # column vector rotation matrix m[i][j] is rows[j][i]
+    m = [[rows[column][row] for column in range(3)] for row in range(3)]
+    trace = m[0][0] + m[1][1] + m[2][2]
+    if trace > 0:
+        s = 0.5 / math.sqrt(trace + 1.0)
+        quat = [(m[2][1] - m[1][2]) * s, (m[0][2] - m[2][0]) * s, (m[1][0] - m[0][1]) * s, 0.25 / s]
+    elif m[0][0] > m[1][1] and m[0][0] > m[2][2]:
+        s = 2.0 * math.sqrt(1.0 + m[0][0] - m[1][1] - m[2][2])
+        quat = [0.25 * s, (m[0][1] + m[1][0]) / s, (m[0][2] + m[2][0]) / s, (m[2][1] - m[1][2]) / s]
+    elif m[1][1] > m[2][2]:
+        s = 2.0 * math.sqrt(1.0 + m[1][1] - m[0][0] - m[2][2])
+        quat = [(m[0][1] + m[1][0]) / s, 0.25 * s, (m[1][2] + m[2][1]) / s, (m[0][2] - m[2][0]) / s]
+    else:
+        s = 2.0 * math.sqrt(1.0 + m[2][2] - m[0][0] - m[1][1])
+        quat = [(m[0][2] + m[2][0]) / s, (m[1][2] + m[2][1]) / s, 0.25 * s, (m[1][0] - m[0][1]) / s]
+    length = math.sqrt(sum(value * value for value in quat))
+    return list(matrix[12:15]), [value / length for value in quat], scale
     
         
 class GLTFEncoder(json.JSONEncoder):
+    def __init__(self, *args, **kwargs):
+        super(GLTFEncoder, self).__init__(*args, **kwargs)
+        self.data_uris = []
+        # JSON escapes the control character, so no name can encode to the same
+        # string token, and the random part keeps nested encoders apart
+        self.data_uri_token = '\x00glTFDataURI{}_'.format(base64.b16encode(os.urandom(8)).decode('ascii'))
+        self.data_uri_pattern = re.compile(re.escape(json.dumps(self.data_uri_token)[:-1]) + r'(\d+)"')
+    
     def default(self, obj):
         if isinstance(obj, ExportItem):
             return obj.to_json()
+        if isinstance(obj, DataURI):
+            # Emit a placeholder that dump() swaps for the streamed data
+            self.data_uris.append(obj)
+            return '{}{}'.format(self.data_uri_token, len(self.data_uris) - 1)
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
+    
+    def dump(self, obj, outfile):
+        '''Writes obj as JSON to outfile, streaming any DataURI values
+        straight to the file handle instead of building them in memory.'''
+        for chunk in self.iterencode(obj):
+            pos = 0
+            for match in self.data_uri_pattern.finditer(chunk):
+                outfile.write(chunk[pos:match.start()] + '"')
+                self.data_uris[int(match.group(1))].write(outfile)
+                outfile.write('"')
+                pos = match.end()
+            outfile.write(chunk[pos:])
+    
+    def encoded_length(self, obj):
+        '''Length dump() would write, without base64 encoding the data URIs.'''
+        length = 0
+        for chunk in self.iterencode(obj):
+            for match in self.data_uri_pattern.finditer(chunk):
+                length += len(self.data_uris[int(match.group(1))]) + 2 - len(match.group(0))
+            length += len(chunk)
+        return length
+
+
+class DataURI(object):
+    '''Base64 data URI that is encoded chunk by chunk when written out.'''
+    # Multiple of 3 so each chunk encodes without padding
+    chunk_size = 3 * 256 * 1024
+    
+    def __init__(self, data, mime_type='application/octet-stream'):
+        self.data = data
+        self.mime_type = mime_type
+    
+    def __len__(self):
+        return len('data:{};base64,'.format(self.mime_type)) + (len(self.data) + 2) // 3 * 4
+    
+    def write(self, outfile):
+        outfile.write('data:{};base64,'.format(self.mime_type))
+        for start in range(0, len(self.data), self.chunk_size):
+            chunk = self.data[start:start + self.chunk_size]
+            outfile.write(base64.b64encode(chunk).decode("latin-1"))
    
 class ExportItem(object):
-    def __init__(self, name=None):
+    __slots__ = ('name', 'ctx')
+    
+    def __init__(self, ctx, name=None):
+        self.ctx = ctx
         self.name = name
     
     
 class Scene(ExportItem):
     '''Needs to add itself to scenes'''
-    instances = []
     maya_nodes = None
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, name="defaultScene", maya_nodes=None):
-        super(Scene, self).__init__(name=name)
-        self.index = len(Scene.instances)
-        Scene.instances.append(self)
+    def __init__(self, ctx, name="defaultScene", maya_nodes=None):
+        super(Scene, self).__init__(ctx, name=name)
+        self.index = len(ctx.scenes)
+        ctx.scenes.append(self)
         anim = None
-        if not ExportSettings.anim == AnimOptions.NONE:
-            anim = Animation('defaultAnimation')
+        if not self.ctx.settings.anim == AnimOptions.NONE:
+            anim = Animation(self.ctx, 'defaultAnimation')
         self.nodes = []
         if maya_nodes:
             self.maya_nodes = maya_nodes
+        elif ctx.settings.nodes:
+            self.maya_nodes = cmds.ls(ctx.settings.nodes, long=True)
         else:
-            self.maya_nodes = maya.cmds.ls(assemblies=True, long=True)
-        for transform in self.maya_nodes:
-            if transform not in Camera.default_cameras:
-                self.nodes.append(Node(transform, anim))
+            self.maya_nodes = cmds.ls(assemblies=True, long=True)
+        roots = [transform for transform in self.maya_nodes
+                    if transform not in Camera.default_cameras]
+        skeletons = []
+        if ctx.settings.skin and numpy is not None:
+            skeletons = self._skeleton_roots(roots)
+            roots.extend(skeletons)
+        if ctx.settings.optimize_scene:
+            with ctx.profiler.phase('scene optimization'):
+                ctx.scene_graph = SceneOptimizer(ctx, ctx.settings.optimize_scene)
+                roots = ctx.scene_graph.run(roots)
+            ctx.profiler.count('removed_nodes', len(ctx.scene_graph.removed))
+            print(ctx.scene_graph.summary())
+        for transform in roots:
+            node = Node(self.ctx, transform, anim)
+            if transform in skeletons and transform.count('|') > 1:
+                # its parents aren't exported, keep where it is in the world
+                world = cmds.xform(transform, query=True, matrix=True, worldSpace=True)
+                trs = decompose_matrix(world)
+                if trs:
+                    node.translation, node.rotation, node.scale = trs
+                    node.matrix = None
+                else:
+                    node.matrix = world
+                    node.translation = node.rotation = node.scale = None
+            self.nodes.append(node)
+        if ctx.settings.skin:
+            self._drop_incomplete_skins()
         
     def to_json(self):
         scene_def = {"name":self.name, "nodes":[node.index for node in self.nodes]}
         return scene_def
+    
+    @staticmethod
+    def _skeleton_roots(roots):
+        '''Skin influences of the meshes under roots aren't always under roots
+        themselves, for example with a selection or a skeleton in an assembly of
+        its own.  Returns the highest parent of each such influence whose hierarchy
+        holds none of the roots, to be exported along with them.'''
+        pulled = []
+        def exported(path):
+            return any(path == root or path.startswith(root + '|') for root in roots + pulled)
+        for skin_cluster in cmds.ls(type='skinCluster') or []:
+            geometry = cmds.ls(cmds.skinCluster(skin_cluster, query=True, geometry=True) or [], long=True)
+            if not any(exported(path) for path in geometry):
+                continue
+            for influence in cmds.ls(cmds.skinCluster(skin_cluster, query=True, influence=True) or [], long=True):
+                if exported(influence):
+                    continue
+                parts = influence.split('|')
+                for i in range(2, len(parts) + 1):
+                    skeleton = '|'.join(parts[:i])
+                    if not any(root.startswith(skeleton + '|') for root in roots):
+                        break
+                print("{} exported for the influences of {}.".format(skeleton, skin_cluster))
+                pulled.append(skeleton)
+        return pulled
+    
+    def _drop_incomplete_skins(self):
+        '''Exports the meshes of skins with influences that still aren't exported
+        without their skin.  Their joint and weight data stays in the buffers.'''
+        ctx = self.ctx
+        dropped = []
+        for skin in ctx.skins:
+            missing = [joint for joint in skin.joints if joint not in ctx.nodes_by_maya_node]
+            if missing:
+                print("Skin {} not exported, its influence {} is not exported.".format(skin.name, missing[0]))
+                dropped.append(skin)
+        if not dropped:
+            return
+        ctx.skins[:] = [skin for skin in ctx.skins if skin not in dropped]
+        for index, skin in enumerate(ctx.skins):
+            skin.index = index
+        for mesh in ctx.meshes:
+            if mesh.skin in dropped:
+                mesh.skin = None
+
+
+class SceneOptimizer(object):
+    '''Decides which Maya DAG nodes become glTF nodes before any of them is extracted.
+    
+    Rules:
+        hidden - nodes and shapes with visibility off, with everything under them
+        layers - members of hidden display layers, with everything under them
+        empty - transforms left without exported shapes or children
+        collapse - a static transform whose only child is a static transform is
+                   merged into that child
+        identity - identity translation, rotation and scale are left out of nodes
+    Skin influences and their parents are never removed or collapsed.
+    '''
+    rules = ('hidden', 'layers', 'empty', 'collapse', 'identity')
+    
+    def __init__(self, ctx, rules=True):
+        self.ctx = ctx
+        if rules is True:
+            rules = self.rules
+        unknown = set(rules) - set(self.rules)
+        if unknown:
+            raise ValueError("Unknown scene optimization rules: {}".format(', '.join(sorted(unknown))))
+        self.enabled = set(rules)
+        # maya node -> rule it was removed by.  Children of removed nodes aren't listed.
+        self.removed = {}
+        # kept maya node -> shapes and transforms to export under it
+        self.children = {}
+        # kept maya node -> local matrix of the chain collapsed into it
+        self.matrices = {}
+        self.visited = 0
+        self._hidden_layers = set()
+        self._protected = set()
+        self._static = {}
+    
+    def run(self, maya_nodes):
+        '''Returns the maya nodes to export in place of maya_nodes.'''
+        if 'layers' in self.enabled:
+            self._hidden_layers = self._hidden_layer_members()
+        if self.ctx.settings.skin:
+            self._protected = self._influence_paths()
+        roots = []
+        for maya_node in maya_nodes:
+            roots.extend(self._visit(maya_node, cmds.objectType(maya_node)))
+        return roots
+    
+    def summary(self):
+        counts = {}
+        for rule in self.removed.values():
+            counts[rule] = counts.get(rule, 0) + 1
+        return "Scene optimization removed {} of {} nodes{}".format(
+                    len(self.removed), self.visited,
+                    ''.join(', {} {}'.format(rule, counts[rule]) for rule in sorted(counts)))
+    
+    def _hidden_layer_members(self):
+        members = set()
+        for layer in cmds.ls(type='displayLayer') or []:
+            if (cmds.getAttr(layer + '.enabled')
+                    and not cmds.getAttr(layer + '.visibility')):
+                members.update(cmds.editDisplayLayerMembers(layer, query=True, fullNames=True) or [])
+        return members
+    
+    def _influence_paths(self):
+        '''Skin influences and all of their parents.'''
+        paths = set()
+        for skin_cluster in cmds.ls(type='skinCluster') or []:
+            influences = cmds.skinCluster(skin_cluster, query=True, influence=True) or []
+            for path in cmds.ls(influences, long=True):
+                parts = path.split('|')
+                for i in range(2, len(parts) + 1):
+                    paths.add('|'.join(parts[:i]))
+        return paths
+    
+    def _hidden_rule(self, maya_node):
+        if maya_node in self._protected:
+            return None
+        if 'hidden' in self.enabled and not cmds.getAttr(maya_node + '.visibility'):
+            return 'hidden'
+        if maya_node in self._hidden_layers:
+            return 'layers'
+        return None
+    
+    def _is_static(self, maya_node):
+        if maya_node not in self._static:
+            self._static[maya_node] = (self.ctx.settings.anim == AnimOptions.NONE
+                    or not cmds.keyframe(maya_node, query=True, keyframeCount=True))
+        return self._static[maya_node]
+    
+    def _local_matrix(self, maya_node):
+        if maya_node in self.matrices:
+            return self.matrices[maya_node]
+        return cmds.xform(maya_node, query=True, matrix=True, objectSpace=True)
+    
+    def _visit(self, maya_node, node_type):
+        '''Returns what replaces maya_node among its parent's children: nothing,
+        maya_node itself, or the node its chain was collapsed into.'''
+        self.visited += 1
+        rule = self._hidden_rule(maya_node)
+        if rule:
+            self.removed[maya_node] = rule
+            return []
+        children = []
+        transforms = []
+        for child in cmds.listRelatives(maya_node, children=True, fullPath=True) or []:
+            child_type = cmds.objectType(child)
+            if child_type in ('transform', 'joint'):
+                kept = self._visit(child, child_type)
+                children.extend(kept)
+                # collapsed chains keep the type of their last node
+                if child_type == 'transform':
+                    transforms.extend(kept)
+            elif child_type in ('mesh', 'camera'):
+                if child_type == 'mesh' and cmds.getAttr(child + ".intermediateObject"):
+                    continue
+                rule = self._hidden_rule(child)
+                if rule:
+                    self.removed[child] = rule
+                else:
+                    children.append(child)
+        
+        if maya_node in self._protected or node_type != 'transform':
+            self.children[maya_node] = children
+            return [maya_node]
+        if not children and 'empty' in self.enabled:
+            self.removed[maya_node] = 'empty'
+            return []
+        if ('collapse' in self.enabled and len(children) == 1 and transforms
+                and self._is_static(maya_node) and self._is_static(transforms[0])):
+            child = transforms[0]
+            self.matrices[child] = multiply_matrices(self._local_matrix(child),
+                                                        self._local_matrix(maya_node))
+            self.removed[maya_node] = 'collapse'
+            return [child]
+        self.children[maya_node] = children
+        return [maya_node]
 
 
 class Node(ExportItem):
     '''Needs to add itself to nodes list, possibly node children, and possibly scene'''
-    instances = []
-    maya_node = None
-    matrix = None
-    translation = None
-    rotation = None
-    scale = None
-    camera = None
-    mesh = None
+    __slots__ = ('index', 'maya_node', 'matrix', 'translation', 'rotation', 'scale',
+                    'camera', 'mesh', 'children')
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, maya_node, anim=None):
+    def __init__(self, ctx, maya_node, anim=None):
         self.maya_node = maya_node
-        name = maya.cmds.ls(maya_node, shortNames=True)[0]
-        super(Node, self).__init__(name=name)
-        self.index = len(Node.instances)
-        Node.instances.append(self)
+        self.matrix = None
+        self.camera = None
+        self.mesh = None
+        name = cmds.ls(maya_node, shortNames=True)[0]
+        super(Node, self).__init__(ctx, name=name)
+        self.index = len(ctx.nodes)
+        ctx.nodes.append(self)
+        ctx.nodes_by_maya_node[maya_node] = self
+        self.ctx.profiler.count('nodes')
         self.children = []
-        self.translation = maya.cmds.getAttr(self.maya_node+'.translate')[0]
-        self.rotation = self._get_rotation_quaternion()
-        self.scale = maya.cmds.getAttr(self.maya_node+'.scale')[0]
+        graph = ctx.scene_graph
+        if graph and maya_node in graph.matrices:
+            trs = decompose_matrix(graph.matrices[maya_node])
+            if trs:
+                self.translation, self.rotation, self.scale = trs
+            else:
+                self.matrix = graph.matrices[maya_node]
+                self.translation = self.rotation = self.scale = None
+        else:
+            self.translation = cmds.getAttr(self.maya_node+'.translate')[0]
+            self.rotation = self._get_rotation_quaternion()
+            self.scale = cmds.getAttr(self.maya_node+'.scale')[0]
         if anim:
-            self._get_animation(anim)
-        maya_children = maya.cmds.listRelatives(self.maya_node, children=True, fullPath=True)
+            with self.ctx.profiler.phase('animation'):
+                self._get_animation(anim)
+        if graph:
+            maya_children = graph.children[self.maya_node]
+        else:
+            maya_children = cmds.listRelatives(self.maya_node, children=True, fullPath=True)
         if maya_children:
             for child in maya_children:
-                childType = maya.cmds.objectType(child)
-                if childType == 'mesh' and not maya.cmds.getAttr(child + ".intermediateObject"):
-                    mesh = Mesh(child)
-                    self.mesh = mesh 
+                childType = cmds.objectType(child)
+                if childType == 'mesh' and not cmds.getAttr(child + ".intermediateObject"):
+                    mesh = Mesh(self.ctx, child)
+                    if mesh.tiles:
+                        self.children.extend(TileNode(self.ctx, tile) for tile in mesh.tiles)
+                    else:
+                        self.mesh = mesh
                 elif childType == 'camera':
-                    if maya.cmds.camera(child, query=True, orthographic=True):
-                        cam = OrthographicCamera(child)
+                    if cmds.camera(child, query=True, orthographic=True):
+                        cam = OrthographicCamera(self.ctx, child)
                     else:
-                        cam = PerspectiveCamera(child)
+                        cam = PerspectiveCamera(self.ctx, child)
                     self.camera = cam
-                elif childType == 'transform':
-                    node = Node(child, anim)
+                elif childType in ('transform', 'joint'):
+                    node = Node(self.ctx, child, anim)
                     self.children.append(node)
+        if anim and self.mesh and self.mesh.morph_targets:
+            with self.ctx.profiler.phase('animation'):
+                if cmds.keyframe(self.mesh.morph_weight_plugs(), query=True, keyframeCount=True):
+                    weights_channel = AnimationChannel(self.ctx, self, 'weights')
+                    anim.add_channel(weights_channel)
+                    anim.add_sampler(weights_channel.sampler)
     
     def _get_animation(self, anim):
-        if maya.cmds.keyframe(self.maya_node, attribute='translate', query=True, keyframeCount=True):
-            translation_channel = AnimationChannel(self, 'translation')
+        if cmds.keyframe(self.maya_node, attribute='translate', query=True, keyframeCount=True):
+            translation_channel = AnimationChannel(self.ctx, self, 'translation')
             anim.add_channel(translation_channel)
             anim.add_sampler(translation_channel.sampler)
-        if maya.cmds.keyframe(self.maya_node, attribute='rotate', query=True, keyframeCount=True):
-            rotation_channel = AnimationChannel(self, 'rotation')
+        if cmds.keyframe(self.maya_node, attribute='rotate', query=True, keyframeCount=True):
+            rotation_channel = AnimationChannel(self.ctx, self, 'rotation')
             anim.add_channel(rotation_channel)
             anim.add_sampler(rotation_channel.sampler)
-        if maya.cmds.keyframe(self.maya_node, attribute='scale', query=True, keyframeCount=True):
-            scale_channel = AnimationChannel(self, 'scale')
+        if cmds.keyframe(self.maya_node, attribute='scale', query=True, keyframeCount=True):
+            scale_channel = AnimationChannel(self.ctx, self, 'scale')
             anim.add_channel(scale_channel)
             anim.add_sampler(scale_channel.sampler)
         
@@ -316,8 +1364,16 @@ class Node(ExportItem):
         sel_list.add(self.maya_node)
         #fill in the MObject
         sel_list.getDependNode(0,obj)
+        if obj.hasFn(OpenMaya.MFn.kJoint):
+            # joint rotation alone leaves out jointOrient and rotateAxis,
+            # so decompose the full local matrix instead
+            matrix = OpenMaya.MMatrix()
+            OpenMaya.MScriptUtil.createMatrixFromList(
+                cmds.xform(self.maya_node, query=True, matrix=True, objectSpace=True), matrix)
+            quat = OpenMaya.MTransformationMatrix(matrix).rotation()
+            quat.normalizeIt()
         #check if its a transform
-        if (obj.hasFn(OpenMaya.MFn.kTransform)):
+        elif (obj.hasFn(OpenMaya.MFn.kTransform)):
             quat = OpenMaya.MQuaternion()
             #then we can add it to transfrom Fn
             #Fn is basically the collection of functions for given objects
@@ -331,18 +1387,24 @@ class Node(ExportItem):
     
     def to_json(self):
         node_def = {}
+        precision = self.ctx.settings.transform_precision
+        graph = self.ctx.scene_graph
+        # identity values are the glTF defaults
+        drop_identity = graph is not None and 'identity' in graph.enabled
         if self.matrix:
-            node_def['matrix'] = self.matrix
-        if self.translation:
-            node_def['translation'] = self.translation
-        if self.rotation:
-            node_def['rotation'] = self.rotation
-        if self.scale:
-            node_def['scale'] = self.scale
+            node_def['matrix'] = round_floats(self.matrix, precision)
+        if self.translation and not (drop_identity and not any(self.translation)):
+            node_def['translation'] = round_floats(self.translation, precision)
+        if self.rotation and not (drop_identity and not any(self.rotation[:3])):
+            node_def['rotation'] = round_quaternion(self.rotation, precision)
+        if self.scale and not (drop_identity and all(value == 1 for value in self.scale)):
+            node_def['scale'] = round_floats(self.scale, precision)
         if self.children:
             node_def['children'] = [child.index for child in self.children]
         if self.mesh:
             node_def['mesh'] = self.mesh.index
+            if self.mesh.skin:
+                node_def['skin'] = self.mesh.skin.index
         if self.camera:
             node_def['camera'] = self.camera.index
         return node_def
@@ -350,30 +1412,62 @@ class Node(ExportItem):
         
 class Mesh(ExportItem):
     '''Needs to add itself to node and its accesors to meshes list'''
-    instances = []
     maya_node = None
     material = None
     indices_accessor = None
     position_accessor = None
     normal_accessor = None
     texcoord0_accessor = None
+    joints0_accessor = None
+    weights0_accessor = None
+    color0_accessor = None
+    tangent_accessor = None
+    skin_cluster = None
+    skin = None
+    blend_shape = None
+    # one {attribute: accessor} per blendShape target
+    morph_targets = None
+    morph_weights = None
+    morph_names = None
+    # deltas below this are treated as unchanged
+    morph_tolerance = 1e-6
+    # MeshTiles the mesh is written as instead, see ExportSettings.tile_triangles
+    tiles = None
+    # MeshParts holding the accessors of each primitive, see ExportSettings.short_indices
+    parts = None
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, maya_node):
+    def __init__(self, ctx, maya_node):
         self.maya_node = maya_node
-        name = maya.cmds.ls(maya_node, shortNames=True)[0]
-        super(Mesh, self).__init__(name=name)
-        self.index = len(Mesh.instances)
-        Mesh.instances.append(self)
+        name = cmds.ls(maya_node, shortNames=True)[0]
+        super(Mesh, self).__init__(ctx, name=name)
         
-        self._getMeshData()
-        self._getMaterial()
+        if self.ctx.settings.skin:
+            self.skin_cluster = self._getDeformer('skinCluster')
+        if self.ctx.settings.morph_targets:
+            self.blend_shape = self._getDeformer('blendShape')
+        # the material decides whether tangents are needed
+        with self.ctx.profiler.phase('materials'):
+            self._getMaterial()
+        with self.ctx.profiler.phase('mesh extraction'):
+            self._getMeshData()
+        if not self.tiles:
+            self.index = len(ctx.meshes)
+            ctx.meshes.append(self)
         
+    @property
+    def primitives(self):
+        '''The items holding the accessors of each primitive, the parts or the mesh itself.'''
+        return self.parts or [self]
+    
     def to_json(self):
-        mesh_def = {"primitives" : [ {
+        mesh_def = {"primitives" : [part._primitive() for part in self.primitives]}
+        if self.morph_targets:
+            mesh_def['weights'] = self.morph_weights
+            mesh_def['extras'] = {'targetNames': self.morph_names}
+        return mesh_def
+    
+    def _primitive(self):
+        primitive = {
                         "mode": 4,
                         "attributes" : {
                           "POSITION" : self.position_accessor.index,
@@ -382,45 +1476,304 @@ class Mesh(ExportItem):
                         },
                         "indices" : self.indices_accessor.index,
                         "material" : self.material.index
-                      } ]
-                    }
-        return mesh_def
-                    
+                      }
+        if self.tangent_accessor:
+            primitive['attributes']['TANGENT'] = self.tangent_accessor.index
+        if self.color0_accessor:
+            primitive['attributes']['COLOR_0'] = self.color0_accessor.index
+        if self.skin:
+            attributes = primitive['attributes']
+            attributes['JOINTS_0'] = self.joints0_accessor.index
+            attributes['WEIGHTS_0'] = self.weights0_accessor.index
+        if self.morph_targets:
+            primitive['targets'] = [
+                dict((semantic, accessor.index) for semantic, accessor in target.items())
+                for target in self.morph_targets]
+        return primitive
+    
+    def morph_weight_plugs(self):
+        return ['{}.{}'.format(self.blend_shape, name) for name in self.morph_names]
+    
+    def _getDeformer(self, deformer_type):
+        history = cmds.listHistory(self.maya_node, pruneDagObjects=True)
+        deformers = cmds.ls(history, type=deformer_type) if history else None
+        if not deformers:
+            return None
+        if numpy is None:
+            print("{} on {} not exported, numpy is not available.".format(deformer_type, self.name))
+            return None
+        return deformers[0]
+    
+    def _original_geometry(self):
+        '''The mesh data going into the deformers of the shape, so the undeformed mesh
+        is exported instead of the pose of the current frame.  Reads it through its
+        plug without changing the scene.  None when Maya doesn't find it.'''
+        original = cmds.deformableShape(self.maya_node, originalGeometry=True)
+        if not original or not original[0]:
+            print("Original geometry of {} not found, exporting its current pose.".format(self.name))
+            return None
+        selList = OpenMaya.MSelectionList()
+        selList.add(original[0])
+        plug = OpenMaya.MPlug()
+        selList.getPlug(0, plug)
+        if plug.isArray():
+            plug = plug.elementByLogicalIndex(0)
+        return plug.asMObject()
+    
     def _getMaterial(self):
-        shadingGrps = maya.cmds.listConnections(self.maya_node,type='shadingEngine')
+        shadingGrps = cmds.listConnections(self.maya_node,type='shadingEngine')
         # We currently only support one materical per mesh, so we'll just grab the first one.
         # TODO: support facegroups as glTF primitivies to support one material per facegroup
-        shader = maya.cmds.ls(maya.cmds.listConnections(shadingGrps),materials=True)[0]
-        self.material = Material(shader)
+        shader = cmds.ls(cmds.listConnections(shadingGrps),materials=True)[0]
+        self.material = Material(self.ctx, shader)
     
-    @timeit
     def _getMeshData(self):
-        maya.cmds.select(self.maya_node)
+        cmds.select(self.maya_node)
         selList = OpenMaya.MSelectionList()
         OpenMaya.MGlobal.getActiveSelectionList(selList)
         meshPath = OpenMaya.MDagPath()
         selList.getDagPath(0, meshPath)
-        meshIt = OpenMaya.MItMeshPolygon(meshPath)
-        meshFn = OpenMaya.MFnMesh(meshPath)
-        dagFn = OpenMaya.MFnDagNode(meshPath)
-        boundingBox = dagFn.boundingBox()
-        do_color = False
+        # the mesh that is read, the shape itself or the original geometry of its deformers
+        geometry = meshPath
+        if self.skin_cluster or self.blend_shape:
+            original = self._original_geometry()
+            if original is not None:
+                geometry = original
+        meshFn = OpenMaya.MFnMesh(geometry)
+        num_vertices = meshFn.numVertices()
+        polyNormals = OpenMaya.MFloatVectorArray()
+        meshFn.getNormals(polyNormals)
+        vertexColorList = None
         if meshFn.numColorSets():
-            do_color=True
-        indices = []
-        positions = [None]*meshFn.numVertices()
-        normals = [None]*meshFn.numVertices()
-        colors = [None]*meshFn.numVertices()
-        uvs = [None]*meshFn.numVertices()
+            # one fetch for the whole mesh, indexed by face-vertex
+            vertexColorList = OpenMaya.MColorArray()
+            meshFn.getFaceVertexColors(vertexColorList)
+        do_tangents = bool(self.ctx.settings.tangents and self.material.normal_texture)
+        if do_tangents and numpy is None:
+            print("Tangents for {} not exported, numpy is not available.".format(self.name))
+            do_tangents = False
+        
+        welded = None
+        blob_key = None
+        # skins and morph targets also need the Maya vertex of each output vertex, which isn't cached
+        if self.ctx.cache and not (self.skin_cluster or self.blend_shape):
+            with self.ctx.profiler.phase('mesh cache'):
+                blob_key = self._blob_key(meshFn, polyNormals, vertexColorList, do_tangents)
+                blob = self.ctx.cache.load_mesh(blob_key)
+            if blob is not None:
+                self.ctx.profiler.count('mesh_cache_hits')
+                welded = (blob['indices'], blob['positions'], blob['normals'], blob['uvs'],
+                            blob.get('colors'), blob.get('tangents'), None, None)
+        if welded is None:
+            welded = self._weld(geometry, meshFn, num_vertices, polyNormals, vertexColorList, do_tangents)
+            if blob_key:
+                with self.ctx.profiler.phase('mesh cache'):
+                    self._store_blob(blob_key, welded)
+        indices, positions, normals, uvs, colors, tangents, split_vertices, normal_ids = welded
+
+        group = 'mesh_' + cmds.ls(self.maya_node, long=True)[0].split('|')[1]
+        
+        self.ctx.profiler.count('triangles', len(indices) // 3)
+        self.ctx.profiler.count('vertices', len(positions) // 3)
+        if self._tiled(len(indices) // 3):
+            with self.ctx.profiler.phase('mesh tiling'):
+                self._tile(group, indices, positions, normals, uvs, colors, tangents)
+            return
+        primary_buffer = self.ctx.buffer_for(group)
+        if geometry is meshPath:
+            boundingBox = OpenMaya.MFnDagNode(meshPath).boundingBox()
+            bbox_min = boundingBox.min()
+            bbox_max = boundingBox.max()
+            bounds = ([bbox_min[0],bbox_min[1],bbox_min[2]], [bbox_max[0],bbox_max[1],bbox_max[2]])
+        else:
+            # the bounding box of the shape is the one of its deformed pose
+            bounds = ([min(positions[axis::3]) for axis in range(3)],
+                      [max(positions[axis::3]) for axis in range(3)])
+        self._add_primitives(indices, positions, normals, uvs, colors, tangents, primary_buffer, bounds)
+        if self.skin_cluster:
+            with self.ctx.profiler.phase('skin weights'):
+                self._getSkinData(meshPath.fullPathName(), num_vertices, split_vertices, primary_buffer)
+        if self.blend_shape:
+            with self.ctx.profiler.phase('morph targets'):
+                vertex_ids = numpy.concatenate((numpy.arange(num_vertices, dtype=numpy.uint32),
+                                                numpy.frombuffer(split_vertices, dtype=numpy.uint32)))
+                self._getMorphTargets(meshPath.fullPathName(), meshFn, vertex_ids,
+                                        numpy.frombuffer(normal_ids, dtype=numpy.uint32), primary_buffer)
+    
+    def _add_primitives(self, indices, positions, normals, uvs, colors, tangents, buffer, bounds):
+        '''Creates the accessors of the mesh, split into MeshParts if it has too many
+        vertices for 16-bit indices and short_indices is on.'''
+        if not self._split(len(positions) // 3):
+            self._add_accessors(indices, positions, normals, uvs, colors, tangents, buffer, bounds)
+            return
+        with self.ctx.profiler.phase('index splitting'):
+            triangles, vertex_data = self._vertex_arrays(indices, positions, normals, uvs, colors, tangents)
+            groups = self._partition(triangles, vertex_data[0],
+                                        lambda ids: len(numpy.unique(triangles[ids])) <= 0xffff)
+            self.parts = []
+            for number, data in enumerate(self._split_triangles(groups, triangles, vertex_data)):
+                part = MeshPart(self, '{}_part{}'.format(self.name, number))
+                part._add_accessors(*(data[:6] + (buffer, data[6])))
+                self.parts.append(part)
+        # against a single primitive with 32-bit indices
+        index_bytes = sum(part.indices_accessor.count * struct.calcsize(
+                            Accessor.component_type_codes[part.indices_accessor.component_type])
+                            for part in self.parts)
+        saved = len(indices) * 4 - index_bytes
+        vertex_size = sum(struct.calcsize(Accessor.component_type_codes[accessor.component_type])
+                            * Accessor.type_codes[accessor.type_]
+                            for accessor in (self.parts[0].position_accessor, self.parts[0].normal_accessor,
+                                                self.parts[0].texcoord0_accessor, self.parts[0].tangent_accessor,
+                                                self.parts[0].color0_accessor) if accessor is not None)
+        duplicated = (sum(part.position_accessor.count for part in self.parts)
+                        - len(positions) // 3) * vertex_size
+        print("{} split into {} primitives with 16-bit indices, {} index bytes saved, {} vertex bytes duplicated".format(
+                self.name, len(self.parts), saved, duplicated))
+        self.ctx.profiler.count('split_primitives', len(self.parts))
+        self.ctx.profiler.count('index_bytes_saved', saved)
+        self.ctx.profiler.count('duplicated_vertex_bytes', duplicated)
+    
+    def _add_accessors(self, indices, positions, normals, uvs, colors, tangents, buffer, bounds):
+        '''Creates the index and vertex attribute accessors of one primitive, bounds
+        are the (min, max) of the positions.'''
+        vertex_count = len(positions) // 3
+        settings = self.ctx.settings
+        # the largest index of each type is the primitive restart value
+        if vertex_count > 0xffff:
+            idx_component_type = ComponentTypes.UINT
+        elif vertex_count <= 0xff and settings.short_indices and not settings.meshopt:
+            idx_component_type = ComponentTypes.UBYTE
+        else:
+            idx_component_type = ComponentTypes.USHORT
+        self.indices_accessor = Accessor(self.ctx, indices, "SCALAR", idx_component_type, 34963, buffer, name=self.name + '_idx')
+        self.indices_accessor.min_ = [0]
+        self.indices_accessor.max_ = [vertex_count - 1]
+        self.position_accessor = Accessor(self.ctx, positions, "VEC3", ComponentTypes.FLOAT, 34962, buffer, name=self.name + '_pos')
+        self.position_accessor.min_, self.position_accessor.max_ = bounds
+        self.normal_accessor = Accessor(self.ctx, normals, "VEC3", ComponentTypes.FLOAT, 34962, buffer, name=self.name + '_norm')
+        self.texcoord0_accessor = Accessor(self.ctx, uvs, "VEC2", ComponentTypes.FLOAT, 34962, buffer, name=self.name + '_uv')
+        if tangents is not None:
+            self.tangent_accessor = Accessor(self.ctx, tangents, "VEC4", ComponentTypes.FLOAT, 34962, buffer, name=self.name + '_tangent')
+        if colors is not None:
+            self.color0_accessor = self._color_accessor(colors, buffer)
+    
+    def _tiled(self, triangle_count):
+        '''Whether the mesh is written as tiles, see ExportSettings.tile_triangles.'''
+        limit = self.ctx.settings.tile_triangles
+        if not limit or triangle_count <= limit:
+            return False
+        return self._can_partition('tiled')
+    
+    def _split(self, vertex_count):
+        '''Whether the mesh is split for 16-bit indices, see ExportSettings.short_indices.'''
+        if not self.ctx.settings.short_indices or vertex_count <= 0xffff:
+            return False
+        return self._can_partition('split')
+    
+    def _can_partition(self, verb):
+        if numpy is None:
+            print("{} not {}, numpy is not available.".format(self.name, verb))
+            return False
+        if self.skin_cluster or self.blend_shape:
+            print("{} not {}, skinned and morphed meshes are kept whole.".format(self.name, verb))
+            return False
+        return True
+    
+    def _tile(self, group, indices, positions, normals, uvs, colors, tangents):
+        '''Splits the welded mesh into MeshTiles of at most tile_triangles triangles.'''
+        limit = self.ctx.settings.tile_triangles
+        triangles, vertex_data = self._vertex_arrays(indices, positions, normals, uvs, colors, tangents)
+        groups = self._partition(triangles, vertex_data[0], lambda ids: len(ids) <= limit)
+        self.tiles = []
+        tile_vertices = 0
+        for number, data in enumerate(self._split_triangles(groups, triangles, vertex_data)):
+            tile = MeshTile(self, number)
+            tile._add_primitives(*(data[:6] + (self.ctx.buffer_for(group, tile=number), data[6])))
+            self.tiles.append(tile)
+            tile_vertices += len(data[1]) // 3
+        self.ctx.profiler.count('mesh_tiles', len(groups))
+        self.ctx.profiler.count('tile_border_vertices', tile_vertices - len(vertex_data[0]))
+    
+    @staticmethod
+    def _vertex_arrays(indices, positions, normals, uvs, colors, tangents):
+        '''The welded arrays as (triangles, 3) indices and (vertices, n) attributes.'''
+        triangles = numpy.asarray(indices, dtype=numpy.uint32).reshape(-1, 3)
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+        normals = numpy.asarray(normals, dtype=numpy.float64).reshape(-1, 3)
+        uvs = numpy.asarray(uvs, dtype=numpy.float64).reshape(-1, 2)
+        if colors is not None:
+            colors = numpy.asarray(colors, dtype=numpy.float64).reshape(-1, 4)
+        if tangents is not None:
+            tangents = numpy.asarray(tangents, dtype=numpy.float32).reshape(-1, 4)
+        return triangles, (positions, normals, uvs, colors, tangents)
+    
+    @staticmethod
+    def _partition(triangles, positions, fits):
+        '''Groups the triangles spatially until fits(triangle ids) holds for every group.
+        
+        Triangles are grouped by their centroids like in a k-d tree: a group that
+        doesn't fit is halved at the median of the longest side of its centroid
+        bounds, so groups are compact and share few vertices.  Returns the sorted
+        triangle ids of each group.
+        '''
+        centroids = positions[triangles].mean(axis=1)
+        pending = [numpy.arange(len(triangles))]
+        groups = []
+        while pending:
+            ids = pending.pop()
+            if fits(ids):
+                groups.append(numpy.sort(ids))
+                continue
+            points = centroids[ids]
+            axis = numpy.argmax(points.max(axis=0) - points.min(axis=0))
+            half = len(ids) // 2
+            order = numpy.argpartition(points[:, axis], half)
+            pending.append(ids[order[half:]])
+            pending.append(ids[order[:half]])
+        return groups
+    
+    @staticmethod
+    def _split_triangles(groups, triangles, vertex_data):
+        '''Yields the indices, flat vertex attributes and position bounds of each group
+        of triangles.  Groups keep the vertices they use in their original order,
+        vertices shared by several groups are copied into each.'''
+        positions, normals, uvs, colors, tangents = vertex_data
+        for ids in groups:
+            vertices, corners = numpy.unique(triangles[ids].ravel(), return_inverse=True)
+            group_positions = positions[vertices]
+            # bounds of the stored floats
+            stored = group_positions.astype(numpy.float32)
+            yield (corners.ravel().astype(numpy.uint32), group_positions.ravel(),
+                    normals[vertices].ravel(), uvs[vertices].ravel(),
+                    colors[vertices].ravel() if colors is not None else None,
+                    tangents[vertices] if tangents is not None else None,
+                    (stored.min(axis=0).tolist(), stored.max(axis=0).tolist()))
+    
+    def _weld(self, geometry, meshFn, num_vertices, polyNormals, vertexColorList, do_tangents):
+        '''Splits the Maya face-vertices of geometry, a shape's dag path or mesh data,
+        into glTF vertices, welding those with equal attributes.  Returns the flat indices, positions, normals, uvs, colors and
+        tangents, the Maya vertex of each seam split and the normal id of every vertex.'''
+        meshIt = OpenMaya.MItMeshPolygon(geometry)
+        indices = array.array('I')
+        # Flat xyz/uv storage with a slot per Maya vertex, seam splits are appended.
+        # Doubles so comparisons match the values Maya hands back.
+        positions = array.array('d', [0.0]) * (num_vertices * 3)
+        normals = array.array('d', [0.0]) * (num_vertices * 3)
+        uvs = array.array('d', [0.0]) * (num_vertices * 2)
+        filled = bytearray(num_vertices)
+        # Maya vertex of each seam split and normal id of every output vertex
+        split_vertices = array.array('I')
+        normal_ids = array.array('I', [0]) * num_vertices
         ids = OpenMaya.MIntArray()
         points = OpenMaya.MPointArray()
+        color = None
+        colors = None
+        do_color = vertexColorList is not None
         if do_color:
-            vertexColorList = OpenMaya.MColorArray()
-            meshFn.getFaceVertexColors(vertexColorList)
+            colors = array.array('d', [1.0]) * (num_vertices * 4)
+        face_offset = 0
         normal = OpenMaya.MVector()
         face_verts = OpenMaya.MIntArray()
-        polyNormals = OpenMaya.MFloatVectorArray()
-        meshFn.getNormals(polyNormals)
         uv_util = OpenMaya.MScriptUtil()
         uv_util.createFromList([0,0], 2 )
         uv_ptr = uv_util.asFloat2Ptr()
@@ -429,7 +1782,6 @@ class Mesh(ExportItem):
             meshIt.getVertices(face_verts)
             face_vertices = list(face_verts)
             for point, vertex_index in zip(points, ids):
-                indices.append(vertex_index)
                 pos = (point.x, point.y, point.z)
                 face_vert_id = face_vertices.index(vertex_index)
                 norm_id = meshIt.normalIndex(face_vert_id)
@@ -441,52 +1793,442 @@ class Mesh(ExportItem):
                 # flip V for openGL
                 # This fails if the the UV is exactly on the border (e.g. (0.5,1))
                 # but we really don't know what udim it's in for that case.
-                if ExportSettings.vflip:
+                if self.ctx.settings.vflip:
                     v = int(v) + (1 - (v % 1))
                 uv = (u, v)
-                if not positions[vertex_index]:   
-                    positions[vertex_index] = pos
-                    normals[vertex_index] = norm
-                    uvs[vertex_index] = uv
-                elif not ( positions[vertex_index] == pos and
-                            normals[vertex_index] == norm and
-                            uvs[vertex_index] == uv):
-                    positions.append(pos)
-                    normals.append(norm)
-                    uvs.append(uv)
-                    indices[-1] = len(positions)-1
-                        
-                
                 if do_color:
-                    color = vertexColorList[vertex_index]
-                    colors[vertex_index] = (color.r, color.g, color.b)   
+                    color = vertexColorList[face_offset + face_vert_id]
+                    # face-vertices without a color come back as -1
+                    if color.r < 0:
+                        color = (1.0, 1.0, 1.0, 1.0)
+                    else:
+                        color = (color.r, color.g, color.b, color.a)
+                p = vertex_index * 3
+                t = vertex_index * 2
+                c = vertex_index * 4
+                if not filled[vertex_index]:
+                    filled[vertex_index] = 1
+                    positions[p], positions[p+1], positions[p+2] = pos
+                    normals[p], normals[p+1], normals[p+2] = norm
+                    uvs[t], uvs[t+1] = uv
+                    if do_color:
+                        colors[c], colors[c+1], colors[c+2], colors[c+3] = color
+                    normal_ids[vertex_index] = norm_id
+                    indices.append(vertex_index)
+                elif ( (positions[p], positions[p+1], positions[p+2]) == pos and
+                        (normals[p], normals[p+1], normals[p+2]) == norm and
+                        (uvs[t], uvs[t+1]) == uv and
+                        (not do_color or (colors[c], colors[c+1], colors[c+2], colors[c+3]) == color)):
+                    indices.append(vertex_index)
+                else:
+                    positions.extend(pos)
+                    normals.extend(norm)
+                    uvs.extend(uv)
+                    if do_color:
+                        colors.extend(color)
+                    split_vertices.append(vertex_index)
+                    normal_ids.append(norm_id)
+                    indices.append(len(positions) // 3 - 1)
+            face_offset += len(face_vertices)
             next(meshIt)
 
-        if not len(Buffer.instances):
-            primary_buffer = Buffer('primary_buffer')
+        tangents = None
+        if do_tangents:
+            with self.ctx.profiler.phase('tangents'):
+                tangents, duplicates, indices = self._getTangents(positions, normals, uvs, indices)
+            # copy the vertices split for mirrored UVs, attributes and the Maya vertex map alike
+            positions = numpy.frombuffer(positions, dtype=numpy.float64).reshape(-1, 3)
+            normals = numpy.frombuffer(normals, dtype=numpy.float64).reshape(-1, 3)
+            uvs = numpy.frombuffer(uvs, dtype=numpy.float64).reshape(-1, 2)
+            positions = numpy.concatenate((positions, positions[duplicates])).ravel()
+            normals = numpy.concatenate((normals, normals[duplicates])).ravel()
+            uvs = numpy.concatenate((uvs, uvs[duplicates])).ravel()
+            duplicates = duplicates.tolist()
+            if do_color:
+                colors.extend([colors[vertex * 4 + k] for vertex in duplicates for k in range(4)])
+            split_vertices.extend([vertex if vertex < num_vertices else split_vertices[vertex - num_vertices]
+                                    for vertex in duplicates])
+            normal_ids.extend([normal_ids[vertex] for vertex in duplicates])
+            self.ctx.profiler.count('tangent_splits', len(duplicates))
+        return indices, positions, normals, uvs, colors, tangents, split_vertices, normal_ids
+    
+    def _blob_key(self, meshFn, polyNormals, vertexColorList, do_tangents):
+        '''Hash of the Maya mesh data and the options _weld builds its arrays from.'''
+        digest = hashlib.sha1(ExportCache.exporter_version().encode('latin-1'))
+        digest.update(repr((self.ctx.settings.vflip, do_tangents)).encode('latin-1'))
+        def update(code, values):
+            digest.update(_array_bytes(array.array(code, values)))
+        points = OpenMaya.MPointArray()
+        meshFn.getPoints(points)
+        update('d', [value for point in points for value in (point.x, point.y, point.z)])
+        counts = OpenMaya.MIntArray()
+        ids = OpenMaya.MIntArray()
+        meshFn.getVertices(counts, ids)
+        update('i', counts)
+        update('i', ids)
+        meshFn.getNormalIds(counts, ids)
+        update('i', ids)
+        update('d', [value for normal in polyNormals for value in (normal.x, normal.y, normal.z)])
+        uv_set = meshFn.currentUVSetName()
+        u_values = OpenMaya.MFloatArray()
+        v_values = OpenMaya.MFloatArray()
+        meshFn.getUVs(u_values, v_values, uv_set)
+        update('d', u_values)
+        update('d', v_values)
+        meshFn.getAssignedUVs(counts, ids, uv_set)
+        update('i', ids)
+        if vertexColorList is not None:
+            update('d', [value for color in vertexColorList
+                            for value in (color.r, color.g, color.b, color.a)])
+        return digest.hexdigest()
+    
+    def _store_blob(self, blob_key, welded):
+        indices, positions, normals, uvs, colors, tangents = welded[:6]
+        arrays = [('indices', 'I', indices), ('positions', 'f', positions),
+                    ('normals', 'f', normals), ('uvs', 'f', uvs)]
+        # colors stay doubles so they quantize the same way as fresh ones
+        if colors is not None:
+            arrays.append(('colors', 'd', colors))
+        if tangents is not None:
+            arrays.append(('tangents', 'f', tangents))
+        self.ctx.cache.store_mesh(blob_key, arrays)
+    
+    @staticmethod
+    def _getTangents(positions, normals, uvs, indices):
+        '''Per vertex tangents with handedness in w from the welded arrays.
+        
+        Triangle tangents from the UV derivatives are summed per vertex and
+        orthogonalized against the normal.  A vertex used by corners of opposite
+        handedness (mirrored UVs) is split: those with negative handedness move to
+        a copy.  Returns the (vertex_count + splits, 4) tangents, the source vertex
+        of each copy and the updated indices.
+        '''
+        positions = numpy.frombuffer(positions, dtype=numpy.float64).reshape(-1, 3)
+        normals = numpy.frombuffer(normals, dtype=numpy.float64).reshape(-1, 3)
+        uvs = numpy.frombuffer(uvs, dtype=numpy.float64).reshape(-1, 2)
+        corners = numpy.frombuffer(indices, dtype=numpy.uint32).astype(numpy.int64)
+        triangles = corners.reshape(-1, 3)
+        
+        edge1 = positions[triangles[:, 1]] - positions[triangles[:, 0]]
+        edge2 = positions[triangles[:, 2]] - positions[triangles[:, 0]]
+        duv1 = uvs[triangles[:, 1]] - uvs[triangles[:, 0]]
+        duv2 = uvs[triangles[:, 2]] - uvs[triangles[:, 0]]
+        det = duv1[:, 0] * duv2[:, 1] - duv2[:, 0] * duv1[:, 1]
+        scale = numpy.zeros_like(det)
+        numpy.divide(1.0, det, out=scale, where=numpy.abs(det) > 1e-12)
+        face_tangents = (edge1 * duv2[:, 1:2] - edge2 * duv1[:, 1:2]) * scale[:, None]
+        face_bitangents = (edge2 * duv1[:, 0:1] - edge1 * duv2[:, 0:1]) * scale[:, None]
+        
+        corner_tangents = numpy.repeat(face_tangents, 3, axis=0)
+        corner_normals = normals[corners]
+        handedness = numpy.einsum('ij,ij->i', numpy.cross(corner_normals, corner_tangents),
+                                    numpy.repeat(face_bitangents, 3, axis=0))
+        negative = handedness < 0.0
+        
+        vertex_count = len(positions)
+        has_negative = numpy.bincount(corners[negative], minlength=vertex_count) > 0
+        has_positive = numpy.bincount(corners[~negative], minlength=vertex_count) > 0
+        duplicates = numpy.flatnonzero(has_negative & has_positive)
+        if len(duplicates):
+            copies = numpy.full(vertex_count, -1, dtype=numpy.int64)
+            copies[duplicates] = numpy.arange(vertex_count, vertex_count + len(duplicates))
+            moved = negative & (copies[corners] >= 0)
+            corners = corners.copy()
+            corners[moved] = copies[corners[moved]]
+            normals = numpy.concatenate((normals, normals[duplicates]))
+            vertex_count += len(duplicates)
+        
+        tangents = numpy.empty((vertex_count, 3))
+        for axis in range(3):
+            tangents[:, axis] = numpy.bincount(corners, weights=corner_tangents[:, axis],
+                                                minlength=vertex_count)
+        tangents -= normals * numpy.einsum('ij,ij->i', normals, tangents)[:, None]
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', tangents, tangents))
+        # no UV gradient, any direction perpendicular to the normal will do
+        degenerate = lengths < 1e-12
+        if degenerate.any():
+            axis = numpy.where(numpy.abs(normals[degenerate, 0:1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+            tangents[degenerate] = numpy.cross(numpy.cross(normals[degenerate], axis), normals[degenerate])
+            lengths[degenerate] = numpy.sqrt(numpy.einsum('ij,ij->i', tangents[degenerate], tangents[degenerate]))
+        lengths[lengths < 1e-12] = 1.0
+        
+        result = numpy.empty((vertex_count, 4), dtype=numpy.float32)
+        result[:, :3] = tangents / lengths[:, None]
+        result[:, 3] = 1.0
+        result[numpy.bincount(corners[negative], minlength=vertex_count) > 0, 3] = -1.0
+        return result, duplicates, corners.astype(numpy.uint32)
+    
+    def _color_accessor(self, colors, buffer):
+        '''Packs RGBA colors as floats or clamped normalized integers.'''
+        if self.ctx.settings.color_format == 'float':
+            return Accessor(self.ctx, colors, "VEC4", ComponentTypes.FLOAT, 34962, buffer, name=self.name + '_color')
+        if self.ctx.settings.color_format == 'ushort':
+            component_type, code, scale = ComponentTypes.USHORT, 'H', 65535.0
+        elif self.ctx.settings.color_format == 'ubyte':
+            component_type, code, scale = ComponentTypes.UBYTE, 'B', 255.0
         else:
-            primary_buffer = Buffer.instances[0]
+            raise ValueError("Unknown color_format: {}".format(self.ctx.settings.color_format))
+        if numpy is not None:
+            colors = numpy.asarray(colors, dtype=numpy.float64)
+            quantized = (numpy.clip(colors, 0.0, 1.0) * scale + 0.5).astype(numpy.dtype(code))
+        else:
+            quantized = array.array(code, [int(min(max(value, 0.0), 1.0) * scale + 0.5) for value in colors])
+        accessor = Accessor(self.ctx, quantized, "VEC4", component_type, 34962, buffer, name=self.name + '_color')
+        accessor.normalized = True
+        return accessor
+    
+    def _getSkinData(self, shape_path, num_vertices, split_vertices, buffer):
+        '''Reads the weights of all influences for the whole mesh in one call,
+        keeps the four largest per vertex and renormalizes them.'''
+        import maya.api.OpenMaya as om2
+        import maya.api.OpenMayaAnim as oma2
+        sel_list = om2.MSelectionList().add(self.skin_cluster).add(shape_path)
+        skin_fn = oma2.MFnSkinCluster(sel_list.getDependNode(0))
+        component_fn = om2.MFnSingleIndexedComponent()
+        components = component_fn.create(om2.MFn.kMeshVertComponent)
+        component_fn.setCompleteData(num_vertices)
+        weights, influence_count = skin_fn.getWeights(sel_list.getDagPath(1), components)
+        weights = numpy.array(weights, dtype=numpy.float32).reshape(num_vertices, influence_count)
         
-        if len(positions) >= 0xffff:
-            idx_component_type = ComponentTypes.UINT
+        if influence_count > 4:
+            joints = numpy.argpartition(weights, influence_count - 4, axis=1)[:, -4:]
         else:
-            idx_component_type = ComponentTypes.USHORT
-        self.indices_accessor = Accessor(indices, "SCALAR", idx_component_type, 34963, primary_buffer, name=self.name + '_idx')
-        self.indices_accessor.min_ = [0]
-        self.indices_accessor.max_ = [len(positions) - 1]
-        self.position_accessor = Accessor(positions, "VEC3", ComponentTypes.FLOAT, 34962, primary_buffer, name=self.name + '_pos')
-        bbox_max = boundingBox.max()
-        self.position_accessor.max_ = [bbox_max[0],bbox_max[1],bbox_max[2]]
-        bbox_min = boundingBox.min()
-        self.position_accessor.min_ =  [bbox_min[0],bbox_min[1],bbox_min[2]]
-        self.normal_accessor = Accessor(normals, "VEC3", ComponentTypes.FLOAT, 34962, primary_buffer, name=self.name + '_norm')
-        self.texcoord0_accessor = Accessor(uvs, "VEC2", ComponentTypes.FLOAT, 34962, primary_buffer, name=self.name + '_uv')
+            joints = numpy.tile(numpy.arange(4) % influence_count, (num_vertices, 1))
+        weights = numpy.take_along_axis(weights, joints, axis=1)
+        if influence_count < 4:
+            weights[:, influence_count:] = 0.0
+        totals = weights.sum(axis=1)
+        unweighted = totals <= 0.0
+        weights[unweighted] = (1.0, 0.0, 0.0, 0.0)
+        totals[unweighted] = 1.0
+        weights /= totals[:, None]
+        joints[weights == 0.0] = 0
+        self.ctx.profiler.count('skinned_vertices', num_vertices)
+        
+        # seam splits share the weights of the Maya vertex they came from
+        if split_vertices:
+            split_vertices = numpy.frombuffer(split_vertices, dtype=numpy.uint32)
+            joints = numpy.concatenate((joints, joints[split_vertices]))
+            weights = numpy.concatenate((weights, weights[split_vertices]))
+        if influence_count <= 0x100:
+            joint_component_type = ComponentTypes.UBYTE
+        else:
+            joint_component_type = ComponentTypes.USHORT
+        self.joints0_accessor = Accessor(self.ctx, joints, "VEC4", joint_component_type, 34962, buffer,
+                                            name=self.name + '_joints')
+        self.weights0_accessor = Accessor(self.ctx, weights, "VEC4", ComponentTypes.FLOAT, 34962, buffer,
+                                            name=self.name + '_weights')
+        
+        influences = skin_fn.influenceObjects()
+        # Maya multiplies points by geomMatrix * bindPreMatrix, both row-major.
+        # The row-major flattening of a Maya matrix is the column-major glTF one.
+        geom_matrix = numpy.array(cmds.getAttr(self.skin_cluster + '.geomMatrix'),
+                                    dtype=numpy.float64).reshape(4, 4)
+        bind_pre_matrices = numpy.array(
+            [cmds.getAttr('{}.bindPreMatrix[{}]'.format(self.skin_cluster,
+                                                            skin_fn.indexForInfluenceObject(path)))
+             for path in influences], dtype=numpy.float64).reshape(-1, 4, 4)
+        inverse_binds = numpy.matmul(geom_matrix, bind_pre_matrices).astype(numpy.float32)
+        inverse_bind_accessor = Accessor(self.ctx, inverse_binds, "MAT4", ComponentTypes.FLOAT, None, buffer,
+                                            name=self.name + '_inverseBind')
+        self.skin = Skin(self.ctx, self.skin_cluster, [path.fullPathName() for path in influences],
+                            inverse_bind_accessor)
+    
+    def _getMorphTargets(self, shape_path, meshFn, vertex_ids, normal_ids, buffer):
+        '''Stores the POSITION and NORMAL deltas of every blendShape target against the
+        mesh read by meshFn, as sparse accessors when only part of the mesh moves.
+        
+        The deltas come from the target data of the blendShape, the scene isn't
+        changed, so driven or locked weights export too.  Painted base and target
+        weights scale them, in-between targets aren't exported.  The NORMAL deltas
+        are those of area weighted face normals summed per Maya normal, which differ
+        from the normals Maya shows where normals are locked or unlocked by hand.
+        '''
+        weight_plug = self.blend_shape + '.weight'
+        target_indices = cmds.getAttr(weight_plug, multiIndices=True) or []
+        # alias, attr, alias, attr...  Unnamed targets keep their weight[i] name.
+        aliases = cmds.aliasAttr(self.blend_shape, query=True) or []
+        names = dict(zip(aliases[1::2], aliases[::2]))
+        self.morph_names = [names.get('weight[{}]'.format(index), 'weight[{}]'.format(index))
+                            for index in target_indices]
+        self.morph_weights = [cmds.getAttr('{}[{}]'.format(weight_plug, index)) for index in target_indices]
+        
+        points = OpenMaya.MPointArray()
+        meshFn.getPoints(points)
+        base_points = numpy.array([(point.x, point.y, point.z) for point in points], dtype=numpy.float64)
+        topology = self._face_topology(meshFn)
+        base_normals = self._face_normals(base_points, *topology)
+        target_plug = '{}.inputTarget[{}]'.format(self.blend_shape, self._blend_shape_geometry_index(shape_path))
+        base_weights = self._painted_weights(target_plug + '.baseWeights', len(base_points))
+        self.morph_targets = []
+        for index, name in zip(target_indices, self.morph_names):
+            group_plug = '{}.inputTargetGroup[{}]'.format(target_plug, index)
+            deltas = self._target_deltas(group_plug, base_points)
+            deltas *= (base_weights * self._painted_weights(group_plug + '.targetWeights', len(base_points)))[:, None]
+            target = {'POSITION': self._morph_accessor(deltas[vertex_ids], buffer,
+                                                         '{}_{}_pos'.format(self.name, name))}
+            if deltas.any():
+                normal_deltas = (self._face_normals(base_points + deltas, *topology) - base_normals)[normal_ids]
+                if numpy.any(numpy.abs(normal_deltas) > self.morph_tolerance):
+                    target['NORMAL'] = self._morph_accessor(normal_deltas, buffer,
+                                                            '{}_{}_norm'.format(self.name, name))
+            self.morph_targets.append(target)
+        self.ctx.profiler.count('morph_targets', len(self.morph_targets))
+    
+    def _blend_shape_geometry_index(self, shape_path):
+        '''The inputTarget index of the shape on the blendShape, 0 unless it deforms several.'''
+        geometry = cmds.ls(cmds.blendShape(self.blend_shape, query=True, geometry=True) or [], long=True)
+        indices = cmds.blendShape(self.blend_shape, query=True, geometryIndices=True) or []
+        if shape_path in geometry and len(indices) == len(geometry):
+            return indices[geometry.index(shape_path)]
+        return 0
+    
+    @staticmethod
+    def _target_deltas(group_plug, base_points):
+        '''Per Maya vertex deltas of the full weight item of a target: the connected
+        target mesh minus the base, or the stored points of the changed components.'''
+        deltas = numpy.zeros_like(base_points)
+        item_plug = group_plug + '.inputTargetItem[6000]'
+        if 6000 not in (cmds.getAttr(group_plug + '.inputTargetItem', multiIndices=True) or []):
+            return deltas
+        target_geometry = cmds.listConnections(item_plug + '.inputGeomTarget', source=True,
+                                                destination=False, shapes=True)
+        if target_geometry:
+            import maya.api.OpenMaya as om2
+            mesh_fn = om2.MFnMesh(om2.MSelectionList().add(target_geometry[0]).getDagPath(0))
+            return numpy.array(mesh_fn.getPoints(), dtype=numpy.float64)[:, :3] - base_points
+        target_points = cmds.getAttr(item_plug + '.inputPointsTarget')
+        components = cmds.getAttr(item_plug + '.inputComponentsTarget')
+        if target_points and components:
+            vertices = []
+            # vtx[4] or vtx[8:12]
+            for component in components:
+                bounds = component[component.index('[') + 1:-1].split(':')
+                vertices.extend(range(int(bounds[0]), int(bounds[-1]) + 1))
+            deltas[vertices] = numpy.array(target_points, dtype=numpy.float64)[:, :3]
+        return deltas
+    
+    @staticmethod
+    def _painted_weights(plug, count):
+        '''Per vertex weights of a blendShape weight map, 1 where nothing is painted.'''
+        weights = numpy.ones(count)
+        for index in cmds.getAttr(plug, multiIndices=True) or []:
+            if index < count:
+                weights[index] = cmds.getAttr('{}[{}]'.format(plug, index))
+        return weights
+    
+    @staticmethod
+    def _face_topology(meshFn):
+        '''Face, vertex, next vertex of the face and normal id of every face-vertex,
+        the face count and the normal count.'''
+        counts = OpenMaya.MIntArray()
+        ids = OpenMaya.MIntArray()
+        meshFn.getVertices(counts, ids)
+        counts = numpy.array(list(counts), dtype=numpy.int64)
+        vertices = numpy.array(list(ids), dtype=numpy.int64)
+        meshFn.getNormalIds(OpenMaya.MIntArray(), ids)
+        face_normal_ids = numpy.array(list(ids), dtype=numpy.int64)
+        faces = numpy.repeat(numpy.arange(len(counts)), counts)
+        offsets = numpy.cumsum(counts) - counts
+        following = numpy.arange(1, len(vertices) + 1)
+        following[offsets + counts - 1] = offsets
+        return faces, vertices, vertices[following], face_normal_ids, len(counts), int(face_normal_ids.max()) + 1
+    
+    @staticmethod
+    def _face_normals(points, faces, vertices, following, face_normal_ids, face_count, normal_count):
+        '''Unit normal per Maya normal id, summing the area weighted normals of its faces.'''
+        corner_normals = numpy.cross(points[vertices], points[following])
+        face_normals = numpy.empty((face_count, 3))
+        normals = numpy.empty((normal_count, 3))
+        for axis in range(3):
+            face_normals[:, axis] = numpy.bincount(faces, weights=corner_normals[:, axis], minlength=face_count)
+        corner_normals = face_normals[faces]
+        for axis in range(3):
+            normals[:, axis] = numpy.bincount(face_normal_ids, weights=corner_normals[:, axis],
+                                                minlength=normal_count)
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', normals, normals))
+        lengths[lengths < 1e-12] = 1.0
+        return normals / lengths[:, None]
+    
+    def _morph_accessor(self, deltas, buffer, name):
+        '''Packs the deltas sparse when the changed vertices plus their indices take
+        fewer bytes than the dense array.'''
+        deltas = deltas.astype(numpy.float32)
+        changed = numpy.flatnonzero(numpy.any(numpy.abs(deltas) > self.morph_tolerance, axis=1))
+        index_component_type = ComponentTypes.USHORT if len(deltas) <= 0x10000 else ComponentTypes.UINT
+        index_size = 2 if index_component_type == ComponentTypes.USHORT else 4
+        if len(changed) * (index_size + 12) < len(deltas) * 12:
+            accessor = SparseAccessor(self.ctx, len(deltas), changed, deltas[changed], "VEC3",
+                                        ComponentTypes.FLOAT, index_component_type, buffer, name=name)
+            self.ctx.profiler.count('sparse_morph_accessors')
+        else:
+            accessor = Accessor(self.ctx, deltas, "VEC3", ComponentTypes.FLOAT, 34962, buffer, name=name)
+        # required for POSITION targets
+        if len(changed):
+            accessor.min_ = deltas.min(axis=0).tolist()
+            accessor.max_ = deltas.max(axis=0).tolist()
+        else:
+            accessor.min_ = accessor.max_ = [0.0, 0.0, 0.0]
+        return accessor
+
+
+class MeshPart(Mesh):
+    '''Accessors of one primitive of a Mesh split by short_indices.'''
+    
+    def __init__(self, mesh, name):
+        ExportItem.__init__(self, mesh.ctx, name=name)
+        self.maya_node = mesh.maya_node
+        self.material = mesh.material
+
+
+class MeshTile(MeshPart):
+    '''One spatial tile of a Mesh, written as a mesh of its own under a TileNode.'''
+    
+    def __init__(self, mesh, number):
+        super(MeshTile, self).__init__(mesh, '{}_tile{}'.format(mesh.name, number))
+        self.index = len(self.ctx.meshes)
+        self.ctx.meshes.append(self)
+
+
+class TileNode(ExportItem):
+    '''Child of the Node of a tiled mesh holding one of its MeshTiles.'''
+    __slots__ = ('index', 'mesh')
+    
+    def __init__(self, ctx, tile):
+        super(TileNode, self).__init__(ctx, name=tile.name)
+        self.mesh = tile
+        self.index = len(ctx.nodes)
+        ctx.nodes.append(self)
+        self.ctx.profiler.count('nodes')
+    
+    def to_json(self):
+        return {'mesh': self.mesh.index}
+
+
+class Skin(ExportItem):
+    '''Needs to add itself to skins list, its mesh's node refers to it'''
+    
+    def __init__(self, ctx, maya_node, joints, inverse_bind_accessor):
+        name = cmds.ls(maya_node, shortNames=True)[0]
+        super(Skin, self).__init__(ctx, name=name)
+        self.index = len(ctx.skins)
+        ctx.skins.append(self)
+        self.maya_node = maya_node
+        # maya paths, resolved once the whole scene is traversed
+        self.joints = joints
+        self.inverse_bind_accessor = inverse_bind_accessor
+    
+    def to_json(self):
+        # influences that aren't exported drop the skin, see Scene._drop_incomplete_skins
+        nodes = self.ctx.nodes_by_maya_node
+        joints = [nodes[joint].index for joint in self.joints]
+        return {"joints": joints,
+                "inverseBindMatrices": self.inverse_bind_accessor.index}
 
         
 
 class Material(ExportItem):
     '''Needs to add itself to materials and meshes list'''
-    instances = []
     maya_node = None
     base_color_factor = None
     base_color_texture = None
@@ -498,29 +2240,25 @@ class Material(ExportItem):
     emissive_factor = None
     emissive_texture = None
     transparency = None
-    default_material_id = None
+    # overrides the alphaMode read from the base color texture
+    alpha_mode = None
     supported_materials = ['lambert','phong','blinn','aiStandardSurface', 'StingrayPBS']
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-        cls.default_material_id = None
-    
-    def __new__(cls, maya_node, *args, **kwargs):
+    def __new__(cls, ctx, maya_node, *args, **kwargs):
         if maya_node:
-            name = maya.cmds.ls(maya_node, shortNames=True)[0]
-            matches = [mat for mat in Material.instances if mat.name == name]
+            name = cmds.ls(maya_node, shortNames=True)[0]
+            matches = [mat for mat in ctx.materials if mat.name == name]
             if matches:
                 return matches[0]
             
-            maya_obj_type = maya.cmds.objectType(maya_node)
+            maya_obj_type = cmds.objectType(maya_node)
             if maya_obj_type not in cls.supported_materials:
                 print("Shader {} is not a supported shader type: {}".format(maya_node, maya_obj_type))
-                return cls._get_default_material()
+                return cls._get_default_material(ctx)
         
         return super(Material, cls).__new__(cls, *args, **kwargs)
         
-    def __init__(self, maya_node):
+    def __init__(self, ctx, maya_node):
         if hasattr(self, 'index'):
             return
         
@@ -529,31 +2267,31 @@ class Material(ExportItem):
             self.metallic_factor = 0
             self.roughness_factor = 1
             name = 'glTFDefaultMaterial'
-            super(Material, self).__init__(name=name)
-            self.index = len(Material.instances)
-            self.__class__.default_material_id = self.index
-            Material.instances.append(self)
+            super(Material, self).__init__(ctx, name=name)
+            self.index = len(ctx.materials)
+            ctx.default_material = self
+            ctx.materials.append(self)
             return
              
         self.maya_node = maya_node
-        name = maya.cmds.ls(maya_node, shortNames=True)[0]
-        super(Material, self).__init__(name=name)
+        name = cmds.ls(maya_node, shortNames=True)[0]
+        super(Material, self).__init__(ctx, name=name)
         
-        self.index = len(Material.instances)
-        Material.instances.append(self)
+        self.index = len(ctx.materials)
+        ctx.materials.append(self)
         
-        maya_obj_type = maya.cmds.objectType(maya_node)
+        maya_obj_type = cmds.objectType(maya_node)
         if maya_obj_type in ['phong', 'lambert', 'blinn']:
-            color_conn = maya.cmds.listConnections(self.maya_node+'.color')
-            trans = list(maya.cmds.getAttr(self.maya_node+'.transparency')[0])
+            color_conn = cmds.listConnections(self.maya_node+'.color')
+            trans = list(cmds.getAttr(self.maya_node+'.transparency')[0])
             self.transparency = sum(trans) / float(len(trans))
-            if color_conn and maya.cmds.objectType(color_conn[0]) == 'file':
+            if color_conn and cmds.objectType(color_conn[0]) == 'file':
                 file_node = color_conn[0]
-                file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                image = Image(file_path)
-                self.base_color_texture = Texture(image)
+                file_path = cmds.getAttr(file_node+'.fileTextureName')
+                image = Image(self.ctx, file_path)
+                self.base_color_texture = Texture(self.ctx, image)
             else:
-                color = list(maya.cmds.getAttr(self.maya_node+'.color')[0])
+                color = list(cmds.getAttr(self.maya_node+'.color')[0])
                 color.append(1-self.transparency)
                 self.base_color_factor = color
             
@@ -561,91 +2299,91 @@ class Material(ExportItem):
                 self.metallic_factor = 0
                 self.roughness_factor = 1
             elif maya_obj_type == 'blinn':
-                self.metallic_factor = maya.cmds.getAttr(self.maya_node+'.specularRollOff')
-                self.roughness_factor = maya.cmds.getAttr(self.maya_node+'.eccentricity') 
+                self.metallic_factor = cmds.getAttr(self.maya_node+'.specularRollOff')
+                self.roughness_factor = cmds.getAttr(self.maya_node+'.eccentricity') 
             elif maya_obj_type == 'phong':
                 self.metallic_factor = 1
-                self.roughness_factor = 1 - min(1, maya.cmds.getAttr(self.maya_node+'.cosinePower') / 2000)
+                self.roughness_factor = 1 - min(1, cmds.getAttr(self.maya_node+'.cosinePower') / 2000)
         elif maya_obj_type == 'aiStandardSurface':
-            color_conn = maya.cmds.listConnections(self.maya_node+'.baseColor')
-            if color_conn and maya.cmds.objectType(color_conn[0]) == 'file':
+            color_conn = cmds.listConnections(self.maya_node+'.baseColor')
+            if color_conn and cmds.objectType(color_conn[0]) == 'file':
                 file_node = color_conn[0]
-                file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                image = Image(file_path)
-                self.base_color_texture = Texture(image)
+                file_path = cmds.getAttr(file_node+'.fileTextureName')
+                image = Image(self.ctx, file_path)
+                self.base_color_texture = Texture(self.ctx, image)
             else:
-                color = list(maya.cmds.getAttr(self.maya_node+'.baseColor')[0])
+                color = list(cmds.getAttr(self.maya_node+'.baseColor')[0])
                 self.base_color_factor = color
-                opacity = list(maya.cmds.getAttr(self.maya_node+'.opacity')[0])
+                opacity = list(cmds.getAttr(self.maya_node+'.opacity')[0])
                 opacity = sum(opacity) / float(len(opacity))
                 self.base_color_factor.append(opacity)
-            self.metallic_factor = maya.cmds.getAttr(self.maya_node+'.metalness')
-            self.roughness_factor = maya.cmds.getAttr(self.maya_node+'.specularRoughness')
+            self.metallic_factor = cmds.getAttr(self.maya_node+'.metalness')
+            self.roughness_factor = cmds.getAttr(self.maya_node+'.specularRoughness')
         elif maya_obj_type == 'StingrayPBS':
-            color_conn = maya.cmds.listConnections(self.maya_node+'.TEX_color_map')
-            if (color_conn and maya.cmds.objectType(color_conn[0]) == 'file'
-                    and maya.cmds.getAttr(self.maya_node+'.use_color_map')):
+            color_conn = cmds.listConnections(self.maya_node+'.TEX_color_map')
+            if (color_conn and cmds.objectType(color_conn[0]) == 'file'
+                    and cmds.getAttr(self.maya_node+'.use_color_map')):
                 file_node = color_conn[0]
-                file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                image = Image(file_path)
-                self.base_color_texture = Texture(image)
+                file_path = cmds.getAttr(file_node+'.fileTextureName')
+                image = Image(self.ctx, file_path)
+                self.base_color_texture = Texture(self.ctx, image)
             else:
-                color = list(maya.cmds.getAttr(self.maya_node+'.base_color')[0])
+                color = list(cmds.getAttr(self.maya_node+'.base_color')[0])
                 self.base_color_factor = color
                 self.base_color_factor.append(1) # opacity
             
-            metallic_conn = maya.cmds.listConnections(self.maya_node+'.TEX_metallic_map')
-            roughness_conn = maya.cmds.listConnections(self.maya_node+'.TEX_roughness_map')
-            if (metallic_conn and maya.cmds.objectType(metallic_conn[0]) == 'file'
-                    and maya.cmds.getAttr(self.maya_node+'.use_metallic_map')
-                    and roughness_conn and maya.cmds.objectType(roughness_conn[0]) == 'file'
-                    and maya.cmds.getAttr(self.maya_node+'.use_roughness_map')):
+            metallic_conn = cmds.listConnections(self.maya_node+'.TEX_metallic_map')
+            roughness_conn = cmds.listConnections(self.maya_node+'.TEX_roughness_map')
+            if (metallic_conn and cmds.objectType(metallic_conn[0]) == 'file'
+                    and cmds.getAttr(self.maya_node+'.use_metallic_map')
+                    and roughness_conn and cmds.objectType(roughness_conn[0]) == 'file'
+                    and cmds.getAttr(self.maya_node+'.use_roughness_map')):
                 metallic_file_node = metallic_conn[0]
-                metallic_file_path = maya.cmds.getAttr(metallic_file_node+'.fileTextureName')
+                metallic_file_path = cmds.getAttr(metallic_file_node+'.fileTextureName')
                 roughness_file_node = roughness_conn[0]
-                roughness_file_path = maya.cmds.getAttr(roughness_file_node+'.fileTextureName')
+                roughness_file_path = cmds.getAttr(roughness_file_node+'.fileTextureName')
                 metalrough_file_path, metalrough_qimage = self._create_metallic_roughness_map(metallic_file_path, roughness_file_path)
-                image = Image(metalrough_file_path, metalrough_qimage)
-                self.metallic_roughness_texture = Texture(image)
+                image = Image(self.ctx, metalrough_file_path, metalrough_qimage)
+                self.metallic_roughness_texture = Texture(self.ctx, image)
             else:
-                self.metallic_factor = maya.cmds.getAttr(self.maya_node+'.metallic')
-                self.roughness_factor = maya.cmds.getAttr(self.maya_node+'.roughness')
+                self.metallic_factor = cmds.getAttr(self.maya_node+'.metallic')
+                self.roughness_factor = cmds.getAttr(self.maya_node+'.roughness')
                 
-            normal_conn = maya.cmds.listConnections(self.maya_node+'.TEX_normal_map')
-            if (normal_conn and maya.cmds.objectType(normal_conn[0]) == 'file'
-                    and maya.cmds.getAttr(self.maya_node+'.use_normal_map')):
+            normal_conn = cmds.listConnections(self.maya_node+'.TEX_normal_map')
+            if (normal_conn and cmds.objectType(normal_conn[0]) == 'file'
+                    and cmds.getAttr(self.maya_node+'.use_normal_map')):
                 file_node = normal_conn[0]
-                file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                image = Image(file_path)
-                self.normal_texture = Texture(image)
+                file_path = cmds.getAttr(file_node+'.fileTextureName')
+                image = Image(self.ctx, file_path)
+                self.normal_texture = Texture(self.ctx, image)
             
             # Not all Stingray preset shaders have an AO map attribute
-            if maya.cmds.attributeQuery("TEX_ao_map", node=self.maya_node, exists=True):    
-                ao_conn = maya.cmds.listConnections(self.maya_node+'.TEX_ao_map')
-                if (ao_conn and maya.cmds.objectType(ao_conn[0]) == 'file'
-                        and maya.cmds.getAttr(self.maya_node+'.use_ao_map')):
+            if cmds.attributeQuery("TEX_ao_map", node=self.maya_node, exists=True):    
+                ao_conn = cmds.listConnections(self.maya_node+'.TEX_ao_map')
+                if (ao_conn and cmds.objectType(ao_conn[0]) == 'file'
+                        and cmds.getAttr(self.maya_node+'.use_ao_map')):
                     file_node = ao_conn[0]
-                    file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                    image = Image(file_path)
-                    self.occlusion_texture = Texture(image)
+                    file_path = cmds.getAttr(file_node+'.fileTextureName')
+                    image = Image(self.ctx, file_path)
+                    self.occlusion_texture = Texture(self.ctx, image)
             
-            emissive_conn = maya.cmds.listConnections(self.maya_node+'.TEX_emissive_map')
-            if (emissive_conn and maya.cmds.objectType(emissive_conn[0]) == 'file'
-                    and maya.cmds.getAttr(self.maya_node+'.use_emissive_map')):
+            emissive_conn = cmds.listConnections(self.maya_node+'.TEX_emissive_map')
+            if (emissive_conn and cmds.objectType(emissive_conn[0]) == 'file'
+                    and cmds.getAttr(self.maya_node+'.use_emissive_map')):
                 file_node = emissive_conn[0]
-                file_path = maya.cmds.getAttr(file_node+'.fileTextureName')
-                image = Image(file_path)
-                self.emissive_texture = Texture(image)
-                emissive_intensity = maya.cmds.getAttr(self.maya_node+'.emissive_intensity')
+                file_path = cmds.getAttr(file_node+'.fileTextureName')
+                image = Image(self.ctx, file_path)
+                self.emissive_texture = Texture(self.ctx, image)
+                emissive_intensity = cmds.getAttr(self.maya_node+'.emissive_intensity')
                 self.emissive_factor = [emissive_intensity, emissive_intensity, emissive_intensity]
             else:
-                emissive = list(maya.cmds.getAttr(self.maya_node+'.emissive')[0])
+                emissive = list(cmds.getAttr(self.maya_node+'.emissive')[0])
                 self.emissive_factor = emissive
                 
             
     
     def _create_metallic_roughness_map(self, metal_map, rough_map):
-
+        _import_qt()
         metal = QImage(metal_map)
         rough = QImage(rough_map)
         metal_pixel = QColor()
@@ -669,15 +2407,15 @@ class Material(ExportItem):
                 metal_uchar_ptr[i:i+4] = struct.pack('I', metal_pixel.rgb())
                 i+=4
                 
-        output = ExportSettings.out_dir + "/"+self.name+"_metalRough.jpg"
+        output = self.ctx.settings.out_dir + "/"+self.name+"_metalRough.jpg"
         return output, metal
     
     @classmethod
-    def _get_default_material(cls):
-        if cls.default_material_id:
-            return Material.instances[cls.default_material_id]
+    def _get_default_material(cls, ctx):
+        if ctx.default_material:
+            return ctx.default_material
         else:
-            return Material(None)
+            return Material(ctx, None)
     
     def to_json(self):
         pbr = {}
@@ -686,13 +2424,16 @@ class Material(ExportItem):
         # TODO: Support doubleSided property
         mat_def = {'pbrMetallicRoughness': pbr}
         mat_def['alphaMode'] = 'BLEND'
+        precision = self.ctx.settings.material_precision
         if self.base_color_texture:
             pbr['baseColorTexture'] = {'index':self.base_color_texture.index}
-            color = QImage(self.base_color_texture.image.src_file_path)
-            if not color.hasAlphaChannel():
+            _import_qt()
+            if self.alpha_mode:
+                mat_def['alphaMode'] = self.alpha_mode
+            elif not QImage(self.base_color_texture.image.src_file_path).hasAlphaChannel():
                 mat_def['alphaMode'] = 'OPAQUE'
         else:
-            pbr['baseColorFactor'] = self.base_color_factor
+            pbr['baseColorFactor'] = round_floats(self.base_color_factor, precision)
             if len(self.base_color_factor) == 4 \
                     and self.base_color_factor[3] < 1:
                 mat_def['alphaMode'] = 'BLEND'
@@ -702,8 +2443,8 @@ class Material(ExportItem):
         if self.metallic_roughness_texture:
             pbr['metallicRoughnessTexture'] = {'index':self.metallic_roughness_texture.index}
         else:
-            pbr['metallicFactor'] = self.metallic_factor
-            pbr['roughnessFactor'] = self.roughness_factor
+            pbr['metallicFactor'], pbr['roughnessFactor'] = round_floats(
+                                [self.metallic_factor, self.roughness_factor], precision)
         if self.normal_texture:
             mat_def['normalTexture'] = {'index':self.normal_texture.index}
         if self.occlusion_texture:
@@ -711,31 +2452,26 @@ class Material(ExportItem):
         if self.emissive_texture:
             mat_def['emissiveTexture'] = {'index':self.emissive_texture.index}
         if self.emissive_factor:
-            mat_def['emissiveFactor'] = self.emissive_factor
+            mat_def['emissiveFactor'] = round_floats(self.emissive_factor, precision)
         
         return mat_def
 
 
 class Camera(ExportItem):
     '''Needs to add itself to node and cameras list'''
-    instances = []
     default_cameras = ['|top', '|front', '|side', '|persp']
     maya_node = None
     type_ = None
     znear = 0.1
     zfar = 1000
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, maya_node):
+    def __init__(self, ctx, maya_node):
         self.maya_node = maya_node
-        name = maya.cmds.ls(maya_node, shortNames=True)[0]
-        super(Camera, self).__init__(name=name)
-        self.index = len(Camera.instances)
-        self.znear = maya.cmds.camera(self.maya_node, query=True, nearClipPlane=True)
-        self.zfar = maya.cmds.camera(self.maya_node, query=True, farClipPlane=True)
+        name = cmds.ls(maya_node, shortNames=True)[0]
+        super(Camera, self).__init__(ctx, name=name)
+        self.index = len(ctx.cameras)
+        self.znear = cmds.camera(self.maya_node, query=True, nearClipPlane=True)
+        self.zfar = cmds.camera(self.maya_node, query=True, farClipPlane=True)
         
         
     def to_json(self):
@@ -751,11 +2487,11 @@ class Camera(ExportItem):
 class PerspectiveCamera(Camera):
     type_= 'perspective'
     
-    def __init__(self, maya_node):
-        super(PerspectiveCamera, self).__init__(maya_node)
-        self.aspect_ratio = maya.cmds.camera(self.maya_node, query=True, aspectRatio=True)
-        self.yfov = math.radians(maya.cmds.camera(self.maya_node, query=True, verticalFieldOfView=True))
-        Camera.instances.append(self)
+    def __init__(self, ctx, maya_node):
+        super(PerspectiveCamera, self).__init__(ctx, maya_node)
+        self.aspect_ratio = cmds.camera(self.maya_node, query=True, aspectRatio=True)
+        self.yfov = math.radians(cmds.camera(self.maya_node, query=True, verticalFieldOfView=True))
+        ctx.cameras.append(self)
         
     def to_json(self):
         camera_def = super(PerspectiveCamera, self).to_json()
@@ -768,11 +2504,11 @@ class OrthographicCamera(Camera):
     xmag = 1.0
     ymag = 1.0
     
-    def __init__(self, maya_node):
-        super(OrthographicCamera, self).__init__(maya_node)
-        self.xmag = maya.cmds.camera(self.maya_node, query=True, orthographicWidth=True)
+    def __init__(self, ctx, maya_node):
+        super(OrthographicCamera, self).__init__(ctx, maya_node)
+        self.xmag = cmds.camera(self.maya_node, query=True, orthographicWidth=True)
         self.ymag = self.xmag
-        Camera.instances.append(self)
+        ctx.cameras.append(self)
     
     def to_json(self):
         camera_def = super(OrthographicCamera, self).to_json()
@@ -782,17 +2518,12 @@ class OrthographicCamera(Camera):
     
     
 class Animation(ExportItem):
-    instances = []
     channels = None
     samplers = None
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, name=''):
-        super(Animation, self).__init__(name)
-        self.instances.append(self)
+    def __init__(self, ctx, name=''):
+        super(Animation, self).__init__(ctx, name)
+        ctx.animations.append(self)
         self.channels = []
         self.samplers = []
     
@@ -805,24 +2536,22 @@ class Animation(ExportItem):
         self.samplers.append(sampler)
         
     def to_json(self):
-        anim_def = {'channels': self.channels, 'samplers': self.samplers}
+        anim_def = {'channels': [channel.to_json() for channel in self.channels],
+                    'samplers': [sampler.to_json() for sampler in self.samplers]}
         return anim_def
         
     
 class AnimationChannel(ExportItem):
-    maya_node = None
-    node = None
-    path = None
-    sampler = None
+    __slots__ = ('index', 'maya_node', 'node', 'path', 'sampler')
     
-    def __init__(self, node, path):
+    def __init__(self, ctx, node, path):
         self.maya_node = node.maya_node
         self.node = node
         self.path = path
-        name = maya.cmds.ls(self.maya_node, shortNames=True)[0]
+        name = cmds.ls(self.maya_node, shortNames=True)[0]
         name = '{}_{}_channel'.format(name, path)
-        super(AnimationChannel, self).__init__(name)
-        self.sampler = AnimationSampler(self)
+        super(AnimationChannel, self).__init__(ctx, name)
+        self.sampler = AnimationSampler(self.ctx, self)
             
     
     def to_json(self):
@@ -843,44 +2572,367 @@ class AnimationSampler(ExportItem):
                     'stepnext':'STEP','fixed':'CUBICSPLINE',
                     'clamped':'CUBICSPLINE', 'plateau':'CUBICSPLINE'}
     time_map = {'game':15.0,'film':24.0,'pal':25.0,'ntsc':30.0,'show':48.0,'palf':50.0,'ntscf':60.0}
+    # animCurves driven by time, which are read directly instead of evaluated
+    curve_types = ('animCurveTL', 'animCurveTA', 'animCurveTU')
+    # rotate order enum -> axes in the order they're applied
+    rotate_orders = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0))
+    # seconds before the next key that a stepped key holds to in a cubic spline
+    step_hold = 0.001
+    # largest euler change in radians between cubic rotation keys
+    max_euler_step = math.pi / 4
+    # times added inside every segment of a curve with weighted tangents
+    weighted_samples = 4
+    # seconds over which the slopes of curves evaluated by Maya are measured
+    slope_step = 0.0001
     
-    def __init__(self, anim_channel):
+    def __init__(self, ctx, anim_channel):
         node = anim_channel.node
         path = anim_channel.path
         name = '{}_{}_sampler'.format(node, path)
-        super(AnimationSampler, self).__init__(name)
+        super(AnimationSampler, self).__init__(ctx, name)
+        if path == 'weights':
+            self._get_weights(node.mesh)
+            return
+        
+        curves = self._get_curves(node.maya_node, path) if numpy is not None else None
+        if curves is None:
+            self._sample(node, path)
+            return
+        self.ctx.profiler.count('anim_curves', len(curves))
+        times, values, in_tangents, out_tangents = self._merge_curves(node, path, curves)
+        if path == 'rotation':
+            values, in_tangents, out_tangents = self._rotation_keys(node, values, in_tangents, out_tangents)
+        if self.interpolation == 'CUBICSPLINE':
+            # an in-tangent, value, out-tangent triplet per key
+            values = numpy.stack((in_tangents, values, out_tangents), axis=1).reshape(-1, values.shape[1])
+        primary_buffer = self.ctx.buffer_for('animation')
+        self.input_accessor = Accessor(self.ctx, times, "SCALAR", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tTime')
+        self.input_accessor.min_ = [float(times[0])]
+        self.input_accessor.max_ = [float(times[-1])]
+        type_ = "VEC4" if path == 'rotation' else "VEC3"
+        self.output_accessor = Accessor(self.ctx, values, type_, ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
+    
+    def _get_curves(self, maya_node, path):
+        '''Axis index -> animCurve of the path's X, Y and Z plugs.  None when
+        a plug is driven by anything other than a plain animCurve, such as
+        animation layers or constraints, and has to be evaluated.'''
+        attr = self.attr_map[path]
+        plugs = [maya_node + '.' + attr] + [maya_node + '.' + attr + axis for axis in 'XYZ']
+        connections = cmds.listConnections(plugs, source=True, destination=False, connections=True) or []
+        curves = {}
+        for plug, source in zip(connections[::2], connections[1::2]):
+            axis = plug.rsplit('.', 1)[-1][len(attr):]
+            if axis not in ('X', 'Y', 'Z') or cmds.objectType(source) not in self.curve_types:
+                return None
+            curves['XYZ'.index(axis)] = source
+        return curves or None
+    
+    @staticmethod
+    def _read_curve(curve):
+        '''Key times in seconds, values and in and out slopes per second in internal
+        units, whether each key steps or is linear on both sides, and the function
+        set of the curve when its keys don't describe it as Hermite segments held
+        constant outside them: weighted tangents, or infinity other than constant.'''
+        import maya.api.OpenMaya as om2
+        import maya.api.OpenMayaAnim as oma2
+        curve_fn = oma2.MFnAnimCurve(om2.MSelectionList().add(curve).getDependNode(0))
+        count = curve_fn.numKeys
+        keys = numpy.empty((count, 4))
+        steps = numpy.empty(count, dtype=bool)
+        linear = numpy.empty(count, dtype=bool)
+        step_types = (oma2.MFnAnimCurve.kTangentStep, oma2.MFnAnimCurve.kTangentStepNext)
+        for i in range(count):
+            # tangents are (x, y) vectors with x in seconds
+            in_x, in_y = curve_fn.getTangentXY(i, True)
+            out_x, out_y = curve_fn.getTangentXY(i, False)
+            keys[i] = (curve_fn.input(i).asUnits(om2.MTime.kSeconds), curve_fn.value(i),
+                        in_y / in_x if in_x else 0.0, out_y / out_x if out_x else 0.0)
+            out_type = curve_fn.outTangentType(i)
+            steps[i] = out_type in step_types
+            linear[i] = (out_type == oma2.MFnAnimCurve.kTangentLinear
+                            and curve_fn.inTangentType(i) == oma2.MFnAnimCurve.kTangentLinear)
+        if not (curve_fn.isWeighted or curve_fn.preInfinityType != oma2.MFnAnimCurve.kConstant
+                or curve_fn.postInfinityType != oma2.MFnAnimCurve.kConstant):
+            curve_fn = None
+        return keys, steps, linear, curve_fn
+    
+    @staticmethod
+    def _evaluate_curve(keys, steps, times):
+        '''Values and in and out slopes of a curve at times.  Keys keep their
+        own tangents, times between keys get the Hermite segment's value and
+        slope, and times outside the keys hold the first or last value.'''
+        key_times = keys[:, 0]
+        # the curve is constant outside its keys
+        keys = keys.copy()
+        keys[0, 2] = keys[-1, 3] = 0.0
+        first = numpy.clip(numpy.searchsorted(key_times, times, side='right') - 1, 0, len(keys) - 1)
+        second = numpy.minimum(first + 1, len(keys) - 1)
+        length = key_times[second] - key_times[first]
+        inside = (length > 0) & (times > key_times[0])
+        length = numpy.where(inside, length, 1.0)
+        s = numpy.where(inside, (times - key_times[first]) / length, 0.0)
+        v0, m0 = keys[first, 1], keys[first, 3]
+        v1, m1 = keys[second, 1], keys[second, 2]
+        values = ((2 * s ** 3 - 3 * s ** 2 + 1) * v0 + (s ** 3 - 2 * s ** 2 + s) * length * m0
+                    + (-2 * s ** 3 + 3 * s ** 2) * v1 + (s ** 3 - s ** 2) * length * m1)
+        slopes = ((6 * s ** 2 - 6 * s) * (v0 - v1) / length
+                    + (3 * s ** 2 - 4 * s + 1) * m0 + (3 * s ** 2 - 2 * s) * m1)
+        held = ~inside | steps[first]
+        values = numpy.where(held, v0, values)
+        slopes = numpy.where(held, 0.0, slopes)
+        on_key = times == key_times[first]
+        return (numpy.where(on_key, v0, values), numpy.where(on_key, keys[first, 2], slopes),
+                numpy.where(on_key, keys[first, 3], slopes))
+    
+    def _merge_curves(self, node, path, curves):
+        '''Reads the curves of all axes and merges them onto the union of their
+        key times.  Axes without a curve keep their static value.  Returns
+        times, values, in and out tangents in export units and sets interpolation.
+        
+        Curves with weighted tangents or cycle, oscillate or linear infinity are
+        evaluated by Maya instead, see _sample_curve.  Weighted segments get
+        weighted_samples extra times and the spline through them approximates the
+        weighted curve.  Infinity only shows between the keys of the curve and those
+        of the other axes, the clip still starts and ends with the keys of all axes.'''
+        import maya.api.OpenMaya as om2
+        read = dict((axis, self._read_curve(curve)) for axis, curve in curves.items())
+        # the last key's out tangent doesn't matter
+        if all(steps[:-1].all() for keys, steps, linear, curve_fn in read.values()):
+            self.interpolation = 'STEP'
+        elif all(linear.all() for keys, steps, linear, curve_fn in read.values()):
+            self.interpolation = 'LINEAR'
+        else:
+            self.interpolation = 'CUBICSPLINE'
+        times = [keys[:, 0] for keys, steps, linear, curve_fn in read.values()]
+        if self.interpolation == 'CUBICSPLINE':
+            # hold stepped segments until just before their next key
+            times.extend(keys[1:, 0][steps[:-1]] - self.step_hold for keys, steps, linear, curve_fn in read.values())
+        times = numpy.unique(numpy.concatenate(times))
+        extra = []
+        for keys, steps, linear, curve_fn in read.values():
+            # the times of one pass over the keys
+            pattern = [keys[:, 0]]
+            if self.interpolation == 'CUBICSPLINE' and path == 'rotation':
+                # a quaternion spline drifts from the euler curve over big turns
+                counts = numpy.ceil(numpy.abs(numpy.diff(keys[:, 1])) / self.max_euler_step)
+                for index in numpy.flatnonzero((counts > 1) & ~steps[:-1]):
+                    pattern.append(numpy.linspace(keys[index, 0], keys[index + 1, 0], int(counts[index]) + 1)[1:-1])
+            if curve_fn is None:
+                extra.extend(pattern[1:])
+                continue
+            if self.interpolation == 'CUBICSPLINE':
+                pattern.append(keys[1:, 0][steps[:-1]] - self.step_hold)
+                if curve_fn.isWeighted:
+                    for index in numpy.flatnonzero(~steps[:-1]):
+                        pattern.append(numpy.linspace(keys[index, 0], keys[index + 1, 0],
+                                                        self.weighted_samples + 2)[1:-1])
+            pattern = numpy.concatenate(pattern)
+            extra.append(pattern)
+            extra.append(self._infinity_times(keys, pattern, curve_fn.preInfinityType, times[0], keys[0, 0]))
+            extra.append(self._infinity_times(keys, pattern, curve_fn.postInfinityType, keys[-1, 0], times[-1]))
+        if extra:
+            extra = numpy.sort(numpy.concatenate(extra))
+            extra = extra[numpy.concatenate(([True], numpy.diff(extra) > self.step_hold / 2))]
+            nearest = numpy.clip(numpy.searchsorted(times, extra), 1, len(times) - 1)
+            gaps = numpy.minimum(numpy.abs(times[nearest] - extra), numpy.abs(times[nearest - 1] - extra))
+            times = numpy.unique(numpy.concatenate((times, extra[gaps > self.step_hold / 2])))
+        static = cmds.getAttr(node.maya_node + '.' + self.attr_map[path])[0]
+        if path == 'translation':
+            # curves are in internal units, getAttr in UI units
+            scale = om2.MDistance(1.0, om2.MDistance.internalUnit()).asUnits(om2.MDistance.uiUnit())
+        else:
+            scale = 1.0
+        values = numpy.empty((len(times), 3))
+        in_tangents = numpy.zeros((len(times), 3))
+        out_tangents = numpy.zeros((len(times), 3))
+        for axis in range(3):
+            if axis not in read:
+                value = static[axis]
+                if path == 'rotation':
+                    value = om2.MAngle(value, om2.MAngle.uiUnit()).asRadians()
+                values[:, axis] = value
+                continue
+            keys, steps, linear, curve_fn = read[axis]
+            if curve_fn is None:
+                curve_values, curve_in, curve_out = self._evaluate_curve(keys, steps, times)
+            else:
+                curve_values, curve_in, curve_out = self._sample_curve(curve_fn, keys, times)
+            values[:, axis] = curve_values * scale
+            in_tangents[:, axis] = curve_in * scale
+            out_tangents[:, axis] = curve_out * scale
+        return times, values, in_tangents, out_tangents
+    
+    def _infinity_times(self, keys, pattern, infinity, start, end):
+        '''Times between start and end, outside the keys, at which a curve with
+        cycle, cycle with offset or oscillate infinity repeats pattern, the times
+        of one pass over its keys.  A plain cycle that doesn't end on the value
+        it starts with jumps back at every repeat, and stepped keys step back
+        right after every turn of oscillate, those get times just before and
+        after every repeat.  Linear infinity needs no times of its own.'''
+        import maya.api.OpenMayaAnim as oma2
+        first, last = keys[0, 0], keys[-1, 0]
+        period = last - first
+        if period <= 0 or infinity not in (oma2.MFnAnimCurve.kCycle, oma2.MFnAnimCurve.kCycleRelative,
+                                            oma2.MFnAnimCurve.kOscillate):
+            return numpy.empty(0)
+        offsets = pattern - first
+        times = []
+        for cycle in range(int(math.floor((start - first) / period)), int(math.ceil((end - first) / period)) + 1):
+            cycle_start = first + cycle * period
+            if infinity == oma2.MFnAnimCurve.kOscillate and cycle % 2:
+                times.append(cycle_start + period - offsets)
+            else:
+                times.append(cycle_start + offsets)
+            if (infinity == oma2.MFnAnimCurve.kOscillate
+                    or infinity == oma2.MFnAnimCurve.kCycle and keys[0, 1] != keys[-1, 1]):
+                times.append(cycle_start + numpy.array([-self.step_hold, self.step_hold]))
+        times = numpy.concatenate(times)
+        return times[(times >= start) & (times <= end) & ((times < first) | (times > last))]
+    
+    def _sample_curve(self, curve_fn, keys, times):
+        '''Values and in and out slopes of a curve at times, evaluated by Maya with
+        its weighted tangents and infinity.  Keys keep their own tangents, other
+        times get the slopes just before and after them, measured over slope_step.'''
+        import maya.api.OpenMaya as om2
+        import maya.api.OpenMayaAnim as oma2
         
-        keyframes = maya.cmds.keyframe(node.maya_node, attribute=self.attr_map[path], query=True, timeChange=True)
+        def evaluate(at):
+            return numpy.array([curve_fn.evaluate(om2.MTime(float(seconds), om2.MTime.kSeconds)) for seconds in at])
+        step = self.slope_step
+        # a hair after the time, so a repeated key that rounds to just before it still steps
+        values = evaluate(times + step / 1000)
+        # from either side only, so a cycle that jumps back to its first value keeps its slopes
+        in_slopes = (evaluate(times - step) - evaluate(times - 2 * step)) / step
+        out_slopes = (evaluate(times + 2 * step) - evaluate(times + step)) / step
+        key_index = numpy.clip(numpy.searchsorted(keys[:, 0], times), 0, len(keys) - 1)
+        on_key = keys[key_index, 0] == times
+        values[on_key] = keys[key_index[on_key], 1]
+        # the slopes outside the keys are those of the infinity, flat when it's constant
+        in_keys = on_key & (key_index > 0)
+        out_keys = on_key & (key_index < len(keys) - 1)
+        in_slopes[in_keys] = keys[key_index[in_keys], 2]
+        out_slopes[out_keys] = keys[key_index[out_keys], 3]
+        if curve_fn.preInfinityType == oma2.MFnAnimCurve.kConstant:
+            in_slopes[on_key & (key_index == 0)] = 0.0
+        if curve_fn.postInfinityType == oma2.MFnAnimCurve.kConstant:
+            out_slopes[on_key & (key_index == len(keys) - 1)] = 0.0
+        return values, in_slopes, out_slopes
+    
+    @staticmethod
+    def _multiply_quaternions(a, b):
+        '''Hamilton products of (n, 4) arrays of (x, y, z, w) quaternions, b applied first.'''
+        ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+        bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+        return numpy.stack((aw * bx + ax * bw + ay * bz - az * by,
+                            aw * by - ax * bz + ay * bw + az * bx,
+                            aw * bz + ax * by - ay * bx + az * bw,
+                            aw * bw - ax * bx - ay * by - az * bz), axis=-1)
+    
+    def _euler_quaternions(self, angles, order):
+        '''Quaternions of (n, 3) euler angles in radians and their derivatives
+        with respect to each angle, for a Maya rotate order.'''
+        axis_quats = []
+        axis_derivatives = []
+        for axis in range(3):
+            half = angles[:, axis] / 2
+            quat = numpy.zeros((len(angles), 4))
+            quat[:, axis] = numpy.sin(half)
+            quat[:, 3] = numpy.cos(half)
+            derivative = numpy.zeros((len(angles), 4))
+            derivative[:, axis] = numpy.cos(half) / 2
+            derivative[:, 3] = -numpy.sin(half) / 2
+            axis_quats.append(quat)
+            axis_derivatives.append(derivative)
+        first, second, third = self.rotate_orders[order]
+        
+        def compose(quats):
+            return self._multiply_quaternions(quats[third], self._multiply_quaternions(quats[second], quats[first]))
+        derivatives = []
+        for axis in range(3):
+            quats = list(axis_quats)
+            quats[axis] = axis_derivatives[axis]
+            derivatives.append(compose(quats))
+        return compose(axis_quats), derivatives
+    
+    def _rotation_keys(self, node, angles, in_rates, out_rates):
+        '''Quaternion keys and tangents of euler keys and their rates.  Joints
+        include rotateAxis and jointOrient like their static rotation.'''
+        order = cmds.getAttr(node.maya_node + '.rotateOrder')
+        quats, derivatives = self._euler_quaternions(angles, order)
+        in_tangents = sum(derivatives[axis] * in_rates[:, axis:axis + 1] for axis in range(3))
+        out_tangents = sum(derivatives[axis] * out_rates[:, axis:axis + 1] for axis in range(3))
+        if cmds.objectType(node.maya_node) == 'joint':
+            import maya.api.OpenMaya as om2
+            ui_unit = om2.MAngle.uiUnit()
+            pre, post = [self._euler_quaternions(
+                            numpy.array([[om2.MAngle(value, ui_unit).asRadians() for value in
+                                            cmds.getAttr(node.maya_node + '.' + attr)[0]]]), 0)[0]
+                            for attr in ('rotateAxis', 'jointOrient')]
+            quats, in_tangents, out_tangents = [
+                self._multiply_quaternions(post, self._multiply_quaternions(values, pre))
+                for values in (quats, in_tangents, out_tangents)]
+        # keep neighbouring keys in the same hemisphere so they interpolate the short way
+        flips = numpy.ones(len(quats))
+        flips[1:] = numpy.where((quats[1:] * quats[:-1]).sum(axis=1) < 0, -1.0, 1.0)
+        flips = numpy.cumprod(flips)[:, None]
+        return quats * flips, in_tangents * flips, out_tangents * flips
+    
+    def _sample(self, node, path):
+        '''Samples the attribute through the DG at its key times.  Only values
+        are written, so curved keys are interpolated linearly.'''
+        keyframes = cmds.keyframe(node.maya_node, attribute=self.attr_map[path], query=True, timeChange=True)
         keyframes = sorted(list(set(keyframes)))
         self.interpolation = self._get_interpolation(node.maya_node, path, keyframes[0])
+        if self.interpolation == 'CUBICSPLINE':
+            self.interpolation = 'LINEAR'
         
         values = []
         if path in ['translation', 'scale']:
             for keyframe in keyframes:
                 # Use get attr at a time because not every attr might have a keyframe
-                values.append(maya.cmds.getAttr(node.maya_node+'.'+self.attr_map[path], time=keyframe)[0])
+                values.append(cmds.getAttr(node.maya_node+'.'+self.attr_map[path], time=keyframe)[0])
         else:
             for keyframe in keyframes:
-                maya.cmds.currentTime(keyframe, edit=True)
+                cmds.currentTime(keyframe, edit=True)
                 values.append(node._get_rotation_quaternion())
-        if not len(Buffer.instances):
-            primary_buffer = Buffer('primary_buffer')
-        else:
-            primary_buffer = Buffer.instances[0]
-        time_unit = maya.cmds.currentUnit(query=True, time=True)
+        primary_buffer = self.ctx.buffer_for('animation')
+        time_unit = cmds.currentUnit(query=True, time=True)
         fps = self.time_map[time_unit]
         keyframes = [key/fps for key in keyframes]
-        self.input_accessor = Accessor(keyframes, "SCALAR", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tTime')
+        self.input_accessor = Accessor(self.ctx, keyframes, "SCALAR", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tTime')
         self.input_accessor.min_ = [keyframes[0]]
         self.input_accessor.max_ = [keyframes[-1]]
         if path in ['translation', 'scale']:
-            self.output_accessor = Accessor(values, "VEC3", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
+            self.output_accessor = Accessor(self.ctx, values, "VEC3", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
         else:
-            self.output_accessor = Accessor(values, "VEC4", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
+            self.output_accessor = Accessor(self.ctx, values, "VEC4", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
         
+    def _get_weights(self, mesh):
+        '''Samples all morph target weights at the keys of any of them.'''
+        plugs = mesh.morph_weight_plugs()
+        keyframes = sorted(set(cmds.keyframe(plugs, query=True, timeChange=True)))
+        out_tangent = cmds.keyTangent(plugs, time=(keyframes[0], keyframes[0]),
+                                            query=True, outTangentType=True)
+        # Only values are written, so curved weights are sampled linearly between keys
+        if out_tangent and self.interp_map[out_tangent[0]] == 'STEP':
+            self.interpolation = 'STEP'
+        else:
+            self.interpolation = 'LINEAR'
+        values = array.array('f')
+        for keyframe in keyframes:
+            # the whole weight array in one call per key
+            values.extend(cmds.getAttr(mesh.blend_shape + '.weight', time=keyframe)[0])
+        primary_buffer = self.ctx.buffer_for('animation')
+        fps = self.time_map[cmds.currentUnit(query=True, time=True)]
+        keyframes = [key/fps for key in keyframes]
+        self.input_accessor = Accessor(self.ctx, keyframes, "SCALAR", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tTime')
+        self.input_accessor.min_ = [keyframes[0]]
+        self.input_accessor.max_ = [keyframes[-1]]
+        self.output_accessor = Accessor(self.ctx, values, "SCALAR", ComponentTypes.FLOAT, None, primary_buffer, name=self.name + '_tVal')
+    
     def _get_interpolation(self, node, path, first_key):
         for axis in ['X','Y','Z']:   
-            out_tangent = maya.cmds.keyTangent(node, attribute=self.attr_map[path]+axis, time=(first_key,first_key), query=True, outTangentType=True)
+            out_tangent = cmds.keyTangent(node, attribute=self.attr_map[path]+axis, time=(first_key,first_key), query=True, outTangentType=True)
             if out_tangent:
                 return self.interp_map[out_tangent[0]]
             
@@ -894,64 +2946,82 @@ class AnimationSampler(ExportItem):
 # TODO: check to see if the image has been used
 class Image(ExportItem):
     '''Needs to be added to images list and it's texture'''
-    instances = []
     name = None
     uri = None
     buffer_view = None
     mime_type = None
     src_file_path = ""
+    # image to write to src_file_path, until the image is stored
+    qimage = None
+    # src_file_path was written by the export and only kept for source resources
+    generated = False
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, file_path, qimage=None):
+    def __init__(self, ctx, file_path, qimage=None, generated=False):
         file_name = os.path.basename(file_path)
         self.src_file_path = file_path
-        super(Image, self).__init__(name=file_name)
-        self.index = len(Image.instances)
-        Image.instances.append(self)
+        super(Image, self).__init__(ctx, name=file_name)
+        self.index = len(ctx.images)
+        ctx.images.append(self)
         base, ext = os.path.splitext(file_path)
         mime_suffix = ext.lower()[1:]
         if mime_suffix == 'jpg':
             mime_suffix = 'jpeg'
         self.mime_type = 'image/{}'.format(mime_suffix)
-        
-        # Need to write this out temporarily or permanently
-        # depending on resource_format
-        if qimage:
-                writer = QImageWriter(file_path, QByteArray(bytes(str(mime_suffix).encode("latin-1"))));
-                writer.write(qimage);
-                # delete the write to close file handle
-                del writer
-                
-        if ExportSettings.resource_format == ResourceFormats.SOURCE:
-            if not qimage:
-                shutil.copy(file_path, ExportSettings.out_dir)
-            self.uri = file_name
-        else:
-            with open(file_path, 'rb') as f:
-                img_bytes = f.read()
+        self.qimage = qimage
+        self.generated = generated or qimage is not None
+        # images are only stored once the texture atlas has replaced some of them
+        if not ctx.defer_images:
+            self.store()
+    
+    def write_qimage(self):
+        '''Writes a pending generated image to src_file_path.'''
+        if self.qimage:
+            mime_suffix = self.mime_type.split('/')[1]
+            _release_output(self.src_file_path)
+            writer = QImageWriter(self.src_file_path, QByteArray(bytes(str(mime_suffix).encode("latin-1"))));
+            writer.write(self.qimage);
+            # delete the write to close file handle
+            del writer
+            self.qimage = None
+    
+    def store(self):
+        '''Writes the image out or into the buffer, depending on resource_format.'''
+        file_path = self.src_file_path
+        file_name = self.name
+        with self.ctx.profiler.phase('images'):
+            # Need to write this out temporarily or permanently
+            # depending on resource_format
+            self.write_qimage()
+            if self.ctx.settings.resource_format == ResourceFormats.SOURCE:
+                if not self.generated:
+                    out_path = os.path.join(self.ctx.settings.out_dir, file_name)
+                    if os.path.abspath(out_path) != os.path.abspath(file_path):
+                        _release_output(out_path)
+                    shutil.copy(file_path, self.ctx.settings.out_dir)
+                self.uri = file_name
+            else:
+                with open(file_path, 'rb') as f:
+                    img_bytes = f.read()
             
-            # Remove the temp qimage because resource_format isn't source
-            if qimage:
-                os.remove(file_path)
+                # Remove the temp qimage because resource_format isn't source
+                if self.generated:
+                    os.remove(file_path)
             
-            if (ExportSettings.resource_format == ResourceFormats.BIN
-                    or ExportSettings.file_format == 'glb'):
-                single_buffer = Buffer.instances[0]
-                buffer_end = len(single_buffer)
-                single_buffer.byte_str += img_bytes
-                self.buffer_view = BufferView(single_buffer, buffer_end)
+                if (self.ctx.settings.resource_format == ResourceFormats.BIN
+                        or self.ctx.settings.file_format == 'glb'):
+                    single_buffer = self.ctx.fit(self.ctx.buffer_for('image_' + self.name), len(img_bytes))
+                    buffer_end = len(single_buffer)
+                    single_buffer.byte_str += img_bytes
+                    self.buffer_view = BufferView(self.ctx, single_buffer, buffer_end)
                 
-                # 4-byte-aligned
-                aligned_len = (len(img_bytes) + 3) & ~3
-                for i in range(aligned_len - len(img_bytes)):
-                    single_buffer.byte_str += b'0'
+                    # 4-byte-aligned
+                    aligned_len = (len(img_bytes) + 3) & ~3
+                    for i in range(aligned_len - len(img_bytes)):
+                        single_buffer.byte_str += b'0'
                     
-        if (ExportSettings.file_format == 'gltf' and
-                ExportSettings.resource_format == ResourceFormats.EMBEDDED):
-            self.uri = "data:application/octet-stream;base64," + base64.b64encode(img_bytes).decode("latin-1")
+            if (self.ctx.settings.file_format == 'gltf' and
+                    self.ctx.settings.resource_format == ResourceFormats.EMBEDDED):
+                self.uri = DataURI(img_bytes, self.mime_type)
     
     def to_json(self):
         img_def = {'mimeType' : self.mime_type}
@@ -963,18 +3033,13 @@ class Image(ExportItem):
     
 class Texture(ExportItem):
     '''Needs to be added to textures list and it's material'''
-    instances = []
     image = None
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, image):
+    def __init__(self, ctx, image):
         self.image = image
-        super(Texture, self).__init__(name=image.name)
-        self.index = len(Texture.instances)
-        Texture.instances.append(self)
+        super(Texture, self).__init__(ctx, name=image.name)
+        self.index = len(ctx.textures)
+        ctx.textures.append(self)
     
     def to_json(self):
         return {'source':self.image.index}
@@ -985,67 +3050,87 @@ class Sampler(ExportItem):
         
     
 class Buffer(ExportItem):
-    instances = []
-    byte_str = b""
+    '''One chunk of a buffer group, see ExportContext.buffer_for.'''
+    byte_str = None
     uri = ''
+    group = None
+    # the (group, tile) buffer_for was first asked for, kept by snapshots
+    origin = (None, None)
+    # holds the uncompressed data of EXT_meshopt_compression bufferViews
+    fallback = False
+    # byteLength is a uint32
+    max_length = 2 ** 32 - 1
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, name=None):
-        super(Buffer, self).__init__(name=name)
-        self.index = len(Buffer.instances)
-        Buffer.instances.append(self)
-        if (ExportSettings.file_format == 'gltf'
-                and ExportSettings.resource_format == ResourceFormats.BIN):
-            self.uri = ExportSettings.out_bin
+    def __init__(self, ctx, group):
+        chunks = ctx.buffer_groups.setdefault(group, [])
+        name = '{}_{}'.format(group, len(chunks)) if chunks else group
+        super(Buffer, self).__init__(ctx, name=name)
+        self.group = group
+        chunks.append(self)
+        self.index = len(ctx.buffers)
+        ctx.buffers.append(self)
+        self.byte_str = bytearray()
+        settings = self.ctx.settings
+        if self.index == 0 and settings.file_format == 'glb':
+            # the GLB BIN chunk
+            pass
+        elif name == 'primary_buffer' and settings.resource_format == ResourceFormats.BIN:
+            self.uri = settings.out_bin
+        elif settings.resource_format == ResourceFormats.BIN or settings.file_format == 'glb':
+            # GLB files only hold one buffer, the rest are written next to it
+            self.uri = '{}_{}.bin'.format(settings.out_basename, re.sub(r'[^\w.-]', '_', name))
+            if any(buffer.uri == self.uri for buffer in ctx.buffers if buffer is not self):
+                # group names that only differ in characters that were replaced
+                self.uri = '{}_{}_{}.bin'.format(settings.out_basename, re.sub(r'[^\w.-]', '_', name), self.index)
     
     def __len__(self):
         return len(self.byte_str)
     
     def append_data(self, data, type_):
-        pack_type = '<' + type_
-        packed_data = []
-        for item in data:
-            if isinstance(item, (list, tuple)):
-                packed_data.append(struct.pack(pack_type, *item))
-            else:
-                packed_data.append(struct.pack(pack_type, item))
-        self.byte_str += b''.join(packed_data)
+        '''Packs data little-endian onto the end of the buffer.
+        data is either a sequence of scalars or tuples, a flat array.array or a numpy array.'''
+        code = type_[0]
+        if (numpy is not None and isinstance(data, numpy.ndarray)) or isinstance(data, array.array):
+            self.byte_str.extend(_packed_bytes(data, code))
+        else:
+            flat = []
+            for item in data:
+                if isinstance(item, (list, tuple)):
+                    flat.extend(item)
+                else:
+                    flat.append(item)
+            self.byte_str.extend(struct.pack('<{}{}'.format(len(flat), code), *flat))
         # 4-byte-aligned
         aligned_len = (len(self.byte_str) + 3) & ~3
-        for i in range(aligned_len - len(self.byte_str)):
-            self.byte_str += b'0'
+        self.byte_str.extend(b'0' * (aligned_len - len(self.byte_str)))
     
     def to_json(self):
         buffer_def = {"byteLength" : len(self)}
-        if self.uri and ExportSettings.resource_format == ResourceFormats.BIN:
+        if self.uri:
             buffer_def['uri'] = self.uri
-        elif ExportSettings.resource_format in [ResourceFormats.EMBEDDED, ResourceFormats.SOURCE]:
-            buffer_def['uri'] = "data:application/octet-stream;base64," + base64.b64encode(self.byte_str).decode("latin-1")
+        elif (self.ctx.settings.file_format == 'gltf'
+                and self.ctx.settings.resource_format in [ResourceFormats.EMBEDDED, ResourceFormats.SOURCE]
+                and not (self.fallback and not self.ctx.settings.meshopt_fallback)):
+            buffer_def['uri'] = DataURI(self.byte_str)
+        if self.fallback:
+            buffer_def['extensions'] = {MeshoptCompressor.extension: {'fallback': True}}
         # no uri for GLB
         return buffer_def
 
 class BufferView(ExportItem):
-    instances = []
-    buffer = None
-    byte_offset = None
-    byte_length = None
-    target = None
-    
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
+    __slots__ = ('index', 'buffer', 'byte_offset', 'byte_length', 'target', 'byte_stride', 'meshopt')
     
-    def __init__(self, buffer, byte_offset, target=None, name=None):
-        super(BufferView, self).__init__(name=name)
-        self.index = len(BufferView.instances)
-        BufferView.instances.append(self)
+    def __init__(self, ctx, buffer, byte_offset, target=None, name=None):
+        super(BufferView, self).__init__(ctx, name=name)
+        self.index = len(ctx.buffer_views)
+        ctx.buffer_views.append(self)
         self.buffer = buffer
         self.byte_offset = byte_offset
         self.byte_length = len(buffer) - byte_offset
         self.target = target
+        self.byte_stride = None
+        # EXT_meshopt_compression properties, set by MeshoptCompressor
+        self.meshopt = None
         
     def to_json(self):
         buffer_view_def = {
@@ -1053,67 +3138,1577 @@ class BufferView(ExportItem):
           "byteOffset" : self.byte_offset,
           "byteLength" : self.byte_length,
         }
+        if self.byte_stride:
+            buffer_view_def['byteStride'] = self.byte_stride
         if self.target:
             buffer_view_def['target'] = self.target
+        if self.meshopt:
+            buffer_view_def['extensions'] = {MeshoptCompressor.extension: self.meshopt}
             
         return buffer_view_def
 
 
 class ComponentTypes(object):
+    BYTE = 5120
+    UBYTE = 5121
+    SHORT = 5122
     USHORT = 5123
     UINT = 5125
     FLOAT = 5126
 
 
 class Accessor(ExportItem):
-    instances = []
-    buffer_view = None
-    byte_offset = 0
-    component_type = None
-    count = None
-    type_ = None
-    src_data = None
-    max_  = None
-    min_ = None
+    '''Packs its data into a buffer on creation and only keeps the count,
+    bounds and the buffer view it was packed into.'''
+    __slots__ = ('index', 'buffer_view', 'byte_offset', 'component_type', 'count',
+                    'type_', 'max_', 'min_', 'normalized')
     type_codes = {
         "SCALAR":1,
         "VEC2":2,
         "VEC3":3,
-        "VEC4":4
+        "VEC4":4,
+        "MAT4":16
     }
     component_type_codes = {
+        ComponentTypes.BYTE:"b", # signed char
+        ComponentTypes.UBYTE:"B", # unsigned char
+        ComponentTypes.SHORT:"h", # short
         ComponentTypes.USHORT:"H", # unsigned short
         ComponentTypes.UINT:"I", # unsigned int
         ComponentTypes.FLOAT:"f"  # float
     }
     
-    @classmethod
-    def set_defaults(cls):
-        cls.instances = []
-    
-    def __init__(self, data, type_, component_type, target, buffer, name=None):
-        super(Accessor, self).__init__(name=name)
-        self.index = len(Accessor.instances)
-        Accessor.instances.append(self)
-        self.src_data = data
+    def __init__(self, ctx, data, type_, component_type, target, buffer, name=None):
+        super(Accessor, self).__init__(ctx, name=name)
+        self.index = len(ctx.accessors)
+        ctx.accessors.append(self)
+        self.byte_offset = 0
+        self.max_ = None
+        self.min_ = None
+        self.normalized = False
         self.component_type = component_type
         self.type_= type_
-        byte_code = self.component_type_codes[component_type]*self.type_codes[type_]
-        
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            self.count = data.size // self.type_codes[type_]
+        elif isinstance(data, array.array):
+            # flat component arrays
+            self.count = len(data) // self.type_codes[type_]
+        else:
+            self.count = len(data)
+        self.buffer_view = self._pack(data, type_, component_type, target, buffer)
+    
+    @classmethod
+    def _pack(cls, data, type_, component_type, target, buffer):
+        '''Appends data to the buffer and returns the buffer view it occupies.'''
+        byte_code = cls.component_type_codes[component_type]*cls.type_codes[type_]
+        if (numpy is not None and isinstance(data, numpy.ndarray)) or isinstance(data, array.array):
+            nbytes = len(data) if isinstance(data, array.array) else data.size
+            nbytes *= struct.calcsize('<' + byte_code[0])
+        else:
+            nbytes = len(data) * struct.calcsize('<' + byte_code)
+        buffer = buffer.ctx.fit(buffer, nbytes)
         buffer_end = len(buffer)
-        buffer.append_data(self.src_data, byte_code)
-        self.buffer_view = BufferView(buffer, buffer_end, target)
+        buffer.append_data(data, byte_code)
+        return BufferView(buffer.ctx, buffer, buffer_end, target)
         
     def to_json(self):
         accessor_def = {
           "bufferView" : self.buffer_view.index,
           "byteOffset" : self.byte_offset,
           "componentType" : self.component_type,
-          "count" : len(self.src_data),
+          "count" : self.count,
           "type" : self.type_
         }
+        if self.normalized:
+            accessor_def['normalized'] = True
         if self.max_:
             accessor_def['max'] = self.max_
         if self.min_:
             accessor_def['min'] = self.min_
         return accessor_def
+
+
+class SparseAccessor(Accessor):
+    '''Accessor without a bufferView, count zero elements of which only the
+    ones at indices are replaced by values.'''
+    __slots__ = ('sparse_count', 'indices_component_type', 'indices_view', 'values_view')
+    
+    def __init__(self, ctx, count, indices, values, type_, component_type, indices_component_type,
+                    buffer, name=None):
+        ExportItem.__init__(self, ctx, name=name)
+        self.index = len(ctx.accessors)
+        ctx.accessors.append(self)
+        self.byte_offset = 0
+        self.max_ = None
+        self.min_ = None
+        self.normalized = False
+        self.component_type = component_type
+        self.type_ = type_
+        self.count = count
+        self.buffer_view = None
+        self.sparse_count = len(indices)
+        self.indices_component_type = indices_component_type
+        self.indices_view = None
+        self.values_view = None
+        # all zero needs neither indices nor values
+        if self.sparse_count:
+            self.indices_view = self._pack(indices, "SCALAR", indices_component_type, None, buffer)
+            self.values_view = self._pack(values, type_, component_type, None, buffer)
+    
+    def to_json(self):
+        accessor_def = {
+          "componentType" : self.component_type,
+          "count" : self.count,
+          "type" : self.type_
+        }
+        if self.sparse_count:
+            accessor_def['sparse'] = {
+                "count" : self.sparse_count,
+                "indices" : {"bufferView" : self.indices_view.index,
+                             "componentType" : self.indices_component_type},
+                "values" : {"bufferView" : self.values_view.index}
+            }
+        if self.max_:
+            accessor_def['max'] = self.max_
+        if self.min_:
+            accessor_def['min'] = self.min_
+        return accessor_def
+
+
+class TextureAtlas(object):
+    '''Packs the textures of materials into shared atlases and merges the materials.
+    
+    A material takes part when it has a base color texture and no occlusion or
+    emissive texture, its metallic-roughness and normal textures have the size
+    of its base color texture and the TEXCOORD_0 of all its meshes is within 0-1.
+    Materials that only differ in these textures are placed on the same atlases
+    by a skyline bottom-left packer, one atlas per texture slot with every
+    material at the same place in each.  The materials on an atlas become one
+    material and the TEXCOORD_0 of their meshes is remapped into their rectangle.
+    Each texture is surrounded by atlas_padding copies of its edge pixels so
+    filtering doesn't bleed into its neighbours.
+    '''
+    # material attribute, file name suffix
+    slots = (('base_color_texture', 'baseColor'),
+                ('metallic_roughness_texture', 'metalRough'),
+                ('normal_texture', 'normal'))
+    # slack for TEXCOORD_0 at the texture edges
+    uv_tolerance = 1e-4
+    
+    def __init__(self, ctx, materials=True):
+        self.ctx = ctx
+        self.selection = None if materials is True else set(materials)
+        # material name -> why it wasn't atlased
+        self.skipped = {}
+        self.stats = {}
+        # image -> (ARGB32 pixels, has alpha, bytes the image would be written with)
+        self._pixels = {}
+    
+    def run(self):
+        _import_qt()
+        ctx = self.ctx
+        # primitives of split meshes have their own TEXCOORD_0
+        meshes_by_material = {}
+        for mesh in ctx.meshes:
+            meshes_by_material.setdefault(mesh.material, []).extend(mesh.primitives)
+        candidates = []
+        for material in ctx.materials:
+            if (material not in meshes_by_material or material is ctx.default_material
+                    or (self.selection is not None and material.name not in self.selection)):
+                continue
+            reason = self._skip_reason(material, meshes_by_material[material])
+            if reason:
+                self.skipped[material.name] = reason
+            else:
+                candidates.append(material)
+        
+        images = []
+        for material in candidates:
+            images.extend(texture.image for texture in self._textures(material))
+        for image, loaded in zip(images, self._parallel(self._load, [(image,) for image in images])):
+            self._pixels[image] = loaded
+        
+        group_keys = []
+        groups = {}
+        for material in candidates:
+            reason = self._size_reason(material)
+            if reason:
+                self.skipped[material.name] = reason
+                continue
+            key = self._group_key(material)
+            if key not in groups:
+                group_keys.append(key)
+                groups[key] = []
+            groups[key].append(material)
+        pages = []
+        for key in group_keys:
+            if len(groups[key]) < 2:
+                self.skipped[groups[key][0].name] = 'nothing to share an atlas with'
+                continue
+            for page in self._pack(self._rects(groups[key])):
+                if len(page['materials']) < 2:
+                    self.skipped[page['materials'][0].name] = 'nothing to share an atlas with'
+                else:
+                    pages.append(page)
+        
+        tasks = []
+        for number, page in enumerate(pages):
+            page['name'] = '{}_atlas{}'.format(ctx.settings.out_basename, number)
+            for slot, suffix in self.slots:
+                if getattr(page['materials'][0], slot):
+                    tasks.append((page, slot, suffix))
+        sizes = self._parallel(self._composite, tasks)
+        
+        textures_before = len(ctx.textures)
+        materials_before = len(ctx.materials)
+        replaced_bytes = sum(self._pixels[image][2] for page in pages for material in page['materials']
+                                for image in set(texture.image for texture in self._textures(material)))
+        for page in pages:
+            self._merge(page, meshes_by_material)
+        self._pixels = {}
+        
+        used = sum(rect['width'] * rect['height'] for page in pages for rect in page['rects'])
+        area = sum(page['width'] * page['height'] for page in pages)
+        self.stats = {
+            'materials_before': materials_before,
+            'materials_after': len(ctx.materials),
+            'textures_before': textures_before,
+            'textures_after': len(ctx.textures),
+            'atlases': [{'name': page['name'], 'width': page['width'], 'height': page['height'],
+                            'materials': len(page['materials']), 'textures': len(page['rects']),
+                            'occupancy': page['occupancy']} for page in pages],
+            'occupancy': used / float(area) if area else 0.0,
+            'replaced_bytes': replaced_bytes,
+            'atlas_bytes': sum(sizes),
+            'bytes_saved': replaced_bytes - sum(sizes),
+            'skipped': dict(self.skipped),
+        }
+    
+    def summary(self):
+        stats = self.stats
+        return ("Texture atlas merged {} materials into {} atlases, textures {} -> {}, materials {} -> {}, "
+                "{:.0%} occupancy, {} bytes saved, {} materials skipped".format(
+                    sum(page['materials'] for page in stats['atlases']), len(stats['atlases']),
+                    stats['textures_before'], stats['textures_after'],
+                    stats['materials_before'], stats['materials_after'],
+                    stats['occupancy'], stats['bytes_saved'], len(stats['skipped'])))
+    
+    def _parallel(self, func, tasks):
+        '''func(*task) for every task, on atlas_workers threads when there are several.'''
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            ThreadPoolExecutor = None
+        workers = self.ctx.settings.atlas_workers
+        if ThreadPoolExecutor is None or workers < 2 or len(tasks) < 2:
+            return [func(*task) for task in tasks]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda task: func(*task), tasks))
+    
+    def _textures(self, material):
+        return [getattr(material, slot) for slot, suffix in self.slots if getattr(material, slot)]
+    
+    @staticmethod
+    def _texcoords(mesh):
+        '''TEXCOORD_0 of mesh as a writable view of its buffer.'''
+        accessor = mesh.texcoord0_accessor
+        buffer_view = accessor.buffer_view
+        return numpy.frombuffer(buffer_view.buffer.byte_str, dtype='<f4', count=accessor.count * 2,
+                                offset=buffer_view.byte_offset + accessor.byte_offset).reshape(-1, 2)
+    
+    def _skip_reason(self, material, meshes):
+        if not material.base_color_texture:
+            return 'no base color texture'
+        if material.occlusion_texture or material.emissive_texture:
+            return 'occlusion or emissive texture'
+        for mesh in meshes:
+            uvs = self._texcoords(mesh).copy()
+            uvs[self._flipped_border(uvs), 1] = 0
+            if uvs.size and (uvs.min() < -self.uv_tolerance or uvs.max() > 1 + self.uv_tolerance):
+                return 'texcoords outside 0-1'
+        return None
+    
+    def _flipped_border(self, uvs):
+        '''Rows whose V of 1 the V flip turned into 2 rather than 0.'''
+        if not self.ctx.settings.vflip:
+            return numpy.zeros(len(uvs), dtype=bool)
+        return numpy.abs(uvs[:, 1] - 2) <= self.uv_tolerance
+    
+    def _size_reason(self, material):
+        base = self._pixels[material.base_color_texture.image][0]
+        for texture in self._textures(material):
+            if self._pixels[texture.image][0].shape != base.shape:
+                return 'texture sizes differ'
+        limit = self.ctx.settings.atlas_size - 2 * self.ctx.settings.atlas_padding
+        if base.shape[0] > limit or base.shape[1] > limit:
+            return 'larger than the atlas'
+        return None
+    
+    def _group_key(self, material):
+        '''Materials with the same key only differ in their textures.'''
+        factors = None
+        if not material.metallic_roughness_texture:
+            factors = (material.metallic_factor, material.roughness_factor)
+        return (tuple(bool(getattr(material, slot)) for slot, suffix in self.slots), factors,
+                tuple(material.emissive_factor or ()), self._pixels[material.base_color_texture.image][1])
+    
+    def _load(self, image):
+        if image.qimage:
+            # a generated map, written out to measure it
+            qimage = image.qimage
+            _release_output(image.src_file_path)
+            writer = QImageWriter(image.src_file_path,
+                                    QByteArray(bytes(str(image.mime_type.split('/')[1]).encode("latin-1"))))
+            writer.write(qimage)
+            del writer
+            nbytes = os.path.getsize(image.src_file_path)
+            os.remove(image.src_file_path)
+        else:
+            qimage = QImage(image.src_file_path)
+            nbytes = os.path.getsize(image.src_file_path)
+        alpha = qimage.hasAlphaChannel()
+        qimage = qimage.convertToFormat(QImage.Format_ARGB32)
+        width, height = qimage.width(), qimage.height()
+        pixels = numpy.frombuffer(qimage.bits(), dtype=numpy.uint32, count=width * height)
+        return pixels.reshape(height, width).copy(), alpha, nbytes
+    
+    def _rects(self, materials):
+        '''One rectangle per distinct set of textures, largest first.'''
+        rects = []
+        by_files = {}
+        for material in materials:
+            files = tuple(texture.image.src_file_path for texture in self._textures(material))
+            if files not in by_files:
+                height, width = self._pixels[material.base_color_texture.image][0].shape
+                by_files[files] = {'width': width, 'height': height, 'materials': [], 'images': {}}
+                for slot, suffix in self.slots:
+                    if getattr(material, slot):
+                        by_files[files]['images'][slot] = getattr(material, slot).image
+                rects.append(by_files[files])
+            by_files[files]['materials'].append(material)
+        rects.sort(key=lambda rect: (rect['height'], rect['width']), reverse=True)
+        return rects
+    
+    def _pack(self, rects):
+        '''Places the rects on the smallest power of two square page they fit
+        on, or on as many pages of atlas_size as needed.'''
+        limit = self.ctx.settings.atlas_size
+        padding = self.ctx.settings.atlas_padding
+        area = sum((rect['width'] + 2 * padding) * (rect['height'] + 2 * padding) for rect in rects)
+        side = max([int(math.ceil(math.sqrt(area)))]
+                    + [max(rect['width'], rect['height']) + 2 * padding for rect in rects])
+        size = min(limit, 1 << (side - 1).bit_length())
+        while True:
+            pages = self._pack_pages(rects, size)
+            if len(pages) == 1 or size >= limit:
+                return pages
+            size = min(limit, size * 2)
+    
+    def _pack_pages(self, rects, size):
+        '''Places the rects on pages of size with a skyline bottom-left packer.'''
+        padding = self.ctx.settings.atlas_padding
+        pages = []
+        for rect in rects:
+            width = rect['width'] + 2 * padding
+            height = rect['height'] + 2 * padding
+            for page in pages:
+                position = self._skyline_fit(page['skyline'], width, height, size)
+                if position:
+                    break
+            else:
+                page = {'skyline': [(0, 0, size)], 'rects': [], 'materials': []}
+                pages.append(page)
+                position = self._skyline_fit(page['skyline'], width, height, size)
+            y, x = position
+            page['skyline'] = self._skyline_place(page['skyline'], x, y, width, height)
+            rect['x'] = x + padding
+            rect['y'] = y + padding
+            page['rects'].append(rect)
+            page['materials'].extend(rect['materials'])
+        order = dict((material, index) for index, material in enumerate(self.ctx.materials))
+        for page in pages:
+            page['width'] = max(rect['x'] + rect['width'] + padding for rect in page['rects'])
+            page['height'] = max(rect['y'] + rect['height'] + padding for rect in page['rects'])
+            used = sum(rect['width'] * rect['height'] for rect in page['rects'])
+            page['occupancy'] = used / float(page['width'] * page['height'])
+            page['materials'].sort(key=order.get)
+        return pages
+    
+    @staticmethod
+    def _skyline_fit(skyline, width, height, size):
+        '''Lowest, then leftmost (y, x) the rectangle fits at, or None.'''
+        best = None
+        for i, (x, y, length) in enumerate(skyline):
+            if x + width > size:
+                break
+            top = 0
+            covered = 0
+            j = i
+            while covered < width:
+                top = max(top, skyline[j][1])
+                covered += skyline[j][2]
+                j += 1
+            if top + height <= size and (best is None or (top, x) < best):
+                best = (top, x)
+        return best
+    
+    @staticmethod
+    def _skyline_place(skyline, x, y, width, height):
+        end = x + width
+        left = []
+        right = []
+        for sx, sy, length in skyline:
+            if sx < x:
+                left.append((sx, sy, min(length, x - sx)))
+            if sx + length > end:
+                start = max(sx, end)
+                right.append((start, sy, sx + length - start))
+        merged = []
+        for segment in left + [(x, y + height, width)] + right:
+            if merged and merged[-1][1] == segment[1]:
+                merged[-1] = (merged[-1][0], segment[1], merged[-1][2] + segment[2])
+            else:
+                merged.append(segment)
+        return merged
+    
+    def _composite(self, page, slot, suffix):
+        '''Writes the atlas of one slot of a page, returns its size in bytes.'''
+        padding = self.ctx.settings.atlas_padding
+        images = [rect['images'][slot] for rect in page['rects']]
+        alpha = slot == 'base_color_texture' and self._pixels[images[0]][1]
+        ext = 'png'
+        if not alpha and all(image.mime_type == 'image/jpeg' for image in images):
+            ext = 'jpg'
+        page[slot] = os.path.join(self.ctx.settings.out_dir, '{}_{}.{}'.format(page['name'], suffix, ext))
+        
+        canvas = numpy.zeros((page['height'], page['width']), dtype=numpy.uint32)
+        if not alpha:
+            canvas[:] = 0xff000000
+        for rect, image in zip(page['rects'], images):
+            x, y = rect['x'] - padding, rect['y'] - padding
+            canvas[y:y + rect['height'] + 2 * padding,
+                    x:x + rect['width'] + 2 * padding] = numpy.pad(self._pixels[image][0], padding, mode='edge')
+        data = canvas.tobytes()
+        qimage = QImage(data, page['width'], page['height'], page['width'] * 4,
+                        QImage.Format_ARGB32 if alpha else QImage.Format_RGB32)
+        _release_output(page[slot])
+        writer = QImageWriter(page[slot], QByteArray(bytes(ext.encode("latin-1"))))
+        writer.write(qimage)
+        del writer
+        return os.path.getsize(page[slot])
+    
+    def _merge(self, page, meshes_by_material):
+        '''Turns the first material of the page into the atlas material and
+        points the meshes of the others at it.'''
+        ctx = self.ctx
+        merged = page['materials'][0]
+        alpha = self._pixels[merged.base_color_texture.image][1]
+        replaced = set()
+        for material in page['materials']:
+            replaced.update(self._textures(material))
+        for slot, suffix in self.slots:
+            if getattr(merged, slot):
+                setattr(merged, slot, Texture(ctx, Image(ctx, page[slot], generated=True)))
+        merged.alpha_mode = 'BLEND' if alpha else 'OPAQUE'
+        
+        for rect in page['rects']:
+            scale = (rect['width'] / float(page['width']), rect['height'] / float(page['height']))
+            offset = (rect['x'] / float(page['width']), rect['y'] / float(page['height']))
+            for material in rect['materials']:
+                for mesh in meshes_by_material[material]:
+                    uvs = self._texcoords(mesh)
+                    uvs[self._flipped_border(uvs), 1] = 0
+                    uvs *= scale
+                    uvs += offset
+                    mesh.material = merged
+        
+        removed = set(page['materials'][1:])
+        ctx.materials[:] = [material for material in ctx.materials if material not in removed]
+        ctx.textures[:] = [texture for texture in ctx.textures if texture not in replaced]
+        images = set(texture.image for texture in replaced)
+        ctx.images[:] = [image for image in ctx.images if image not in images]
+        for items in (ctx.materials, ctx.textures, ctx.images):
+            for index, item in enumerate(items):
+                item.index = index
+
+
+class MeshoptCompressor(object):
+    '''Compresses the packed bufferViews with EXT_meshopt_compression.
+    
+    Vertex attributes, sparse data and animation data use the ATTRIBUTES codec
+    (version 0), triangle indices the TRIANGLES codec (version 1).  The streams
+    replace the data in their buffer and the uncompressed data moves to a
+    fallback buffer, which is left empty unless meshopt_fallback is on.
+    Images and data the codecs don't take are kept as they are.
+    
+    Filters:
+        octahedral - NORMAL and TANGENT as 8-bit octahedral vectors, stored as
+                     normalized BYTE with KHR_mesh_quantization
+        quaternion - rotation samplers as 12-bit quaternions, stored as
+                     normalized SHORT
+    
+    The streams are decodable by any conforming EXT_meshopt_compression decoder.
+    '''
+    extension = 'EXT_meshopt_compression'
+    filters = ('octahedral', 'quaternion')
+    octahedral_bits = 8
+    quaternion_bits = 12
+    vertex_header = 0xa0
+    index_header = 0xe1
+    # byte groups of 16 deltas, blocks of up to 256 vertices in 8KB
+    group_size = 16
+    block_max_size = 256
+    block_max_bytes = 8192
+    tail_min_size = 32
+    codeaux_table = (0x00, 0x76, 0x87, 0x56, 0x67, 0x78, 0xa9, 0x86,
+                        0x65, 0x89, 0x68, 0x98, 0x01, 0x69, 0x00, 0x00)
+    
+    def __init__(self, ctx, filters=True):
+        self.ctx = ctx
+        if not filters:
+            filters = []
+        elif filters is True:
+            filters = self.filters
+        unknown = set(filters) - set(self.filters)
+        if unknown:
+            raise ValueError("Unknown meshopt filters: {}".format(', '.join(sorted(unknown))))
+        self.enabled = set(filters)
+        # one entry per compressed bufferView
+        self.stats = []
+    
+    def run(self):
+        elements = self._elements()
+        filtered = self._filtered()
+        views_by_buffer = {}
+        for buffer_view in self.ctx.buffer_views:
+            views_by_buffer.setdefault(buffer_view.buffer, []).append(buffer_view)
+        quantized = False
+        for buffer in list(self.ctx.buffers):
+            buffer_views = views_by_buffer.get(buffer)
+            if not buffer_views or not any(view in elements for view in buffer_views):
+                continue
+            source = memoryview(buffer.byte_str)
+            compressed = bytearray()
+            fallback = None
+            for buffer_view in sorted(buffer_views, key=lambda view: view.byte_offset):
+                data = source[buffer_view.byte_offset:buffer_view.byte_offset + buffer_view.byte_length]
+                stream = None
+                if buffer_view in elements:
+                    start = time.time()
+                    accessor, mode, count, stride = elements[buffer_view]
+                    original = count * stride
+                    filter_ = filtered.get(accessor) if buffer_view is accessor.buffer_view else None
+                    raw = data = data[:original]
+                    if filter_:
+                        raw, data, stride = self._apply_filter(accessor, filter_, raw)
+                    if mode == 'TRIANGLES':
+                        stream = self.encode_index_buffer(
+                                    numpy.frombuffer(raw, dtype='<u{}'.format(stride)).tolist())
+                    else:
+                        stream = self.encode_vertex_buffer(raw, stride)
+                    if len(stream) >= original and not filter_:
+                        stream = None
+                if stream is None:
+                    buffer_view.byte_offset = len(compressed)
+                    compressed.extend(data)
+                    compressed.extend(b'0' * (-len(compressed) % 4))
+                    continue
+                if fallback is None:
+                    fallback = Buffer(self.ctx, 'fallback_' + buffer.name)
+                    fallback.fallback = True
+                    if not self.ctx.settings.meshopt_fallback:
+                        fallback.uri = ''
+                buffer_view.meshopt = {'buffer': buffer.index, 'byteOffset': len(compressed),
+                                        'byteLength': len(stream), 'byteStride': stride,
+                                        'mode': mode, 'count': count}
+                if filter_:
+                    buffer_view.meshopt['filter'] = filter_.upper()
+                    quantized = quantized or filter_ == 'octahedral'
+                compressed.extend(stream)
+                compressed.extend(b'0' * (-len(compressed) % 4))
+                buffer_view.buffer = fallback
+                buffer_view.byte_offset = len(fallback)
+                buffer_view.byte_length = len(data)
+                fallback.byte_str.extend(data)
+                fallback.byte_str.extend(b'0' * (-len(fallback) % 4))
+                self.stats.append({'buffer_view': buffer_view.index,
+                                    'accessor': accessor.name,
+                                    'mode': mode,
+                                    'filter': buffer_view.meshopt.get('filter', 'NONE'),
+                                    'bytes': original,
+                                    'compressed_bytes': len(stream),
+                                    'ratio': round(original / float(len(stream)), 3),
+                                    'seconds': time.time() - start})
+            del source
+            buffer.byte_str = compressed
+        if self.stats:
+            self.ctx.extensions_used.append(self.extension)
+            if not self.ctx.settings.meshopt_fallback:
+                self.ctx.extensions_required.append(self.extension)
+        if quantized:
+            self.ctx.extensions_used.append('KHR_mesh_quantization')
+            self.ctx.extensions_required.append('KHR_mesh_quantization')
+    
+    def summary(self):
+        raw = sum(entry['bytes'] for entry in self.stats)
+        compressed = sum(entry['compressed_bytes'] for entry in self.stats)
+        return "EXT_meshopt_compression compressed {} bufferViews from {} to {} bytes (x{:.2f}) in {:.2f}s".format(
+                    len(self.stats), raw, compressed, raw / float(compressed or 1),
+                    sum(entry['seconds'] for entry in self.stats))
+    
+    def _elements(self):
+        '''bufferView -> (accessor, mode, element count, element size) of the ones the codecs take.'''
+        indices = set(part.indices_accessor for mesh in self.ctx.meshes for part in mesh.primitives)
+        elements = {}
+        for accessor in self.ctx.accessors:
+            size = (struct.calcsize('<' + Accessor.component_type_codes[accessor.component_type])
+                    * Accessor.type_codes[accessor.type_])
+            views = [(accessor.buffer_view, accessor.count, size)]
+            if accessor.buffer_view is None and accessor.sparse_count:
+                views = [(accessor.indices_view, accessor.sparse_count,
+                            struct.calcsize('<' + Accessor.component_type_codes[accessor.indices_component_type])),
+                            (accessor.values_view, accessor.sparse_count, size)]
+            for buffer_view, count, size in views:
+                if buffer_view is None:
+                    continue
+                if accessor in indices and size in (2, 4) and count % 3 == 0:
+                    elements[buffer_view] = (accessor, 'TRIANGLES', count, size)
+                elif size % 4 == 0 and size <= 256:
+                    elements[buffer_view] = (accessor, 'ATTRIBUTES', count, size)
+        return elements
+    
+    def _filtered(self):
+        '''accessor -> filter to apply to it.'''
+        filtered = {}
+        if 'octahedral' in self.enabled:
+            for part in (part for mesh in self.ctx.meshes for part in mesh.primitives):
+                for accessor in (part.normal_accessor, part.tangent_accessor):
+                    if accessor is not None and accessor.component_type == ComponentTypes.FLOAT:
+                        filtered[accessor] = 'octahedral'
+        if 'quaternion' in self.enabled:
+            for animation in self.ctx.animations:
+                for sampler, channel in zip(animation.samplers, animation.channels):
+                    # cubic spline tangents aren't unit quaternions
+                    if channel.path == 'rotation' and sampler.interpolation != 'CUBICSPLINE':
+                        filtered[sampler.output_accessor] = 'quaternion'
+        return filtered
+    
+    def _apply_filter(self, accessor, filter_, raw):
+        '''Converts the accessor to the filter's storage.  Returns the encoded filter
+        input, the decoded data for the fallback and the encoded element size.'''
+        components = Accessor.type_codes[accessor.type_]
+        values = numpy.frombuffer(raw, dtype='<f4').reshape(-1, components)
+        if filter_ == 'octahedral':
+            vectors = numpy.zeros((len(values), 4), dtype=numpy.float32)
+            vectors[:, :components] = values
+            encoded = self.encode_filter_oct(vectors, self.octahedral_bits)
+            decoded = self.decode_filter_oct(encoded)
+            accessor.component_type = ComponentTypes.BYTE if encoded.itemsize == 1 else ComponentTypes.SHORT
+        else:
+            encoded = self.encode_filter_quat(values, self.quaternion_bits)
+            decoded = self.decode_filter_quat(encoded)
+            accessor.component_type = ComponentTypes.SHORT
+        accessor.normalized = True
+        stride = encoded.itemsize * 4
+        if components != 4:
+            accessor.buffer_view.byte_stride = stride
+        if accessor.min_ is not None:
+            accessor.min_ = decoded[:, :components].min(axis=0).tolist()
+            accessor.max_ = decoded[:, :components].max(axis=0).tolist()
+        little = encoded.dtype.newbyteorder('<')
+        return encoded.astype(little).tobytes(), decoded.astype(little).tobytes(), stride
+    
+    @staticmethod
+    def _quantize_snorm(values, bits):
+        f32 = numpy.float32
+        rounding = numpy.where(values >= 0, f32(0.5), f32(-0.5))
+        values = numpy.clip(values, f32(-1), f32(1))
+        return (values * f32((1 << (bits - 1)) - 1) + rounding).astype(numpy.int32)
+    
+    @staticmethod
+    def _round(values):
+        f32 = numpy.float32
+        return (values + numpy.where(values >= 0, f32(0.5), f32(-0.5))).astype(numpy.int32)
+    
+    @classmethod
+    def encode_filter_oct(cls, vectors, bits):
+        '''(n, 4) float32 xyz unit vectors and w to the OCTAHEDRAL filter input.'''
+        f32 = numpy.float32
+        x, y, z, w = vectors.T
+        length = numpy.abs(x) + numpy.abs(y) + numpy.abs(z)
+        with numpy.errstate(divide='ignore'):
+            scale = numpy.where(length == 0, f32(0), f32(1) / length)
+        x = x * scale
+        y = y * scale
+        u = numpy.where(z >= 0, x, (f32(1) - numpy.abs(y)) * numpy.where(x >= 0, f32(1), f32(-1)))
+        v = numpy.where(z >= 0, y, (f32(1) - numpy.abs(x)) * numpy.where(y >= 0, f32(1), f32(-1)))
+        dtype = numpy.int8 if bits <= 8 else numpy.int16
+        encoded = numpy.empty((len(vectors), 4), dtype=dtype)
+        encoded[:, 0] = cls._quantize_snorm(u, bits)
+        encoded[:, 1] = cls._quantize_snorm(v, bits)
+        encoded[:, 2] = cls._quantize_snorm(numpy.ones(1, dtype=f32), bits)
+        encoded[:, 3] = cls._quantize_snorm(w, encoded.itemsize * 8)
+        return encoded
+    
+    @classmethod
+    def decode_filter_oct(cls, encoded):
+        f32 = numpy.float32
+        one = f32(numpy.iinfo(encoded.dtype).max)
+        x = encoded[:, 0].astype(f32)
+        y = encoded[:, 1].astype(f32)
+        z = encoded[:, 2].astype(f32) - numpy.abs(x) - numpy.abs(y)
+        t = numpy.minimum(z, f32(0))
+        x = x + numpy.where(x >= 0, t, -t)
+        y = y + numpy.where(y >= 0, t, -t)
+        scale = one / numpy.sqrt(x * x + y * y + z * z)
+        decoded = encoded.copy()
+        decoded[:, 0] = cls._round(x * scale)
+        decoded[:, 1] = cls._round(y * scale)
+        decoded[:, 2] = cls._round(z * scale)
+        return decoded
+    
+    @classmethod
+    def encode_filter_quat(cls, quaternions, bits):
+        '''(n, 4) float32 unit quaternions to the QUATERNION filter input.'''
+        f32 = numpy.float32
+        quaternions = numpy.asarray(quaternions, dtype=f32)
+        rows = numpy.arange(len(quaternions))
+        # index of the largest component, the first one on ties
+        largest = numpy.argmax(numpy.abs(quaternions), axis=1)
+        sign = numpy.where(quaternions[rows, largest] < 0, f32(-1), f32(1))
+        encoded = numpy.empty((len(quaternions), 4), dtype=numpy.int16)
+        for i in range(3):
+            component = quaternions[rows, (largest + i + 1) & 3]
+            encoded[:, i] = cls._quantize_snorm(component * numpy.sqrt(f32(2)) * sign, bits)
+        encoded[:, 3] = (cls._quantize_snorm(numpy.ones(1, dtype=f32), bits) & ~3) | largest
+        return encoded
+    
+    @classmethod
+    def decode_filter_quat(cls, encoded):
+        f32 = numpy.float32
+        scale = (f32(1) / numpy.sqrt(f32(2))) / (encoded[:, 3] | 3).astype(f32)
+        xyz = encoded[:, :3].astype(f32) * scale[:, None]
+        ww = f32(1) - xyz[:, 0] * xyz[:, 0] - xyz[:, 1] * xyz[:, 1] - xyz[:, 2] * xyz[:, 2]
+        w = numpy.sqrt(numpy.maximum(ww, f32(0)))
+        largest = encoded[:, 3] & 3
+        rows = numpy.arange(len(encoded))
+        decoded = numpy.empty_like(encoded)
+        for i in range(3):
+            decoded[rows, (largest + i + 1) & 3] = cls._round(xyz[:, i] * f32(32767))
+        decoded[rows, largest] = (w * f32(32767) + f32(0.5)).astype(numpy.int32)
+        return decoded
+    
+    @classmethod
+    def encode_vertex_buffer(cls, data, stride):
+        '''ATTRIBUTES codec.  data holds the elements of stride bytes back to back.'''
+        vertices = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, stride)
+        # byte deltas to the previous vertex, zigzag encoded
+        deltas = numpy.diff(vertices, axis=0, prepend=vertices[:1])
+        deltas = (deltas << 1) ^ (deltas.view(numpy.int8) >> 7).view(numpy.uint8)
+        block_size = min(cls.block_max_size, (cls.block_max_bytes // stride) & ~(cls.group_size - 1))
+        full = len(vertices) // block_size * block_size
+        chunks = [struct.pack('<B', cls.vertex_header)]
+        if full:
+            chunks.append(cls._encode_blocks(deltas[:full].reshape(-1, block_size, stride)))
+        if full < len(vertices):
+            chunks.append(cls._encode_blocks(deltas[full:].reshape(1, -1, stride)))
+        # the first vertex is stored at the end, padded to the minimum tail size
+        chunks.append(b'\0' * max(0, cls.tail_min_size - stride))
+        chunks.append(bytes(data[:stride]))
+        return b''.join(chunks)
+    
+    @classmethod
+    def _encode_blocks(cls, blocks):
+        '''Encodes (blocks, vertices, stride) zigzag deltas, each vertex byte of
+        a block as a run of byte groups after a header of 2 bits per group.'''
+        count, size, stride = blocks.shape
+        aligned = (size + cls.group_size - 1) & ~(cls.group_size - 1)
+        group_count = aligned // cls.group_size
+        runs = numpy.zeros((count, stride, aligned), dtype=numpy.uint8)
+        runs[:, :, :size] = blocks.transpose(0, 2, 1)
+        groups = runs.reshape(count * stride, group_count, cls.group_size)
+        # pick the smallest of: all zero, 2 bit, 4 bit or raw bytes, with values
+        # that don't fit stored whole after the packed ones
+        over2 = groups >= 3
+        over4 = groups >= 15
+        modes = numpy.full(groups.shape[:2], 3, dtype=numpy.uint8)
+        sizes = numpy.full(groups.shape[:2], cls.group_size, dtype=numpy.int32)
+        zero = ~groups.any(axis=2)
+        modes[zero] = 0
+        sizes[zero] = 0
+        for mode, bits, over in ((1, 2, over2), (2, 4, over4)):
+            mode_size = cls.group_size * bits // 8 + over.sum(axis=2)
+            better = mode_size < sizes
+            modes[better] = mode
+            sizes[better] = mode_size[better]
+        # on a 2/4 bit tie keep the bit width of the group before; both decode the same
+        tie = (modes == 1) & (mode_size == sizes)
+        if tie.any():
+            before = numpy.maximum.accumulate(numpy.where(tie, -1, numpy.arange(group_count)), axis=1)
+            previous = numpy.take_along_axis(modes, numpy.maximum(before, 0), axis=1)
+            modes[tie & (before >= 0) & (previous == 2)] = 2
+        header_size = (group_count + 3) // 4
+        padded = numpy.zeros((len(groups), header_size * 4), dtype=numpy.uint8)
+        padded[:, :group_count] = modes
+        header = padded[:, 0::4] | (padded[:, 1::4] << 2) | (padded[:, 2::4] << 4) | (padded[:, 3::4] << 6)
+        payload = numpy.zeros(groups.shape[:2] + (24,), dtype=numpy.uint8)
+        raw = modes == 3
+        payload[raw, :16] = groups[raw]
+        for mode, bits, over in ((1, 2, over2), (2, 4, over4)):
+            selected = modes == mode
+            if not selected.any():
+                continue
+            values = groups[selected]
+            over = over[selected]
+            packed_size = cls.group_size * bits // 8
+            packed = numpy.minimum(values, (1 << bits) - 1).reshape(len(values), packed_size, 8 // bits)
+            packed_bytes = numpy.zeros((len(values), packed_size), dtype=numpy.uint8)
+            for i in range(8 // bits):
+                packed_bytes |= packed[:, :, i] << (8 - bits * (i + 1))
+            # values that don't fit follow in order, the rest go to a spare column
+            slots = numpy.where(over, numpy.cumsum(over, axis=1) - 1, cls.group_size)
+            extra = numpy.zeros((len(values), cls.group_size + 1), dtype=numpy.uint8)
+            numpy.put_along_axis(extra, slots, values, axis=1)
+            payload[selected, :packed_size] = packed_bytes
+            payload[selected, packed_size:packed_size + cls.group_size] = extra[:, :cls.group_size]
+        rows = numpy.concatenate((header, payload.reshape(len(groups), -1)), axis=1)
+        mask = numpy.concatenate((numpy.ones(header.shape, dtype=bool),
+                                    (numpy.arange(24) < sizes[:, :, None]).reshape(len(groups), -1)), axis=1)
+        return rows[mask].tobytes()
+    
+    @classmethod
+    def encode_index_buffer(cls, indices):
+        '''TRIANGLES codec.  indices is a list of ints, three per triangle.
+        
+        Each triangle is a code byte that refers to an edge of a recent triangle
+        and a recent vertex or the next unused index where it can, other indices
+        are stored as zigzag varint deltas.
+        '''
+        codeaux_index = {}
+        for i, value in enumerate(cls.codeaux_table[:14]):
+            codeaux_index.setdefault(value, i)
+        edge_fifo = [(-1, -1)] * 16
+        vertex_fifo = [-1] * 16
+        edge_offset = 0
+        vertex_offset = 0
+        next_index = 0
+        last = 0
+        codes = bytearray()
+        data = bytearray()
+        
+        def vertex_fifo_index(vertex):
+            for i in range(16):
+                if vertex_fifo[(vertex_offset - 1 - i) & 15] == vertex:
+                    return i
+            return -1
+        
+        def encode_index(index, last):
+            delta = index - last
+            value = ((delta << 1) ^ (delta >> 31)) & 0xffffffff
+            while True:
+                if value > 127:
+                    data.append((value & 127) | 128)
+                else:
+                    data.append(value)
+                value >>= 7
+                if not value:
+                    break
+        
+        for i in range(0, len(indices), 3):
+            a, b, c = indices[i], indices[i + 1], indices[i + 2]
+            edge = -1
+            for j in range(15):
+                e0, e1 = edge_fifo[(edge_offset - 1 - j) & 15]
+                if e0 == a and e1 == b:
+                    edge = j
+                    break
+                if e0 == b and e1 == c:
+                    edge = j
+                    a, b, c = b, c, a
+                    break
+                if e0 == c and e1 == a:
+                    edge = j
+                    a, b, c = c, a, b
+                    break
+            if edge >= 0:
+                # c completes a recent edge
+                fc = vertex_fifo_index(c)
+                if 1 <= fc < 13:
+                    fec = fc
+                elif c == next_index:
+                    fec = 0
+                    next_index += 1
+                elif c + 1 == last:
+                    fec = 13
+                    last = c
+                elif c == last + 1:
+                    fec = 14
+                    last = c
+                else:
+                    fec = 15
+                codes.append((edge << 4) | fec)
+                if fec == 15:
+                    encode_index(c, last)
+                    last = c
+                if fec == 0 or fec >= 13:
+                    vertex_fifo[vertex_offset] = c
+                    vertex_offset = (vertex_offset + 1) & 15
+                edge_fifo[edge_offset] = (c, b)
+                edge_fifo[(edge_offset + 1) & 15] = (a, c)
+                edge_offset = (edge_offset + 2) & 15
+                continue
+            
+            if b == next_index:
+                a, b, c = b, c, a
+            elif c == next_index:
+                a, b, c = c, a, b
+            reset = a == 0 and b == 1 and c == 2 and next_index > 0
+            if reset:
+                next_index = 0
+                vertex_fifo = [-1] * 16
+            fb = vertex_fifo_index(b)
+            fc = vertex_fifo_index(c)
+            if a == next_index:
+                fea = 0
+                next_index += 1
+            else:
+                fea = 15
+            if 0 <= fb < 14:
+                feb = fb + 1
+            elif b == next_index:
+                feb = 0
+                next_index += 1
+            else:
+                feb = 15
+            if 0 <= fc < 14:
+                fec = fc + 1
+            elif c == next_index:
+                fec = 0
+                next_index += 1
+            else:
+                fec = 15
+            codeaux = (feb << 4) | fec
+            if fea == 0 and codeaux in codeaux_index and not reset:
+                codes.append(0xf0 | codeaux_index[codeaux])
+            else:
+                codes.append(0xf0 | 14 | fea)
+                data.append(codeaux)
+            for vertex, fe in ((a, fea), (b, feb), (c, fec)):
+                if fe == 15:
+                    encode_index(vertex, last)
+                    last = vertex
+            for vertex, fe in ((a, fea), (b, feb), (c, fec)):
+                if fe == 0 or fe == 15:
+                    vertex_fifo[vertex_offset] = vertex
+                    vertex_offset = (vertex_offset + 1) & 15
+            edge_fifo[edge_offset] = (b, a)
+            edge_fifo[(edge_offset + 1) & 15] = (c, b)
+            edge_fifo[(edge_offset + 2) & 15] = (a, c)
+            edge_offset = (edge_offset + 3) & 15
+        
+        # the table doubles as padding for decoders that read ahead
+        return (struct.pack('<B', cls.index_header) + bytes(codes) + bytes(data)
+                + bytes(bytearray(cls.codeaux_table)))
+
+
+class ValidationError(RuntimeError):
+    pass
+
+
+class Validator(object):
+    '''Checks the finished registries and packed buffers before they are written.
+    
+    All per-element checks run as numpy array operations over views into the
+    packed buffers.  Accessor min/max are recomputed from the packed data.
+    '''
+    dtypes = {
+        5120: '<i1',
+        5121: '<u1',
+        5122: '<i2',
+        5123: '<u2',
+        5125: '<u4',
+        5126: '<f4',
+    }
+    unit_tolerance = 5e-4
+    
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.issues = []
+    
+    def run(self):
+        for buffer_view in self.ctx.buffer_views:
+            self._check_buffer_view(buffer_view)
+        for accessor in self.ctx.accessors:
+            data = self._check_accessor(accessor)
+            if data is not None and len(data):
+                accessor.min_ = data.min(axis=0).tolist()
+                accessor.max_ = data.max(axis=0).tolist()
+        for mesh in self.ctx.meshes:
+            for primitive in mesh.to_json()['primitives']:
+                self._check_primitive(mesh, primitive)
+        for animation in self.ctx.animations:
+            for sampler, channel in zip(animation.samplers, animation.channels):
+                outputs = self.accessor_data(sampler.output_accessor)
+                if sampler.interpolation == 'CUBICSPLINE':
+                    if len(outputs) != 3 * sampler.input_accessor.count:
+                        self.issues.append("{} cubic spline output count {} is not 3x its {} keys".format(
+                            channel.name, len(outputs), sampler.input_accessor.count))
+                        continue
+                    # only the value of each tangent triplet is a rotation
+                    outputs = outputs[1::3]
+                if channel.path == 'rotation':
+                    self._check_unit_length(outputs, '{} rotation'.format(channel.name))
+        rotated = [node for node in self.ctx.nodes if getattr(node, 'rotation', None)]
+        if rotated:
+            rotations = numpy.asarray([node.rotation for node in rotated], dtype=numpy.float64)
+            lengths = numpy.sqrt((rotations * rotations).sum(axis=1))
+            for i in numpy.flatnonzero(numpy.abs(lengths - 1) > self.unit_tolerance):
+                self.issues.append("Node {} rotation is not a unit quaternion".format(rotated[i].name))
+        return self.issues
+    
+    @classmethod
+    def accessor_data(cls, accessor):
+        '''Returns a (count, components) numpy view of the accessor in its packed buffer.
+        Sparse accessors are returned as a dense copy.'''
+        components = Accessor.type_codes[accessor.type_]
+        if accessor.buffer_view is None:
+            data = numpy.zeros((accessor.count, components), dtype=cls.dtypes[accessor.component_type])
+            if accessor.sparse_count:
+                indices = cls._view_data(accessor.indices_view, 0, accessor.indices_component_type,
+                                            accessor.sparse_count, 1)
+                data[indices[:, 0]] = cls._view_data(accessor.values_view, 0, accessor.component_type,
+                                                        accessor.sparse_count, components)
+            return data
+        return cls._view_data(accessor.buffer_view, accessor.byte_offset, accessor.component_type,
+                                accessor.count, components)
+    
+    @classmethod
+    def _view_data(cls, buffer_view, byte_offset, component_type, count, components):
+        data = numpy.frombuffer(buffer_view.buffer.byte_str, dtype=cls.dtypes[component_type],
+                                count=count * components, offset=buffer_view.byte_offset + byte_offset)
+        return data.reshape(count, components)
+    
+    def _check_buffer_view(self, buffer_view):
+        if buffer_view.byte_offset % 4:
+            self.issues.append("BufferView {} byteOffset {} is not 4-byte aligned".format(
+                                buffer_view.index, buffer_view.byte_offset))
+        if buffer_view.byte_offset + buffer_view.byte_length > len(buffer_view.buffer):
+            self.issues.append("BufferView {} exceeds buffer {} length".format(
+                                buffer_view.index, buffer_view.buffer.index))
+    
+    def _check_accessor(self, accessor):
+        label = "Accessor {} ({})".format(accessor.index, accessor.name)
+        if accessor.count < 1:
+            self.issues.append("{} is empty".format(label))
+            return None
+        if accessor.buffer_view is None:
+            return self._check_sparse_accessor(accessor, label)
+        components = Accessor.type_codes[accessor.type_]
+        item_size = numpy.dtype(self.dtypes[accessor.component_type]).itemsize
+        if (accessor.buffer_view.byte_offset + accessor.byte_offset) % item_size:
+            self.issues.append("{} is not aligned to its component size".format(label))
+            return None
+        if accessor.byte_offset + accessor.count * components * item_size > accessor.buffer_view.byte_length:
+            self.issues.append("{} does not fit in bufferView {}".format(label, accessor.buffer_view.index))
+            return None
+        data = self.accessor_data(accessor)
+        if accessor.component_type == ComponentTypes.FLOAT:
+            finite = numpy.isfinite(data)
+            if not finite.all():
+                self.issues.append("{} has {} NaN or Inf value(s)".format(label, data.size - int(finite.sum())))
+                return None
+        return data
+    
+    def _check_sparse_accessor(self, accessor, label):
+        if accessor.sparse_count:
+            components = Accessor.type_codes[accessor.type_]
+            for view, component_type, size in (
+                    (accessor.indices_view, accessor.indices_component_type, 1),
+                    (accessor.values_view, accessor.component_type, components)):
+                if (accessor.sparse_count * size * numpy.dtype(self.dtypes[component_type]).itemsize
+                        > view.byte_length):
+                    self.issues.append("{} sparse data does not fit in bufferView {}".format(
+                                        label, view.index))
+                    return None
+            indices = self._view_data(accessor.indices_view, 0, accessor.indices_component_type,
+                                        accessor.sparse_count, 1)[:, 0].astype(numpy.int64)
+            if (numpy.diff(indices) <= 0).any():
+                self.issues.append("{} sparse indices are not strictly increasing".format(label))
+                return None
+            if indices[-1] >= accessor.count:
+                self.issues.append("{} sparse index {} out of range".format(label, int(indices[-1])))
+                return None
+        data = self.accessor_data(accessor)
+        if accessor.component_type == ComponentTypes.FLOAT and not numpy.isfinite(data).all():
+            self.issues.append("{} has NaN or Inf value(s)".format(label))
+            return None
+        return data
+    
+    def _check_primitive(self, mesh, primitive):
+        attributes = primitive['attributes']
+        accessors = self.ctx.accessors
+        vertex_count = accessors[attributes['POSITION']].count
+        for semantic, accessor_index in attributes.items():
+            count = accessors[accessor_index].count
+            if count != vertex_count:
+                self.issues.append("Mesh {} {} has {} elements, POSITION has {}".format(
+                                    mesh.name, semantic, count, vertex_count))
+        if 'NORMAL' in attributes:
+            self._check_unit_length(self.accessor_data(accessors[attributes['NORMAL']]),
+                                    "Mesh {} NORMAL".format(mesh.name))
+        if 'TANGENT' in attributes:
+            tangents = self.accessor_data(accessors[attributes['TANGENT']])
+            self._check_unit_length(tangents[:, :3], "Mesh {} TANGENT".format(mesh.name))
+            if not (numpy.abs(tangents[:, 3]) == 1).all():
+                self.issues.append("Mesh {} TANGENT w is not 1 or -1".format(mesh.name))
+        if 'WEIGHTS_0' in attributes:
+            totals = self.accessor_data(accessors[attributes['WEIGHTS_0']]).sum(axis=1, dtype=numpy.float64)
+            bad = int(numpy.count_nonzero(numpy.abs(totals - 1) > self.unit_tolerance))
+            if bad:
+                self.issues.append("Mesh {} has {} vertices whose weights do not sum to 1".format(
+                                    mesh.name, bad))
+        if 'JOINTS_0' in attributes and mesh.skin:
+            joints = self.accessor_data(accessors[attributes['JOINTS_0']])
+            if int(joints.max()) >= len(mesh.skin.joints):
+                self.issues.append("Mesh {} has joint {} out of range for {} joints".format(
+                                    mesh.name, int(joints.max()), len(mesh.skin.joints)))
+        for target in primitive.get('targets', []):
+            for semantic, accessor_index in target.items():
+                if accessors[accessor_index].count != vertex_count:
+                    self.issues.append("Mesh {} morph target {} has {} elements, POSITION has {}".format(
+                                        mesh.name, semantic, accessors[accessor_index].count,
+                                        vertex_count))
+        if 'indices' in primitive:
+            indices = self.accessor_data(accessors[primitive['indices']])
+            if len(indices) % 3 and primitive.get('mode', 4) == 4:
+                self.issues.append("Mesh {} index count {} is not a multiple of 3".format(
+                                    mesh.name, len(indices)))
+            if len(indices) and int(indices.max()) >= vertex_count:
+                self.issues.append("Mesh {} has index {} out of range for {} vertices".format(
+                                    mesh.name, int(indices.max()), vertex_count))
+    
+    def _check_unit_length(self, data, label):
+        lengths = numpy.sqrt(numpy.einsum('ij,ij->i', data, data, dtype=numpy.float64))
+        bad = int(numpy.count_nonzero(numpy.abs(lengths - 1) > self.unit_tolerance))
+        if bad:
+            self.issues.append("{} has {} non unit length value(s)".format(label, bad))
+
+
+class SizeBudgetError(RuntimeError):
+    pass
+
+
+class SizeReport(object):
+    '''Attributes the bytes of the output files to the meshes, images, skins and
+    animation channels they come from, using the registries and the built document.
+    
+    Accessor bytes are what the bufferViews take in the output, compressed and
+    fallback EXT_meshopt_compression data included.  Alignment between bufferViews
+    and GLB chunks counts as padding, the base64 growth of embedded data separately.
+    '''
+    categories = ('meshes', 'skins', 'animations', 'images', 'other',
+                    'json', 'headers', 'padding', 'base64')
+    # budget name -> category whose total it limits, or the item list whose largest entry it limits
+    budget_totals = {'meshes': 'meshes', 'skins': 'skins', 'animations': 'animations',
+                        'images': 'images', 'json': 'json'}
+    budget_items = {'mesh': 'meshes', 'skin': 'skins', 'channel': 'animations', 'image': 'images'}
+    
+    def __init__(self, ctx, document, json_length, data_uris=()):
+        self.ctx = ctx
+        self.document = document
+        # length of the JSON as written, data URIs of a .gltf included
+        self.json_length = json_length
+        self.data_uris = list(data_uris)
+        self.stats = {}
+        self.exceeded = []
+    
+    def run(self):
+        settings = self.ctx.settings
+        totals = dict((category, 0) for category in self.categories)
+        self._view_owners = {}
+        self._image_bytes = {}
+        items = {'meshes': self._meshes(), 'skins': self._skins(),
+                    'animations': self._animations(), 'images': self._images()}
+        for key, entries in items.items():
+            entries.sort(key=lambda entry: (-entry['bytes'], entry['name']))
+            totals[key] = sum(entry['bytes'] for entry in entries)
+        used = {}
+        for buffer_view in self.ctx.buffer_views:
+            if buffer_view.meshopt:
+                buffer = self.ctx.buffers[buffer_view.meshopt['buffer']]
+                used[buffer] = used.get(buffer, 0) + buffer_view.meshopt['byteLength']
+            used[buffer_view.buffer] = used.get(buffer_view.buffer, 0) + buffer_view.byte_length
+            if buffer_view not in self._view_owners:
+                totals['other'] += self._view_bytes(buffer_view)
+        totals['padding'] = sum(len(buffer) - used.get(buffer, 0)
+                                for buffer in self.ctx.buffers if self._written(buffer))
+        uri_length = sum(len(uri) for uri in self.data_uris)
+        totals['base64'] = uri_length - sum(len(uri.data) for uri in self.data_uris)
+        totals['json'] = self.json_length - uri_length
+        if settings.file_format == 'glb':
+            # file header, JSON chunk header and the BIN chunk header
+            totals['headers'] = 12 + 8 + (8 if self.ctx.buffers else 0)
+            totals['padding'] += -self.json_length % 4
+        self.stats = {'total_bytes': sum(totals.values()),
+                        'categories': totals,
+                        'files': self._files()}
+        self.stats.update(items)
+        self._check_budgets(settings.size_budgets or {})
+        self.stats['exceeded_budgets'] = list(self.exceeded)
+        return self.stats
+    
+    def summary(self, top=10):
+        '''Script Editor lines with the category totals and the largest items of each.'''
+        stats = self.stats
+        parts = ['{} {}'.format(category, self.format_bytes(size))
+                    for category, size in sorted(stats['categories'].items(), key=lambda item: -item[1])
+                    if size]
+        lines = ["Export size {}: {}".format(self.format_bytes(stats['total_bytes']), ', '.join(parts))]
+        for key in ('meshes', 'images', 'animations', 'skins'):
+            entries = [entry for entry in stats[key][:top] if entry['bytes']]
+            if not entries:
+                continue
+            lines.append("  Largest {}:".format(key))
+            for entry in entries:
+                detail = entry.get('accessors') or entry.get('parts')
+                detail = ' ({})'.format(', '.join(
+                            '{} {}'.format(label, self.format_bytes(size))
+                            for label, size in sorted(detail.items(), key=lambda item: -item[1]))) if detail else ''
+                lines.append("    {} {}{}".format(entry['name'], self.format_bytes(entry['bytes']), detail))
+        for budget in self.exceeded:
+            lines.append("Size budget {} of {} exceeded by {}: {}".format(
+                            budget['budget'], self.format_bytes(budget['limit']), budget['name'],
+                            self.format_bytes(budget['bytes'])))
+        return '\n'.join(lines)
+    
+    @staticmethod
+    def format_bytes(size):
+        for unit in ('B', 'KB', 'MB'):
+            if abs(size) < 1024:
+                return '{:.0f} {}'.format(size, unit) if unit == 'B' else '{:.1f} {}'.format(size, unit)
+            size /= 1024.0
+        return '{:.2f} GB'.format(size)
+    
+    def _written(self, buffer):
+        # fallback buffers without meshopt_fallback are declared but never written
+        return not (buffer.fallback and not self.ctx.settings.meshopt_fallback)
+    
+    def _view_bytes(self, buffer_view):
+        size = buffer_view.meshopt['byteLength'] if buffer_view.meshopt else 0
+        if self._written(buffer_view.buffer):
+            size += buffer_view.byte_length
+        return size
+    
+    def _accessor_bytes(self, accessor, owner):
+        '''Bytes of the accessor's bufferViews that no earlier item claimed.'''
+        size = 0
+        for buffer_view in (accessor.buffer_view, getattr(accessor, 'indices_view', None),
+                            getattr(accessor, 'values_view', None)):
+            if buffer_view is None or buffer_view in self._view_owners:
+                continue
+            self._view_owners[buffer_view] = owner
+            size += self._view_bytes(buffer_view)
+        return size
+    
+    def _meshes(self):
+        accessors = self.ctx.accessors
+        entries = []
+        for mesh, mesh_def in zip(self.ctx.meshes, self.document.get('meshes', [])):
+            sizes = {}
+            for primitive in mesh_def['primitives']:
+                labels = list(primitive['attributes'].items())
+                if 'indices' in primitive:
+                    labels.append(('indices', primitive['indices']))
+                for target in primitive.get('targets', []):
+                    labels.extend(('targets.' + semantic, index) for semantic, index in target.items())
+                for label, index in labels:
+                    sizes[label] = sizes.get(label, 0) + self._accessor_bytes(accessors[index], mesh)
+            entries.append({'name': mesh.name, 'bytes': sum(sizes.values()), 'accessors': sizes})
+        return entries
+    
+    def _skins(self):
+        return [{'name': skin.name, 'bytes': self._accessor_bytes(skin.inverse_bind_accessor, skin)}
+                for skin in self.ctx.skins]
+    
+    def _animations(self):
+        entries = []
+        for animation in self.ctx.animations:
+            for channel in animation.channels:
+                sampler = channel.sampler
+                parts = {'input': self._accessor_bytes(sampler.input_accessor, channel),
+                            'output': self._accessor_bytes(sampler.output_accessor, channel)}
+                entries.append({'name': channel.name, 'bytes': sum(parts.values()), 'parts': parts,
+                                'keys': sampler.input_accessor.count,
+                                'interpolation': sampler.interpolation})
+        return entries
+    
+    def _images(self):
+        entries = []
+        files = set()
+        for image in self.ctx.images:
+            if image.buffer_view is not None:
+                self._view_owners[image.buffer_view] = image
+                size = self._view_bytes(image.buffer_view)
+            elif isinstance(image.uri, DataURI):
+                size = len(image.uri.data)
+            else:
+                path = os.path.join(self.ctx.settings.out_dir, image.uri or image.name)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                self._image_bytes[image] = size
+                # images of the same file share its bytes
+                size = 0 if path in files else size
+                files.add(path)
+            entries.append({'name': image.name, 'bytes': size, 'mime_type': image.mime_type})
+        return entries
+    
+    def _files(self):
+        '''Output file name -> its size once written.'''
+        settings = self.ctx.settings
+        files = {}
+        main = self.json_length
+        if settings.file_format == 'glb':
+            main += -self.json_length % 4 + 12 + 8
+            if self.ctx.buffers:
+                main += 8 + len(self.ctx.buffers[0])
+        files[os.path.basename(settings.out_file)] = main
+        for buffer in self.ctx.buffers:
+            if buffer.uri and self._written(buffer):
+                files[buffer.uri] = len(buffer)
+        for image in self.ctx.images:
+            if image.uri and not isinstance(image.uri, DataURI):
+                files[image.uri] = self._image_bytes[image]
+        return files
+    
+    def _check_budgets(self, budgets):
+        for budget, limit in sorted(budgets.items()):
+            if budget == 'total':
+                checked = [('total', self.stats['total_bytes'])]
+            elif budget in self.budget_totals:
+                checked = [(budget, self.stats['categories'][self.budget_totals[budget]])]
+            elif budget in self.budget_items:
+                checked = [(entry['name'], entry['bytes']) for entry in self.stats[self.budget_items[budget]]]
+            else:
+                raise ValueError("Unknown size budget: {}".format(budget))
+            for name, size in checked:
+                if size > limit:
+                    self.exceeded.append({'budget': budget, 'limit': limit, 'name': name, 'bytes': size})
+
+
+class SnapshotItem(ExportItem):
+    '''Registry entry read from a snapshot.  It is written out as the JSON it
+    had when the snapshot was taken, its attributes are the ones the passes
+    after collection read, such as a mesh's primitives.'''
+    def __init__(self, ctx, registry, name, json_def, **attributes):
+        super(SnapshotItem, self).__init__(ctx, name)
+        self.index = len(registry)
+        registry.append(self)
+        self.json_def = json_def
+        for key, value in attributes.items():
+            setattr(self, key, value)
+    
+    def to_json(self):
+        return self.json_def
+
+
+class Snapshot(object):
+    '''Maya independent copy of a collected export in a numpy .npz archive.
+    
+    The archive holds the JSON of the scenes, nodes, meshes, materials, skins,
+    cameras and animations as they were collected, the data of every accessor
+    as an array, and the images: generated ones and, with embed_images, all of
+    them as file contents, the others as paths.  read() rebuilds the context
+    from it, repacking the accessors into buffers for the encoding settings.
+    '''
+    version = 2
+    
+    @classmethod
+    def write(cls, ctx, path, embed_images=False):
+        if numpy is None:
+            raise RuntimeError("Snapshots require numpy.")
+        arrays = {}
+        accessors = []
+        for accessor in ctx.accessors:
+            components = Accessor.type_codes[accessor.type_]
+            view = accessor.buffer_view or getattr(accessor, 'values_view', None)
+            accessor_def = {'name': accessor.name, 'type': accessor.type_,
+                            'componentType': accessor.component_type, 'count': accessor.count,
+                            'normalized': accessor.normalized, 'min': accessor.min_, 'max': accessor.max_,
+                            'group': view.buffer.origin[0] if view else None,
+                            'tile': view.buffer.origin[1] if view else None,
+                            'target': view.target if view else None}
+            if accessor.buffer_view is None:
+                accessor_def['sparse'] = {'count': accessor.sparse_count,
+                                            'indicesComponentType': accessor.indices_component_type}
+                if accessor.sparse_count:
+                    arrays['accessor{}_indices'.format(accessor.index)] = Validator._view_data(
+                        accessor.indices_view, 0, accessor.indices_component_type, accessor.sparse_count, 1)
+                    arrays['accessor{}_values'.format(accessor.index)] = Validator._view_data(
+                        accessor.values_view, 0, accessor.component_type, accessor.sparse_count, components)
+            else:
+                arrays['accessor{}'.format(accessor.index)] = Validator._view_data(
+                    accessor.buffer_view, accessor.byte_offset, accessor.component_type, accessor.count, components)
+            accessors.append(accessor_def)
+        
+        images = []
+        for image in ctx.images:
+            image_def = {'name': image.name, 'mimeType': image.mime_type, 'path': image.src_file_path}
+            if image.generated or embed_images:
+                # generated images only exist on this machine
+                image.write_qimage()
+                with open(image.src_file_path, 'rb') as infile:
+                    arrays['image{}'.format(image.index)] = numpy.frombuffer(infile.read(), dtype=numpy.uint8)
+                if image.generated:
+                    os.remove(image.src_file_path)
+                image_def['path'] = None
+            images.append(image_def)
+        
+        def index(item):
+            return item.index if item is not None else None
+        scene = {'version': cls.version,
+                    'options': ctx.settings.options(),
+                    'extensionsUsed': list(ctx.extensions_used),
+                    'extensionsRequired': list(ctx.extensions_required),
+                    'scenes': [{'name': scene.name, 'json': scene.to_json()} for scene in ctx.scenes],
+                    'nodes': [{'name': node.name, 'json': node.to_json()} for node in ctx.nodes],
+                    'meshes': [{'name': mesh.name, 'json': mesh.to_json(), 'skin': index(mesh.skin),
+                                'primitives': [{'indices': index(part.indices_accessor),
+                                                'normal': index(part.normal_accessor),
+                                                'tangent': index(part.tangent_accessor)}
+                                                for part in mesh.primitives]} for mesh in ctx.meshes],
+                    'skins': [{'name': skin.name, 'json': skin.to_json()} for skin in ctx.skins],
+                    'cameras': [camera.to_json() for camera in ctx.cameras],
+                    'materials': [material.to_json() for material in ctx.materials],
+                    'textures': [texture.to_json() for texture in ctx.textures],
+                    'images': images,
+                    'animations': [{'name': animation.name, 'json': animation.to_json(),
+                                    'channels': [{'name': channel.name, 'path': channel.path}
+                                                    for channel in animation.channels]}
+                                    for animation in ctx.animations],
+                    'accessors': accessors}
+        arrays['scene'] = numpy.frombuffer(json.dumps(scene).encode('utf-8'), dtype=numpy.uint8)
+        with open(path, 'wb') as outfile:
+            numpy.savez(outfile, **arrays)
+        ctx.profiler.count('snapshot_bytes', os.path.getsize(path))
+    
+    @classmethod
+    def read(cls, ctx, path):
+        if numpy is None:
+            raise RuntimeError("Snapshots require numpy.")
+        archive = numpy.load(path, allow_pickle=False)
+        scene = json.loads(archive['scene'].tobytes().decode('utf-8'))
+        if scene['version'] > cls.version:
+            raise RuntimeError("Snapshot {} is version {}, this exporter reads up to {}".format(
+                                path, scene['version'], cls.version))
+        ctx.extensions_used.extend(scene['extensionsUsed'])
+        ctx.extensions_required.extend(scene['extensionsRequired'])
+        # the atlas already ran, images are stored as they are read
+        ctx.defer_images = False
+        
+        for index, accessor_def in enumerate(scene['accessors']):
+            group = accessor_def['group']
+            buffer = ctx.buffer_for(group, accessor_def.get('tile')) if group is not None else None
+            if 'sparse' in accessor_def:
+                sparse = accessor_def['sparse']
+                indices = values = ()
+                if sparse['count']:
+                    indices = archive['accessor{}_indices'.format(index)]
+                    values = archive['accessor{}_values'.format(index)]
+                accessor = SparseAccessor(ctx, accessor_def['count'], indices, values, accessor_def['type'],
+                                            accessor_def['componentType'], sparse['indicesComponentType'],
+                                            buffer, name=accessor_def['name'])
+            else:
+                accessor = Accessor(ctx, archive['accessor{}'.format(index)], accessor_def['type'],
+                                    accessor_def['componentType'], accessor_def['target'], buffer,
+                                    name=accessor_def['name'])
+            accessor.normalized = accessor_def['normalized']
+            accessor.min_ = accessor_def['min']
+            accessor.max_ = accessor_def['max']
+        
+        settings = ctx.settings
+        # embedded images become files for Image to store, next to the output for
+        # source resources, otherwise in a directory that is removed afterwards
+        temp_dir = None
+        for index, image_def in enumerate(scene['images']):
+            file_path = image_def['path']
+            if file_path is None:
+                if settings.resource_format == ResourceFormats.SOURCE:
+                    file_path = os.path.join(settings.out_dir, image_def['name'])
+                else:
+                    temp_dir = temp_dir or tempfile.mkdtemp(prefix='glTFSnapshot')
+                    file_path = os.path.join(temp_dir, image_def['name'])
+                _release_output(file_path)
+                with open(file_path, 'wb') as outfile:
+                    outfile.write(archive['image{}'.format(index)].tobytes())
+                Image(ctx, file_path, generated=True)
+            elif not os.path.exists(file_path):
+                raise RuntimeError("Image {} of snapshot {} is not available, snapshot it with embed_images".format(
+                                    file_path, path))
+            else:
+                Image(ctx, file_path)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        
+        accessors = ctx.accessors
+        def accessor(index):
+            return accessors[index] if index is not None else None
+        for scene_def in scene['scenes']:
+            SnapshotItem(ctx, ctx.scenes, scene_def['name'], scene_def['json'])
+        for node_def in scene['nodes']:
+            SnapshotItem(ctx, ctx.nodes, node_def['name'], node_def['json'],
+                            rotation=node_def['json'].get('rotation'))
+        for skin_def in scene['skins']:
+            SnapshotItem(ctx, ctx.skins, skin_def['name'], skin_def['json'], joints=skin_def['json']['joints'],
+                            inverse_bind_accessor=accessors[skin_def['json']['inverseBindMatrices']])
+        for mesh_def in scene['meshes']:
+            # version 1 snapshots hold the accessors of the only primitive in the mesh
+            parts = []
+            for part_def in mesh_def.get('primitives', [mesh_def]):
+                SnapshotItem(ctx, parts, mesh_def['name'], None,
+                                indices_accessor=accessor(part_def['indices']),
+                                normal_accessor=accessor(part_def['normal']),
+                                tangent_accessor=accessor(part_def['tangent']))
+            SnapshotItem(ctx, ctx.meshes, mesh_def['name'], mesh_def['json'],
+                            skin=ctx.skins[mesh_def['skin']] if mesh_def['skin'] is not None else None,
+                            primitives=parts)
+        for key, registry in (('cameras', ctx.cameras), ('materials', ctx.materials),
+                                ('textures', ctx.textures)):
+            for item_def in scene[key]:
+                SnapshotItem(ctx, registry, None, item_def)
+        for animation_def in scene['animations']:
+            samplers = []
+            for sampler_def in animation_def['json']['samplers']:
+                SnapshotItem(ctx, samplers, None, sampler_def, interpolation=sampler_def['interpolation'],
+                                input_accessor=accessors[sampler_def['input']],
+                                output_accessor=accessors[sampler_def['output']])
+            channels = []
+            for channel, channel_def in zip(animation_def['channels'], animation_def['json']['channels']):
+                SnapshotItem(ctx, channels, channel['name'], channel_def, path=channel['path'],
+                                sampler=samplers[channel_def['sampler']])
+            SnapshotItem(ctx, ctx.animations, animation_def['name'], animation_def['json'],
+                            channels=channels, samplers=samplers)
+
+
+def main(argv=None):
+    '''Encodes a snapshot from the command line, on machines without Maya.'''
+    import argparse
+    parser = argparse.ArgumentParser(description="Encodes a snapshot written by export_snapshot() "
+                                                    "into a glTF or glb file.  Needs numpy, not Maya.")
+    parser.add_argument('snapshot')
+    parser.add_argument('output', help="the .gltf or .glb file to write")
+    parser.add_argument('-o', '--option', action='append', default=[], metavar='NAME=VALUE',
+                        help="export option, the value is read as JSON if it is valid JSON, "
+                                "e.g. -o meshopt=true -o resource_format=embedded")
+    args = parser.parse_args(argv)
+    options = {}
+    for option in args.option:
+        name, _, value = option.partition('=')
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        options[name] = value
+    encode_snapshot(args.snapshot, args.output, **options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+import base64
+import errno
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+import numpy
+import maya.cmds
+import maya.api.OpenMaya as om2
+
+GLB_MAGIC = 0x46546C67
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+
+COMPONENT_DTYPES = {
+    5120: numpy.dtype('i1'),
+    5121: numpy.dtype('u1'),
+    5122: numpy.dtype('<i2'),
+    5123: numpy.dtype('<u2'),
+    5125: numpy.dtype('<u4'),
+    5126: numpy.dtype('<f4'),
+}
+TYPE_COMPONENTS = {
+    'SCALAR': 1,
+    'VEC2': 2,
+    'VEC3': 3,
+    'VEC4': 4,
+    'MAT2': 4,
+    'MAT3': 9,
+    'MAT4': 16,
+}
+# Divisors for normalized integer accessors
+NORMALIZED_SCALE = {
+    5120: 127.0,
+    5121: 255.0,
+    5122: 32767.0,
+    5123: 65535.0,
+}
+
+
+class GLTFReader(object):
+    '''Parses a .gltf or .glb file and exposes its accessors as numpy arrays.
+
+    GLB files and external .bin buffers are memory-mapped, and accessors are
+    returned as views straight into the mapped data, honoring byteOffset and
+    byteStride.  Nothing is copied until a caller converts the data.
+    '''
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.document = None
+        self.buffers = []
+        self._files = []
+        self._maps = []
+        self._glb_bin = None
+        self._load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.buffers = []
+        self._glb_bin = None
+        for buffer_map in self._maps:
+            try:
+                buffer_map.close()
+            except BufferError:
+                # A caller still holds a view, the map is closed once it is released
+                pass
+        for file_obj in self._files:
+            file_obj.close()
+        self._maps = []
+        self._files = []
+
+    def _map_file(self, path):
+        file_obj = open(path, 'rb')
+        self._files.append(file_obj)
+        buffer_map = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(buffer_map)
+        return buffer_map
+
+    def _load(self):
+        base, ext = os.path.splitext(self.file_path)
+        if ext.lower() == '.glb':
+            self._load_glb()
+        else:
+            with open(self.file_path, 'rb') as infile:
+                self.document = json.loads(infile.read().decode('utf-8'))
+        gltf_dir = os.path.dirname(self.file_path)
+        for buffer_def in self.document.get('buffers', []):
+            uri = buffer_def.get('uri')
+            if uri is None and 'EXT_meshopt_compression' in buffer_def.get('extensions', {}):
+                # fallback of compressed bufferViews left empty
+                self.buffers.append(None)
+            elif uri is None:
+                if self._glb_bin is None:
+                    raise RuntimeError("Buffer without uri in a file with no GLB binary chunk.")
+                self.buffers.append(self._glb_bin)
+            elif uri.startswith('data:'):
+                self.buffers.append(base64.b64decode(uri.split(',', 1)[1]))
+            else:
+                self.buffers.append(memoryview(self._map_file(os.path.join(gltf_dir, unquote(uri)))))
+
+    def _load_glb(self):
+        buffer_map = self._map_file(self.file_path)
+        magic, version, length = struct.unpack_from('<III', buffer_map, 0)
+        if magic != GLB_MAGIC:
+            raise RuntimeError("Not a GLB file: {}".format(self.file_path))
+        if version != 2:
+            raise RuntimeError("Unsupported GLB version {}: {}".format(version, self.file_path))
+        offset = 12
+        while offset < length:
+            chunk_length, chunk_type = struct.unpack_from('<II', buffer_map, offset)
+            start = offset + 8
+            if chunk_type == GLB_JSON_CHUNK:
+                self.document = json.loads(buffer_map[start:start + chunk_length].decode('utf-8'))
+            elif chunk_type == GLB_BIN_CHUNK and self._glb_bin is None:
+                self._glb_bin = memoryview(buffer_map)[start:start + chunk_length]
+            offset = start + chunk_length
+        if self.document is None:
+            raise RuntimeError("GLB file has no JSON chunk: {}".format(self.file_path))
+
+    def buffer_view(self, index):
+        '''Returns the raw bytes of a bufferView as a memoryview.'''
+        view_def = self.document['bufferViews'][index]
+        if self.buffers[view_def['buffer']] is None:
+            raise RuntimeError("BufferView {} is EXT_meshopt_compression compressed without "
+                                "fallback data, which can't be imported.".format(index))
+        start = view_def.get('byteOffset', 0)
+        return memoryview(self.buffers[view_def['buffer']])[start:start + view_def['byteLength']]
+
+    def accessor(self, index):
+        '''Returns accessor data as a (count, components) array of its stored type.
+
+        Accessors without sparse data are zero-copy, read-only views.
+        '''
+        accessor_def = self.document['accessors'][index]
+        dtype = COMPONENT_DTYPES[accessor_def['componentType']]
+        components = TYPE_COMPONENTS[accessor_def['type']]
+        count = accessor_def['count']
+        if 'bufferView' in accessor_def:
+            view_def = self.document['bufferViews'][accessor_def['bufferView']]
+            buffer = self.buffers[view_def['buffer']]
+            offset = view_def.get('byteOffset', 0) + accessor_def.get('byteOffset', 0)
+            stride = view_def.get('byteStride') or dtype.itemsize * components
+            data = numpy.ndarray((count, components), dtype=dtype, buffer=buffer,
+                                    offset=offset, strides=(stride, dtype.itemsize))
+        else:
+            data = numpy.zeros((count, components), dtype=dtype)
+        sparse = accessor_def.get('sparse')
+        if sparse:
+            data = data.copy()
+            indices_def = sparse['indices']
+            indices_view = self.buffer_view(indices_def['bufferView'])
+            indices = numpy.frombuffer(indices_view, dtype=COMPONENT_DTYPES[indices_def['componentType']],
+                                        count=sparse['count'], offset=indices_def.get('byteOffset', 0))
+            values_def = sparse['values']
+            values_view = self.buffer_view(values_def['bufferView'])
+            values = numpy.frombuffer(values_view, dtype=dtype, count=sparse['count'] * components,
+                                        offset=values_def.get('byteOffset', 0))
+            data[indices] = values.reshape(-1, components)
+        return data
+
+    def accessor_float(self, index):
+        '''Returns accessor data as float32, resolving normalized integer types.
+        Float accessors are still returned as views.'''
+        accessor_def = self.document['accessors'][index]
+        data = self.accessor(index)
+        if data.dtype == numpy.float32:
+            return data
+        data = data.astype(numpy.float32)
+        if accessor_def.get('normalized'):
+            data /= NORMALIZED_SCALE[accessor_def['componentType']]
+            numpy.maximum(data, -1.0, out=data)
+        return data
+
+
+class GLTFImporter(object):
+    '''Builds the default scene of a glTF file in Maya.
+
+    Each mesh primitive becomes one mesh shape created with a single
+    MFnMesh.create call, with UVs, normals and colors assigned in bulk.
+    '''
+    def __init__(self, file_path, vflip=True):
+        self.file_path = file_path
+        self.vflip = vflip
+        self.reader = None
+        self.timings = {}
+        self._mesh_shapes = {}
+        self._shading_groups = {}
+        self._image_paths = {}
+        self.top_nodes = []
+
+    def run(self):
+        start = time.time()
+        with GLTFReader(self.file_path) as reader:
+            self.reader = reader
+            self.timings['parse'] = time.time() - start
+            document = reader.document
+            nodes = document.get('nodes', [])
+            if document.get('scenes'):
+                roots = document['scenes'][document.get('scene', 0)].get('nodes', [])
+            else:
+                children = set(child for node in nodes for child in node.get('children', []))
+                roots = [index for index in range(len(nodes)) if index not in children]
+            # images are written before any node is created, so a failure leaves no partial scene
+            self._resolve_images()
+            build_start = time.time()
+            for index in roots:
+                self.top_nodes.append(self._create_node(index, None))
+            self.timings['build'] = time.time() - build_start
+            self.reader = None
+        self.timings['total'] = time.time() - start
+        return self.top_nodes
+
+    def _create_node(self, index, parent):
+        node_def = self.reader.document['nodes'][index]
+        name = _maya_name(node_def.get('name'), 'node{}'.format(index))
+        if parent:
+            xform = maya.cmds.createNode('transform', name=name, parent=parent)
+            xform = maya.cmds.ls(xform, long=True)[0]
+        else:
+            xform = maya.cmds.ls(maya.cmds.createNode('transform', name=name), long=True)[0]
+        if 'matrix' in node_def:
+            maya.cmds.xform(xform, matrix=node_def['matrix'])
+        else:
+            if 'translation' in node_def:
+                maya.cmds.setAttr(xform + '.translate', *node_def['translation'])
+            if 'rotation' in node_def:
+                euler = om2.MQuaternion(*node_def['rotation']).asEulerRotation()
+                maya.cmds.setAttr(xform + '.rotate', *[math.degrees(angle) for angle in (euler.x, euler.y, euler.z)])
+            if 'scale' in node_def:
+                maya.cmds.setAttr(xform + '.scale', *node_def['scale'])
+        if 'mesh' in node_def:
+            self._create_mesh(node_def['mesh'], xform)
+        for child in node_def.get('children', []):
+            self._create_node(child, xform)
+        return xform
+
+    def _create_mesh(self, mesh_index, xform):
+        if mesh_index in self._mesh_shapes:
+            # glTF meshes shared between nodes become instanced shapes
+            for shape in self._mesh_shapes[mesh_index]:
+                maya.cmds.parent(shape, xform, add=True, shape=True)
+            return
+        mesh_def = self.reader.document['meshes'][mesh_index]
+        shapes = []
+        for primitive_index, primitive in enumerate(mesh_def['primitives']):
+            if primitive.get('mode', 4) != 4:
+                print("Skipping primitive {} of mesh {}: only triangles are supported.".format(
+                        primitive_index, mesh_index))
+                continue
+            shape = self._create_primitive(primitive, xform)
+            shapes.append(shape)
+            self._assign_material(shape, primitive.get('material'))
+        self._mesh_shapes[mesh_index] = shapes
+
+    def _create_primitive(self, primitive, xform):
+        reader = self.reader
+        attributes = primitive['attributes']
+        positions = reader.accessor_float(attributes['POSITION'])
+        if 'indices' in primitive:
+            indices = reader.accessor(primitive['indices']).ravel()
+        else:
+            indices = numpy.arange(len(positions), dtype=numpy.uint32)
+        triangle_count = len(indices) // 3
+        polygon_counts = [3] * triangle_count
+        polygon_connects = indices[:triangle_count * 3].astype(numpy.int32).tolist()
+
+        parent_obj = om2.MSelectionList().add(xform).getDependNode(0)
+        mesh_fn = om2.MFnMesh()
+        if 'TEXCOORD_0' in attributes:
+            uvs = reader.accessor_float(attributes['TEXCOORD_0'])
+            u_values = uvs[:, 0].tolist()
+            if self.vflip:
+                v_values = (1.0 - uvs[:, 1]).tolist()
+            else:
+                v_values = uvs[:, 1].tolist()
+            mesh_obj = mesh_fn.create(om2.MFloatPointArray(positions.tolist()), polygon_counts,
+                                        polygon_connects, u_values, v_values, parent_obj)
+            mesh_fn.assignUVs(polygon_counts, polygon_connects)
+        else:
+            mesh_obj = mesh_fn.create(om2.MFloatPointArray(positions.tolist()), polygon_counts,
+                                        polygon_connects, parent=parent_obj)
+        vertex_ids = list(range(len(positions)))
+        if 'NORMAL' in attributes:
+            normals = reader.accessor_float(attributes['NORMAL'])
+            mesh_fn.setVertexNormals(om2.MVectorArray(normals.tolist()), vertex_ids)
+        if 'COLOR_0' in attributes:
+            colors = reader.accessor_float(attributes['COLOR_0'])
+            if colors.shape[1] == 3:
+                colors = numpy.hstack([colors, numpy.ones((len(colors), 1), numpy.float32)])
+            mesh_fn.setVertexColors(om2.MColorArray(colors.tolist()), vertex_ids)
+        return om2.MFnDagNode(mesh_obj).fullPathName()
+
+    def _assign_material(self, shape, material_index):
+        if material_index is None:
+            shading_group = 'initialShadingGroup'
+        elif material_index in self._shading_groups:
+            shading_group = self._shading_groups[material_index]
+        else:
+            shading_group = self._create_material(material_index)
+            self._shading_groups[material_index] = shading_group
+        maya.cmds.sets(shape, edit=True, forceElement=shading_group)
+
+    def _create_material(self, material_index):
+        material_def = self.reader.document['materials'][material_index]
+        name = _maya_name(material_def.get('name'), 'glTFMaterial{}'.format(material_index))
+        shader = maya.cmds.shadingNode('lambert', asShader=True, name=name)
+        shading_group = maya.cmds.sets(renderable=True, noSurfaceShader=True, empty=True, name=shader + 'SG')
+        maya.cmds.connectAttr(shader + '.outColor', shading_group + '.surfaceShader')
+        pbr = material_def.get('pbrMetallicRoughness', {})
+        color = pbr.get('baseColorFactor', [1.0, 1.0, 1.0, 1.0])
+        maya.cmds.setAttr(shader + '.color', *color[:3])
+        if len(color) == 4 and color[3] < 1:
+            transparency = 1 - color[3]
+            maya.cmds.setAttr(shader + '.transparency', transparency, transparency, transparency)
+        if 'baseColorTexture' in pbr:
+            image_path = self._image_path(pbr['baseColorTexture']['index'])
+            if image_path:
+                file_node = maya.cmds.shadingNode('file', asTexture=True)
+                maya.cmds.setAttr(file_node + '.fileTextureName', image_path, type='string')
+                maya.cmds.connectAttr(file_node + '.outColor', shader + '.color')
+        return shading_group
+
+    def _image_path(self, texture_index):
+        '''Returns a file path for the texture's image, see _resolve_images.'''
+        image_index = self.reader.document['textures'][texture_index].get('source')
+        return self._image_paths.get(image_index)
+
+    def _resolve_images(self):
+        '''Finds the file of every image.  Embedded and bufferView images are written
+        to the sourceimages folder of the Maya project under a name no existing file
+        has, or to a temporary folder when the project can't be written to.'''
+        document = self.reader.document
+        gltf_dir = os.path.dirname(self.file_path)
+        base = os.path.splitext(os.path.basename(self.file_path))[0]
+        image_dir = None
+        for image_index, image_def in enumerate(document.get('images', [])):
+            uri = image_def.get('uri')
+            if uri and not uri.startswith('data:'):
+                self._image_paths[image_index] = os.path.join(gltf_dir, unquote(uri))
+                continue
+            if uri:
+                mime_type = uri[5:].split(';', 1)[0]
+                data = base64.b64decode(uri.split(',', 1)[1])
+            else:
+                mime_type = image_def.get('mimeType', 'image/png')
+                data = self.reader.buffer_view(image_def['bufferView'])
+            ext = {'image/jpeg': '.jpg'}.get(mime_type, '.' + mime_type.split('/')[-1])
+            if image_dir is None:
+                image_dir = self._image_dir()
+            self._image_paths[image_index] = self._write_image(
+                image_dir, '{}_image{}{}'.format(base, image_index, ext), data)
+
+    @staticmethod
+    def _image_dir():
+        '''The sourceimages folder of the Maya project, or a new temporary folder.'''
+        root = maya.cmds.workspace(query=True, rootDirectory=True)
+        if root:
+            rule = maya.cmds.workspace(fileRuleEntry='sourceImages') or 'sourceimages'
+            image_dir = os.path.join(root, rule)
+            try:
+                if not os.path.isdir(image_dir):
+                    os.makedirs(image_dir)
+            except OSError:
+                pass
+            if os.path.isdir(image_dir) and os.access(image_dir, os.W_OK):
+                return image_dir
+        return tempfile.mkdtemp(prefix='glTFImport')
+
+    @staticmethod
+    def _write_image(image_dir, name, data):
+        '''Writes data to a new file in image_dir, numbering the name until no file has it.'''
+        stem, ext = os.path.splitext(name)
+        number = 0
+        while True:
+            path = os.path.join(image_dir, '{}_{}{}'.format(stem, number, ext) if number else name)
+            try:
+                handle = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+                number += 1
+                continue
+            with os.fdopen(handle, 'wb') as outfile:
+                outfile.write(data)
+            return path
+
+
+def _maya_name(name, default):
+    '''Makes a glTF name usable as a Maya node name.'''
+    if not name:
+        return default
+    name = ''.join(char if char.isalnum() or char == '_' else '_' for char in name)
+    if name[0].isdigit():
+        name = '_' + name
+    return name
+
+
+def import_file(file_path, vflip=True):
+    return GLTFImporter(file_path, vflip).run()